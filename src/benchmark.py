@@ -0,0 +1,283 @@
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+import os
+from datetime import datetime
+
+import inventory_service
+import storage
+from inventory_service import InventoryService
+
+DEFAULT_MIX = "add_stock=40,remove_stock=35,get_all_products=5,get_low_stock_products=10,authenticate_user=8,add_product=2"
+
+BENCH_USER = ("bench", "benchpass")
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Operação desconhecida: {name}")
+        mix[name] = float(weight)
+    return mix
+
+def reset_database(db_config):
+    if db_config['backend'] == 'sqlite':
+        # Banco embarcado: apaga o arquivo (e o WAL); em memória já começa vazio.
+        if db_config['path'] == storage.SQLITE_CONFIG['path']:
+            raise SystemExit("O benchmark apaga o banco; use um arquivo dedicado (--sqlite-path).")
+        if db_config['path'] != ':memory:':
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(db_config['path'] + suffix):
+                    os.remove(db_config['path'] + suffix)
+        return
+
+    if db_config['database'] == inventory_service.DB_CONFIG['database']:
+        raise SystemExit("O benchmark apaga as tabelas; use um banco dedicado (--database).")
+
+    import mysql.connector
+    server_config = {k: v for k, v in db_config.items() if k not in ('backend', 'database')}
+    conn = mysql.connector.connect(**server_config)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{db_config['database']}`")
+        cursor.execute(f"USE `{db_config['database']}`")
+        cursor.execute("SHOW TABLES LIKE 'stock\\_movements\\_%'")
+        archives = [row[0] for row in cursor.fetchall()]
+        for table in archives + [
+            "stock_movement_archived_client_ids", "stock_reconciliation", "stock_movement_checkpoints",
+            "stock_movement_archives", "stock_movement_daily",
+            "stock_movements", "products", "users", "schema_version"
+        ]:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    finally:
+        cursor.close()
+        conn.close()
+
+def insert_products(service, rows):
+    conn = service.pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.executemany("INSERT INTO products (name, description, min_quantity) VALUES (%s, %s, %s)", rows)
+        conn.commit()
+    finally:
+        cursor.close()
+        service.pool.release(conn)
+
+def seed_catalog(service, catalog_size, rng):
+    rows = [
+        (f"bench-{i:07d}", f"Produto de carga {i}", rng.randint(0, 20))
+        for i in range(catalog_size)
+    ]
+    for start in range(0, len(rows), inventory_service.MOVEMENT_BATCH_SIZE):
+        insert_products(service, rows[start:start + inventory_service.MOVEMENT_BATCH_SIZE])
+
+    product_ids = [row['id'] for row in service.get_all_products()]
+    service.apply_movements_batch((pid, 'entrada', rng.randint(0, 200)) for pid in product_ids if rng.random() < 0.9)
+    service.register_user(BENCH_USER[0], BENCH_USER[1], 'comum')
+    return product_ids
+
+# Cada operação devolve True quando o serviço aceitou o pedido e False quando o recusou
+# por regra de negócio (ex.: estoque insuficiente); exceções contam como erro.
+def op_add_stock(service, clerk):
+    return service.add_stock(clerk.pick_product(), clerk.rng.randint(1, 20))[0]
+
+def op_remove_stock(service, clerk):
+    return service.remove_stock(clerk.pick_product(), clerk.rng.randint(1, 20))[0]
+
+def op_get_all_products(service, clerk):
+    return service.get_all_products() is not None
+
+def op_get_low_stock_products(service, clerk):
+    return service.get_low_stock_products() is not None
+
+def op_authenticate_user(service, clerk):
+    return service.authenticate_user(*BENCH_USER)[0] is not None
+
+def op_add_product(service, clerk):
+    clerk.created += 1
+    return service.add_product(f"bench-{clerk.index}-{clerk.created}-{clerk.rng.random():.8f}", "", clerk.rng.randint(0, 20))[0]
+
+OPERATIONS = {
+    'add_stock': op_add_stock,
+    'remove_stock': op_remove_stock,
+    'get_all_products': op_get_all_products,
+    'get_low_stock_products': op_get_low_stock_products,
+    'authenticate_user': op_authenticate_user,
+    'add_product': op_add_product
+}
+
+class Clerk:
+    def __init__(self, index, product_ids, mix, seed):
+        self.index = index
+        self.product_ids = product_ids
+        self.rng = random.Random(seed * 1000 + index)
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.created = 0
+        self.samples = {name: [] for name in self.names}
+        self.rejected = dict.fromkeys(self.names, 0)
+        self.errors = dict.fromkeys(self.names, 0)
+
+    def pick_product(self):
+        # Distribuição enviesada: alguns produtos concentram as movimentações, como no balcão.
+        return self.product_ids[min(int(self.rng.paretovariate(1.2)) - 1, len(self.product_ids) - 1)]
+
+    def run(self, service, operations):
+        for _ in range(operations):
+            name = self.rng.choices(self.names, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                accepted = OPERATIONS[name](service, self)
+            except Exception:
+                self.errors[name] += 1
+                continue
+            self.samples[name].append(time.perf_counter() - start)
+            if not accepted:
+                self.rejected[name] += 1
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+def check_ledger(service):
+    # A mesma conferência do comando reconcile, no catálogo inteiro: se o arquivamento
+    # ou os pontos de controle mudarem, o benchmark confere a regra nova.
+    return [
+        {key: row[key] for key in ('product_id', 'current_quantity', 'ledger_balance')}
+        for row in service.reconcile_stock(full=True)['drift']
+    ]
+
+def summarize(clerks, elapsed):
+    operations = {}
+    for name in OPERATIONS:
+        samples = sorted(sample for clerk in clerks for sample in clerk.samples.get(name, []))
+        errors = sum(clerk.errors.get(name, 0) for clerk in clerks)
+        if not samples and not errors:
+            continue
+        operations[name] = {
+            'count': len(samples),
+            'rejected': sum(clerk.rejected.get(name, 0) for clerk in clerks),
+            'errors': errors,
+            'throughput': len(samples) / elapsed if elapsed else 0.0,
+            'p50': percentile(samples, 0.50),
+            'p95': percentile(samples, 0.95),
+            'p99': percentile(samples, 0.99),
+            'mean': sum(samples) / len(samples) if samples else None
+        }
+    total = sum(op['count'] for op in operations.values())
+    return {'throughput': total / elapsed if elapsed else 0.0, 'operations': operations}
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    if results['throughput'] < baseline['throughput'] * (1 - tolerance):
+        regressions.append(f"vazão total {results['throughput']:.1f}/s < {baseline['throughput']:.1f}/s")
+    for name, current in results['operations'].items():
+        previous = baseline['operations'].get(name)
+        if not previous or previous.get('p95') is None or current['p95'] is None:
+            continue
+        if current['p95'] > previous['p95'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95'] * 1000:.2f} ms > {previous['p95'] * 1000:.2f} ms")
+    return regressions
+
+def print_report(results):
+    print(f"Vazão total: {results['throughput']:.1f} op/s em {results['elapsed']:.2f}s")
+    print(f"{'operação':<24}{'qtd':>8}{'recus.':>8}{'erros':>7}{'op/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, op in results['operations'].items():
+        ms = lambda value: f"{value * 1000:.2f}" if value is not None else "-"
+        print(
+            f"{name:<24}{op['count']:>8}{op['rejected']:>8}{op['errors']:>7}{op['throughput']:>10.1f}"
+            f"{ms(op['p50']):>10}{ms(op['p95']):>10}{ms(op['p99']):>10}"
+        )
+    print(f"Pool: {results['pool']}")
+    print(f"Cache: {results['product_cache']}")
+    if results['ledger_consistent']:
+        print("Estoque consistente com o histórico de movimentações.")
+    else:
+        print(f"INCONSISTÊNCIA: {len(results['mismatches'])} produtos divergem do histórico.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de carga da camada de dados do BioSync.")
+    parser.add_argument("--clerks", type=int, default=8, help="atendentes simulados concorrentes")
+    parser.add_argument("--operations", type=int, default=500, help="operações por atendente")
+    parser.add_argument("--catalog-size", type=int, default=1000)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"pesos por operação (padrão: {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--backend", choices=list(storage.BACKENDS), default=inventory_service.DB_CONFIG['backend'])
+    parser.add_argument("--sqlite-path", default=":memory:", help="arquivo do banco embarcado (padrão: em memória)")
+    parser.add_argument("--host", default=inventory_service.DB_CONFIG['host'])
+    parser.add_argument("--user", default=inventory_service.DB_CONFIG['user'])
+    parser.add_argument("--password", default=inventory_service.DB_CONFIG['password'])
+    parser.add_argument("--database", default=f"{inventory_service.DB_CONFIG['database']}_bench")
+    parser.add_argument("--pool-size", type=int, default=None, help="padrão: igual a --clerks")
+    parser.add_argument("--output", help="arquivo JSON com os resultados")
+    parser.add_argument("--baseline", help="JSON de uma execução anterior para detectar regressões")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="piora relativa tolerada frente ao baseline")
+    args = parser.parse_args(argv)
+
+    if args.backend == 'sqlite':
+        db_config = {'backend': 'sqlite', 'path': args.sqlite_path}
+    else:
+        db_config = {'backend': 'mysql', 'host': args.host, 'user': args.user, 'password': args.password, 'database': args.database}
+    inventory_service.POOL_CONFIG['pool_size'] = args.pool_size or args.clerks
+
+    rng = random.Random(args.seed)
+    reset_database(db_config)
+    service = InventoryService(db_config)
+    service.init_db()
+    print(f"Criando catálogo com {args.catalog_size} produtos...")
+    product_ids = seed_catalog(service, args.catalog_size, rng)
+
+    clerks = [Clerk(i, product_ids, args.mix, args.seed) for i in range(args.clerks)]
+    threads = [threading.Thread(target=clerk.run, args=(service, args.operations)) for clerk in clerks]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    mismatches = check_ledger(service)
+    results = summarize(clerks, elapsed)
+    results.update({
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'elapsed': elapsed,
+        'config': {
+            'clerks': args.clerks,
+            'operations': args.operations,
+            'catalog_size': args.catalog_size,
+            'mix': args.mix,
+            'seed': args.seed,
+            'backend': args.backend,
+            'pool_size': service.pool.pool_size
+        },
+        'pool': service.pool.stats(),
+        'product_cache': service.product_cache.stats(),
+        'ledger_consistent': not mismatches,
+        'mismatches': mismatches[:100]
+    })
+    service.close()
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2, ensure_ascii=False)
+
+    failed = bool(mismatches)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSÃO: {regression}")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,256 +1,266 @@
+import time
+
+STARTUP_CLOCK = time.perf_counter()
+
 import tkinter as tk
-from tkinter import messagebox, ttk
-import mysql.connector
-from mysql.connector import Error
-from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
-import os
-
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'your_mysql_user',
-    'password': 'your_mysql_password',
-    'database': 'estoque_biosync'
+from tkinter import filedialog, messagebox, ttk
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, timedelta
+import argparse
+import logging
+import queue
+import sys
+import threading
+
+# inventory_service (e, com o backend MySQL, o mysql.connector) é carregado em segundo plano
+# enquanto a tela de login já está visível; veja _load_service.
+inventory_service = None
+
+logger = logging.getLogger("biosync")
+
+UI_POLL_INTERVAL_MS = 16
+PRODUCT_WINDOW_PAGES = 3
+
+# Períodos do histórico: (dias para trás, agrupamento dos totais).
+HISTORY_PERIODS = {
+    "Últimos 30 dias": (30, 'day'),
+    "Últimos 90 dias": (90, 'week'),
+    "Últimos 12 meses": (365, 'month')
 }
+HISTORY_CHART_HEIGHT = 140
+
+# Meta de tempo até a janela de login aparecer, conferida por --profile-startup.
+STARTUP_TARGET_MS = 500
+
+# Sem banco na partida, o app continua aberto e tenta de novo neste intervalo.
+SERVICE_RETRY_MS = 5000
+
+class StartupProfile:
+    # Marcas de tempo da partida, contadas a partir da importação deste módulo.
+    def __init__(self, target_ms=STARTUP_TARGET_MS):
+        self.target_ms = target_ms
+        self.within_target = False
+        self.marks = []
+        self._lock = threading.Lock()
+
+    def mark(self, label):
+        with self._lock:
+            self.marks.append((label, (time.perf_counter() - STARTUP_CLOCK) * 1000))
+
+    def elapsed(self, label):
+        with self._lock:
+            return next((ms for name, ms in self.marks if name == label), None)
+
+    def report(self):
+        print(f"{'etapa':<48}{'passo ms':>10}{'total ms':>10}")
+        previous = 0.0
+        for label, ms in sorted(self.marks, key=lambda mark: mark[1]):
+            print(f"{label:<48}{ms - previous:>10.1f}{ms:>10.1f}")
+            previous = ms
+        login_ms = self.elapsed("janela de login visível")
+        if login_ms is None or login_ms > self.target_ms:
+            print(f"ACIMA DA META: janela de login em {login_ms or 0:.1f} ms (meta {self.target_ms} ms).")
+            return False
+        print(f"Janela de login em {login_ms:.1f} ms (meta {self.target_ms} ms).")
+        return True
 
 class ControleEstoqueApp:
-    def __init__(self, master):
+    def __init__(self, master, profile=None):
         self.master = master
         master.title("BioSync - Controle de Estoque")
         master.geometry("800x600")
 
-        self.conn = None
-        self._init_db()
+        self.profile = profile
+        self.service = None
+        self.executor = None
+        self.journal = None
+        self.replayer = None
+        self._sync_generation = 0
+        self._sync_offline = False
+        self._sync_marks = None
+        # Todo acesso ao banco feito pela interface roda nestas threads; os resultados
+        # voltam ao mainloop pela fila _ui_results, drenada com after().
+        self._ui_results = queue.Queue()
+        # Avisos de threads que não são tarefas (ex.: o envio do diário): (função, argumentos).
+        self._ui_events = queue.Queue()
+        self._task_generations = {}
+        self._task_futures = {}
+        self._busy_tasks = 0
+        self.busy_bar = None
 
         self.current_user_id = None
         self.current_user_role = None
         self.create_login_ui()
-
-    def _get_db_connection(self):
+        if profile:
+            profile.mark("tela de login montada")
+            self.login_frame.bind('<Map>', lambda event: self._on_login_visible(), add='+')
+        self.master.after(UI_POLL_INTERVAL_MS, self._drain_ui_results)
+        self._start_service()
+
+    def _start_service(self):
+        # O login é desenhado antes: importar o driver, abrir a primeira conexão e
+        # conferir a versão do esquema acontecem nesta thread, fora do mainloop.
+        future = Future()
+        self._set_busy(1)
+        future.add_done_callback(lambda f: self._ui_results.put((None, None, f, self._on_service_ready, self._on_service_error)))
+
+        def run():
+            try:
+                future.set_result(self._load_service())
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name="biosync-startup", daemon=True).start()
+
+    def _load_service(self):
+        global inventory_service
+        import inventory_service
+        self._mark_startup("import de inventory_service")
+        service = inventory_service.InventoryService(inventory_service.DB_CONFIG)
         try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            if conn.is_connected():
-                return conn
-            else:
-                messagebox.showerror("Erro de Conexão", "Não foi possível conectar ao banco de dados MySQL.")
-                self.master.destroy()
-                return None
-        except Error as e:
-            messagebox.showerror("Erro de Conexão", f"Erro ao conectar ao MySQL: {e}")
+            migrations = service.init_db()
+        except Exception:
+            service.close()
+            raise
+        self._mark_startup("conexão e versão do esquema" + (f" (migrações {migrations})" if migrations else ""))
+        return service
+
+    def _mark_startup(self, label):
+        if self.profile:
+            self.profile.mark(label)
+
+    def _on_service_ready(self, service):
+        self.service = service
+        self.executor = ThreadPoolExecutor(max_workers=inventory_service.POOL_CONFIG['pool_size'], thread_name_prefix="biosync-db")
+        if self.login_button.winfo_exists():
+            self.login_button.config(state='normal')
+            self.login_status_label.config(text="")
+        self._start_journal()
+        self._finish_profile()
+
+    def _on_service_error(self, error):
+        if self.profile:
+            messagebox.showerror("Erro no DB", str(error))
             self.master.destroy()
-            return None
-
-    def _init_db(self):
-        conn = self._get_db_connection()
-        if not conn:
             return
-
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    username VARCHAR(255) NOT NULL UNIQUE,
-                    password VARCHAR(255) NOT NULL,
-                    role VARCHAR(50) NOT NULL CHECK(role IN ('admin', 'comum'))
-                );
-            ''')
-
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS products (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    name VARCHAR(255) NOT NULL UNIQUE,
-                    description TEXT,
-                    current_quantity INT NOT NULL DEFAULT 0 CHECK(current_quantity >= 0),
-                    min_quantity INT NOT NULL DEFAULT 0 CHECK(min_quantity >= 0)
-                );
-            ''')
-
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS stock_movements (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    product_id INT NOT NULL,
-                    type VARCHAR(50) NOT NULL CHECK(type IN ('entrada', 'saida')),
-                    quantity INT NOT NULL CHECK(quantity > 0),
-                    movement_date DATETIME NOT NULL,
-                    FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
-                );
-            ''')
-
-            cursor.execute("SELECT COUNT(*) FROM users WHERE role = 'admin'")
-            if cursor.fetchone()[0] == 0:
-                admin_username = "admin"
-                admin_password = "adminpass"
-                hashed_password = generate_password_hash(admin_password)
-
-                cursor.execute(
-                    "INSERT INTO users (username, password, role) VALUES (%s, %s, %s)",
-                    (admin_username, hashed_password, 'admin')
-                )
-                conn.commit()
-                print("Usuário administrador padrão criado (admin/adminpass).")
-            else:
-                print("Usuário administrador já existe.")
-
-        except Error as e:
-            print(f"Erro ao inicializar o banco de dados ou garantir usuário admin: {e}")
-            messagebox.showerror("Erro no DB", f"Não foi possível inicializar o banco de dados: {e}")
-            self.master.destroy()
-        finally:
-            if cursor:
-                cursor.close()
-            if conn and conn.is_connected():
-                conn.close()
-
-    def _execute_query(self, query, params=(), fetch_one=False):
-        conn = self._get_db_connection()
-        if not conn:
-            return None
-
-        cursor = conn.cursor(dictionary=True, buffered=True)
-        results = None
-        try:
-            cursor.execute(query, params)
-            conn.commit()
-
-            if query.strip().lower().startswith('select'):
-                results = cursor.fetchone() if fetch_one else cursor.fetchall()
-        except Error as e:
-            if "Duplicate entry" in str(e) and ("for key 'username'" in str(e) or "for key 'name'" in str(e)):
-                 raise ValueError(f"Erro de integridade: Nome já existe ou duplicado.")
-            else:
-                raise Exception(f"Erro ao executar query: {e}")
-        finally:
-            if cursor:
-                cursor.close()
-            if conn and conn.is_connected():
-                conn.close()
-        return results
-
-    def _authenticate_user(self, username, password):
-        user = self._execute_query("SELECT id, username, password, role FROM users WHERE username = %s", (username,), fetch_one=True)
-        if user:
-            if check_password_hash(user['password'], password):
-                return user['id'], user['role']
-        return None, None
-
-    def _register_user(self, username, password, role):
-        if not username or not password:
-            return False, "Nome de usuário e senha são obrigatórios."
-
-        hashed_password = generate_password_hash(password)
-        try:
-            self._execute_query(
-                "INSERT INTO users (username, password, role) VALUES (%s, %s, %s)",
-                (username, hashed_password, role)
+        # A sessão não é encerrada: o login avisa e a conexão é tentada de novo.
+        if self.login_status_label.winfo_exists():
+            self.login_status_label.config(
+                text=f"Banco de dados indisponível: {error}\nNova tentativa em {SERVICE_RETRY_MS // 1000} s..."
             )
-            return True, "Usuário registrado com sucesso."
-        except ValueError as e:
-            return False, str(e)
-        except Exception as e:
-            return False, f"Erro inesperado: {e}"
-
-    def _add_product(self, name, description, min_quantity):
-        if not name:
-            return False, "Nome do produto é obrigatório."
-        try:
-            min_quantity = int(min_quantity)
-            if min_quantity < 0:
-                return False, "Quantidade mínima não pode ser negativa."
-        except ValueError:
-            return False, "Quantidade mínima deve ser um número inteiro."
-
-        try:
-            self._execute_query(
-                "INSERT INTO products (name, description, min_quantity) VALUES (%s, %s, %s)",
-                (name, description, min_quantity)
-            )
-            return True, "Produto adicionado com sucesso."
-        except ValueError as e:
-            return False, str(e)
-        except Exception as e:
-            return False, f"Erro inesperado: {e}"
-
-    def _get_all_products(self):
-        return self._execute_query("SELECT id, name, description, current_quantity, min_quantity FROM products")
-
-    def _update_product(self, product_id, name, description, min_quantity):
-        if not name:
-            return False, "Nome do produto é obrigatório."
-        try:
-            min_quantity = int(min_quantity)
-            if min_quantity < 0:
-                return False, "Quantidade mínima não pode ser negativa."
-        except ValueError:
-            return False, "Quantidade mínima deve ser um número inteiro."
-
-        try:
-            self._execute_query(
-                "UPDATE products SET name = %s, description = %s, min_quantity = %s WHERE id = %s",
-                (name, description, min_quantity, product_id)
-            )
-            return True, "Produto atualizado com sucesso."
-        except ValueError as e:
-            return False, str(e)
-        except Exception as e:
-            return False, f"Erro inesperado: {e}"
-
-    def _add_stock(self, product_id, quantity):
-        try:
-            quantity = int(quantity)
-            if quantity <= 0:
-                return False, "Quantidade de entrada deve ser um número inteiro positivo."
-        except ValueError:
-            return False, "Quantidade deve ser um número inteiro."
-
-        try:
-            product = self._execute_query("SELECT current_quantity FROM products WHERE id = %s", (product_id,), fetch_one=True)
-            if not product:
-                return False, "Produto não encontrado."
-
-            current_quantity = product['current_quantity']
-            new_quantity = current_quantity + quantity
-
-            self._execute_query("UPDATE products SET current_quantity = %s WHERE id = %s", (new_quantity, product_id))
-            self._execute_query(
-                "INSERT INTO stock_movements (product_id, type, quantity, movement_date) VALUES (%s, %s, %s, %s)",
-                (product_id, 'entrada', quantity, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-            )
-            return True, "Entrada de estoque registrada com sucesso."
-        except Exception as e:
-            return False, f"Erro ao adicionar estoque: {e}"
-
-    def _remove_stock(self, product_id, quantity):
-        try:
-            quantity = int(quantity)
-            if quantity <= 0:
-                return False, "Quantidade de saída deve ser um número inteiro positivo."
-        except ValueError:
-            return False, "Quantidade deve ser um número inteiro."
-
+        self.master.after(SERVICE_RETRY_MS, self._start_service)
+
+    def _start_journal(self):
+        # Movimentações do balcão vão para o diário local e são enviadas ao MySQL por
+        # uma thread própria; sobras de uma execução anterior seguem no primeiro envio.
+        from movement_journal import JournalReplayer, MovementJournal
+        self.journal = MovementJournal()
+        self.replayer = JournalReplayer(
+            self.journal, self.service,
+            on_flushed=lambda count, product_ids: self._post_to_ui(self._on_journal_flushed, count, product_ids),
+            on_conflicts=lambda conflicts: self._post_to_ui(self._on_journal_conflicts, conflicts),
+            on_offline=lambda error: self._post_to_ui(self._update_journal_status)
+        )
+        # Recusas antigas são mostradas antes do primeiro envio: lidas depois,
+        # incluiriam as desse envio, já avisadas por on_conflicts.
+        leftover = self.journal.conflicts()
+        if leftover:
+            self._on_journal_conflicts(leftover)
+        self.replayer.start()
+
+    def _post_to_ui(self, callback, *args):
+        self._ui_events.put((callback, args))
+
+    def _on_login_visible(self):
+        if self.profile and self.profile.elapsed("janela de login visível") is None:
+            self.profile.mark("janela de login visível")
+            self._finish_profile()
+
+    def _finish_profile(self):
+        # No modo de medição o app fecha assim que a janela e o serviço estão prontos.
+        if not self.profile or self.service is None or self.profile.elapsed("janela de login visível") is None:
+            return
+        self.profile.within_target = self.profile.report()
+        self.master.destroy()
+
+    def _run_in_background(self, func, *args, on_success=None, on_error=None, key=None):
+        generation = None
+        if key is not None:
+            # Uma nova tarefa com a mesma chave substitui a anterior: se ainda não
+            # começou é cancelada, e se já terminou o resultado é descartado.
+            generation = self._task_generations.get(key, 0) + 1
+            self._task_generations[key] = generation
+            previous = self._task_futures.get(key)
+            if previous is not None:
+                previous.cancel()
+
+        self._set_busy(1)
+        future = self.executor.submit(func, *args)
+        if key is not None:
+            self._task_futures[key] = future
+        future.add_done_callback(lambda f: self._ui_results.put((key, generation, f, on_success, on_error)))
+        return future
+
+    def _drain_ui_results(self):
+        # O reagendamento fica no finally: um callback com erro não pode parar a
+        # entrega dos resultados pelo resto da sessão.
         try:
-            product = self._execute_query("SELECT current_quantity FROM products WHERE id = %s", (product_id,), fetch_one=True)
-            if not product:
-                return False, "Produto não encontrado."
-
-            current_quantity = product['current_quantity']
-            if current_quantity < quantity:
-                return False, "Quantidade insuficiente em estoque."
-
-            new_quantity = current_quantity - quantity
-
-            self._execute_query("UPDATE products SET current_quantity = %s WHERE id = %s", (new_quantity, product_id))
-            self._execute_query(
-                "INSERT INTO stock_movements (product_id, type, quantity, movement_date) VALUES (%s, %s, %s, %s)",
-                (product_id, 'saida', quantity, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-            )
-            return True, "Saída de estoque registrada com sucesso."
-        except Exception as e:
-            return False, f"Erro ao remover estoque: {e}"
-
-    def _get_low_stock_products(self):
-        return self._execute_query("SELECT id, name, current_quantity, min_quantity FROM products WHERE current_quantity <= min_quantity AND min_quantity > 0")
+            while True:
+                try:
+                    key, generation, future, on_success, on_error = self._ui_results.get_nowait()
+                except queue.Empty:
+                    break
+
+                self._set_busy(-1)
+                if key is not None:
+                    if self._task_futures.get(key) is future:
+                        del self._task_futures[key]
+                    if self._task_generations.get(key) != generation:
+                        continue
+                if future.cancelled():
+                    continue
+
+                try:
+                    error = future.exception()
+                    if error is not None:
+                        if on_error:
+                            on_error(error)
+                        else:
+                            messagebox.showerror("Erro", str(error))
+                    elif on_success:
+                        on_success(future.result())
+                except tk.TclError:
+                    pass # a tela que pediu o resultado já foi destruída (ex.: logout)
+                except Exception:
+                    logger.exception("Erro ao tratar o resultado de uma tarefa em segundo plano")
+
+            while True:
+                try:
+                    callback, args = self._ui_events.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    callback(*args)
+                except tk.TclError:
+                    pass
+                except Exception:
+                    logger.exception("Erro ao tratar um evento em segundo plano")
+        finally:
+            self.master.after(UI_POLL_INTERVAL_MS, self._drain_ui_results)
+
+    def _set_busy(self, delta):
+        self._busy_tasks += delta
+        if self.busy_bar is None or not self.busy_bar.winfo_exists():
+            self.busy_bar = ttk.Progressbar(self.master, mode='indeterminate', length=120)
+        if self._busy_tasks > 0:
+            if not self.busy_bar.winfo_ismapped():
+                self.busy_bar.place(relx=0.98, rely=0.98, anchor='se')
+                self.busy_bar.start(15)
+            self.master.config(cursor="watch")
+        else:
+            self.busy_bar.stop()
+            self.busy_bar.place_forget()
+            self.master.config(cursor="")
 
     def create_login_ui(self):
         for widget in self.master.winfo_children():
@@ -269,7 +279,11 @@ class ControleEstoqueApp:
         self.password_entry = ttk.Entry(self.login_frame, width=30, show="*")
         self.password_entry.pack(pady=5)
 
-        ttk.Button(self.login_frame, text="Entrar", command=self.perform_login).pack(pady=10)
+        ready = self.service is not None
+        self.login_button = ttk.Button(self.login_frame, text="Entrar", command=self.perform_login, state='normal' if ready else 'disabled')
+        self.login_button.pack(pady=10)
+        self.login_status_label = ttk.Label(self.login_frame, text="" if ready else "Conectando ao banco de dados...")
+        self.login_status_label.pack(pady=5)
 
         ttk.Label(self.login_frame, text="Admin Padrão: admin / adminpass").pack(pady=5)
 
@@ -277,8 +291,13 @@ class ControleEstoqueApp:
         username = self.username_entry.get()
         password = self.password_entry.get()
 
-        user_id, user_role = self._authenticate_user(username, password)
+        self._run_in_background(
+            self.service.authenticate_user, username, password,
+            on_success=lambda result: self._on_login_result(username, *result),
+            key='login'
+        )
 
+    def _on_login_result(self, username, user_id, user_role):
         if user_id and user_role:
             self.current_user_id = user_id
             self.current_user_role = user_role
@@ -302,6 +321,15 @@ class ControleEstoqueApp:
         self.notebook.add(stock_tab, text="Movimentar Estoque")
         self.create_stock_tab_content(stock_tab)
 
+        history_tab = ttk.Frame(self.notebook, padding="10")
+        self.notebook.add(history_tab, text="Histórico")
+        self.create_history_tab_content(history_tab)
+
+        self.forecast_tab = ttk.Frame(self.notebook, padding="10")
+        self.notebook.add(self.forecast_tab, text="Previsão")
+        self.create_forecast_tab_content(self.forecast_tab)
+        self.notebook.bind("<<NotebookTabChanged>>", self._on_tab_changed)
+
         if self.current_user_role == 'admin':
             user_management_tab = ttk.Frame(self.notebook, padding="10")
             self.notebook.add(user_management_tab, text="Gerenciar Usuários")
@@ -311,8 +339,90 @@ class ControleEstoqueApp:
         self.logout_button.place(relx=0.98, rely=0.02, anchor='ne')
 
         self.update_low_stock_display()
+        self._start_sync()
+
+    def _start_sync(self):
+        # Cada sessão tem sua geração; laços de sincronização de sessões anteriores param sozinhos.
+        self._sync_generation += 1
+        generation = self._sync_generation
+        self._run_in_background(
+            self.service.get_sync_marks,
+            on_success=lambda marks: self._on_sync_result(generation, marks=marks),
+            on_error=lambda error: self._on_sync_error(generation, error),
+            key='sync'
+        )
+
+    def _schedule_sync(self, generation):
+        self.master.after(inventory_service.SYNC_CONFIG['interval_ms'], lambda: self._poll_changes(generation))
+
+    def _poll_changes(self, generation):
+        if generation != self._sync_generation:
+            return
+        if self._sync_marks is None:
+            self._start_sync()
+            return
+        self._run_in_background(
+            self._fetch_changes, self._sync_marks,
+            on_success=lambda changes: self._on_sync_result(generation, changes=changes),
+            on_error=lambda error: self._on_sync_error(generation, error),
+            key='sync'
+        )
+
+    def _fetch_changes(self, marks):
+        # Roda na thread de fundo: o índice da busca acompanha o feed no mesmo ciclo,
+        # e a digitação não faz ida ao banco.
+        changes = self.service.fetch_changes(marks)
+        self.service.refresh_search_index()
+        return changes
+
+    def _on_sync_error(self, generation, error):
+        # Um aviso por queda, não um a cada ciclo enquanto o banco estiver fora.
+        if not self._sync_offline:
+            self._sync_offline = True
+            logger.warning("Sincronização suspensa: %s", error)
+        if generation == self._sync_generation:
+            self._schedule_sync(generation)
+
+    def _on_sync_result(self, generation, marks=None, changes=None):
+        if generation != self._sync_generation:
+            return
+        if self._sync_offline:
+            self._sync_offline = False
+            logger.warning("Sincronização retomada.")
+        if changes is not None:
+            self._apply_changes(changes)
+            marks = changes['marks']
+        self._sync_marks = marks
+        self._schedule_sync(generation)
+
+    def _apply_changes(self, changes):
+        needs_reload = False
+        for p in changes['products']:
+            self._patch_product_row(p)
+            self._set_low_stock_entry(p)
+            if str(p['id']) not in self._product_rows and self._product_in_window(p):
+                needs_reload = True
+        if needs_reload:
+            self.load_products_to_tree()
+
+    def _product_in_window(self, p):
+        if self._product_search:
+            return True # a busca local é barata; refaz para refletir nome/descrição novos
+        children = self.product_tree.get_children()
+        if not children:
+            return True
+        sort_key, descending = self._product_sort
+        value = p[sort_key]
+        first = self._product_sort_value(children[0])
+        last = self._product_sort_value(children[-1])
+        low, high = (last, first) if descending else (first, last)
+        if low <= value <= high:
+            return True
+        past_end = value < low if descending else value > high
+        return past_end and not self._product_has_more['after']
 
     def perform_logout(self):
+        self._sync_generation += 1
         self.current_user_id = None
         self.current_user_role = None
         messagebox.showinfo("Logout", "Você foi desconectado.")
@@ -339,6 +449,14 @@ class ControleEstoqueApp:
         ttk.Button(button_frame_product, text="Adicionar Produto", command=self.add_product_ui).pack(side='left', padx=5)
         ttk.Button(button_frame_product, text="Atualizar Produto", command=self.update_product_ui).pack(side='left', padx=5)
         ttk.Button(button_frame_product, text="Limpar Campos", command=self._clear_product_form).pack(side='left', padx=5)
+        ttk.Button(button_frame_product, text="Exportar", command=lambda: self.export_ui('products')).pack(side='left', padx=5)
+
+        search_frame = ttk.Frame(parent_frame)
+        search_frame.pack(side="top", fill="x", padx=5)
+        ttk.Label(search_frame, text="Buscar:").pack(side='left')
+        self.product_search_var = tk.StringVar()
+        self.product_search_var.trace_add('write', self._on_product_search_changed)
+        ttk.Entry(search_frame, textvariable=self.product_search_var, width=40).pack(side='left', padx=5)
 
         tree_view_frame = ttk.Frame(parent_frame)
         tree_view_frame.pack(side="top", fill="both", expand=True, padx=5, pady=5)
@@ -356,11 +474,23 @@ class ControleEstoqueApp:
         self.product_tree.column("Atual", width=80, anchor='center')
         self.product_tree.column("Mínimo", width=80, anchor='center')
 
-        yscrollbar = ttk.Scrollbar(tree_view_frame, orient="vertical", command=self.product_tree.yview)
-        self.product_tree.configure(yscrollcommand=yscrollbar.set)
-        yscrollbar.pack(side="right", fill="y")
+        for sort_key, (column, _) in inventory_service.PRODUCT_SORT_COLUMNS.items():
+            self.product_tree.heading(column, command=lambda key=sort_key: self._sort_products(key))
+
+        self.product_yscrollbar = ttk.Scrollbar(tree_view_frame, orient="vertical", command=self.product_tree.yview)
+        self.product_tree.configure(yscrollcommand=self._on_product_scroll)
+        self.product_yscrollbar.pack(side="right", fill="y")
         self.product_tree.pack(side="left", fill="both", expand=True)
         self.product_tree.bind("<<TreeviewSelect>>", self._on_product_select)
+        self.product_tree.tag_configure('low_stock', background='red', foreground='white')
+
+        # O Treeview guarda só uma janela de no máximo PRODUCT_WINDOW_PAGES páginas;
+        # as demais são buscadas no servidor conforme a rolagem.
+        self._product_rows = {}
+        self._product_sort = ('id', False)
+        self._product_has_more = {'before': False, 'after': False}
+        self._product_page_loading = False
+        self._product_search = ""
 
         self.load_products_to_tree()
 
@@ -380,9 +510,78 @@ class ControleEstoqueApp:
         button_frame_stock.grid(row=2, column=0, columnspan=2, pady=10)
         ttk.Button(button_frame_stock, text="Registrar Entrada", command=self.add_stock_ui).pack(side='left', padx=5)
         ttk.Button(button_frame_stock, text="Registrar Saída", command=self.remove_stock_ui).pack(side='left', padx=5)
-
-        self.low_stock_label = ttk.Label(parent_frame, text="", foreground='red', wraplength=750, font=("Arial", 10, "bold"))
-        self.low_stock_label.pack(side="bottom", fill="x", padx=10, pady=5)
+        ttk.Button(button_frame_stock, text="Importar CSV", command=self.import_movements_ui).pack(side='left', padx=5)
+        ttk.Button(button_frame_stock, text="Exportar Estoque Baixo", command=lambda: self.export_ui('low_stock')).pack(side='left', padx=5)
+        self.journal_status_label = ttk.Label(stock_frame, text="")
+        self.journal_status_label.grid(row=3, column=0, columnspan=2, sticky='w')
+
+        # Um rótulo por produto em alerta, para que cada alteração redesenhe só a sua linha.
+        self.low_stock_frame = ttk.Frame(parent_frame)
+        self.low_stock_frame.pack(side="bottom", fill="x", padx=10, pady=5)
+        self.low_stock_label = ttk.Label(self.low_stock_frame, text="", foreground='red', wraplength=750, font=("Arial", 10, "bold"))
+        self.low_stock_label.pack(side="top", fill="x")
+        self._low_stock_entries = {}
+
+    def create_history_tab_content(self, parent_frame):
+        history_frame = ttk.LabelFrame(parent_frame, text="Histórico do Produto", padding="10")
+        history_frame.pack(side="top", fill="x", padx=5, pady=5)
+
+        ttk.Label(history_frame, text="Produto Selecionado:").grid(row=0, column=0, sticky='w', pady=2)
+        self.history_product_label = ttk.Label(history_frame, text="Nenhum")
+        self.history_product_label.grid(row=0, column=1, sticky='w', pady=2)
+
+        ttk.Label(history_frame, text="Período:").grid(row=1, column=0, sticky='w', pady=2)
+        self.history_period_var = tk.StringVar(value=next(iter(HISTORY_PERIODS)))
+        ttk.Combobox(history_frame, textvariable=self.history_period_var, values=list(HISTORY_PERIODS), state='readonly', width=20).grid(row=1, column=1, sticky='w', pady=2)
+        history_buttons = ttk.Frame(history_frame)
+        history_buttons.grid(row=2, column=0, columnspan=2, pady=10)
+        ttk.Button(history_buttons, text="Consultar", command=self.load_history_ui).pack(side='left', padx=5)
+        ttk.Button(history_buttons, text="Exportar Movimentações", command=self.export_history_ui).pack(side='left', padx=5)
+
+        # Barras de entradas (verde) e saídas (vermelho) por período.
+        self.history_chart = tk.Canvas(parent_frame, height=HISTORY_CHART_HEIGHT, background='white', highlightthickness=0)
+        self.history_chart.pack(side="top", fill="x", padx=5, pady=5)
+
+        tables_frame = ttk.Frame(parent_frame)
+        tables_frame.pack(side="top", fill="both", expand=True, padx=5, pady=5)
+
+        self.history_trend_tree = ttk.Treeview(tables_frame, columns=("Período", "Entradas", "Saídas", "Movimentações"), show="headings")
+        for column, width in (("Período", 100), ("Entradas", 80), ("Saídas", 80), ("Movimentações", 100)):
+            self.history_trend_tree.heading(column, text=column)
+            self.history_trend_tree.column(column, width=width, anchor='center')
+        self.history_trend_tree.pack(side="left", fill="both", expand=True)
+
+        self.history_movements_tree = ttk.Treeview(tables_frame, columns=("Data", "Tipo", "Quantidade"), show="headings")
+        for column, width in (("Data", 140), ("Tipo", 80), ("Quantidade", 80)):
+            self.history_movements_tree.heading(column, text=column)
+            self.history_movements_tree.column(column, width=width, anchor='center')
+        self.history_movements_tree.pack(side="left", fill="both", expand=True, padx=(10, 0))
+
+    def create_forecast_tab_content(self, parent_frame):
+        header = ttk.Frame(parent_frame)
+        header.pack(side="top", fill="x", padx=5, pady=5)
+        ttk.Label(header, text="Produtos mais próximos de zerar o estoque, pelo consumo recente:", font=("Arial", 10, "bold")).pack(side="left")
+        ttk.Button(header, text="Atualizar Previsão", command=self.load_forecast_ui).pack(side="right")
+
+        columns = ("ID", "Nome", "Atual", "Consumo/dia", "Dias", "Zera em", "Sugestão")
+        self.forecast_tree = ttk.Treeview(parent_frame, columns=columns, show="headings")
+        self.forecast_tree.heading("ID", text="ID")
+        self.forecast_tree.heading("Nome", text="Nome")
+        self.forecast_tree.heading("Atual", text="Qtd. Atual")
+        self.forecast_tree.heading("Consumo/dia", text="Consumo/dia")
+        self.forecast_tree.heading("Dias", text="Dias até zerar")
+        self.forecast_tree.heading("Zera em", text="Zera em")
+        self.forecast_tree.heading("Sugestão", text="Comprar")
+        for column, width in (("ID", 50), ("Nome", 170), ("Atual", 80), ("Consumo/dia", 90), ("Dias", 100), ("Zera em", 90), ("Sugestão", 80)):
+            self.forecast_tree.column(column, width=width, anchor='w' if column == "Nome" else 'center')
+        self.forecast_tree.tag_configure('reorder', background='red', foreground='white')
+        self.forecast_tree.pack(fill="both", expand=True, padx=5, pady=5)
+
+    def _on_tab_changed(self, event):
+        # A previsão é atualizada ao abrir a aba; depois da primeira carga só o que
+        # mudou desde a última consulta é aplicado.
+        if self.notebook.select() == str(self.forecast_tab):
+            self.load_forecast_ui()
 
     def create_user_management_tab_content(self, parent_frame):
         user_frame = ttk.LabelFrame(parent_frame, text="Cadastrar Novo Usuário", padding="10")
@@ -401,7 +600,10 @@ class ControleEstoqueApp:
         self.new_user_role_dropdown = ttk.OptionMenu(user_frame, self.new_user_role_var, "comum", "admin", "comum")
         self.new_user_role_dropdown.grid(row=2, column=1, sticky='w', pady=2)
 
-        ttk.Button(user_frame, text="Registrar Usuário", command=self.register_user_ui).grid(row=3, column=0, columnspan=2, pady=10)
+        user_button_frame = ttk.Frame(user_frame)
+        user_button_frame.grid(row=3, column=0, columnspan=2, pady=10)
+        ttk.Button(user_button_frame, text="Registrar Usuário", command=self.register_user_ui).pack(side='left', padx=5)
+        ttk.Button(user_button_frame, text="Importar Usuários", command=self.import_users_ui).pack(side='left', padx=5)
 
         ttk.Label(parent_frame, text="Usuários Registrados:", font=("Arial", 10, "bold")).pack(pady=10)
         self.user_tree = ttk.Treeview(parent_frame, columns=("ID", "Usuário", "Perfil"), show="headings")
@@ -420,7 +622,10 @@ class ControleEstoqueApp:
         password = self.new_password_entry.get()
         role = self.new_user_role_var.get()
 
-        success, message = self._register_user(username, password, role)
+        self._run_in_background(self.service.register_user, username, password, role, on_success=self._on_register_user_result)
+
+    def _on_register_user_result(self, result):
+        success, message = result
         if success:
             messagebox.showinfo("Sucesso", message)
             self.new_username_entry.delete(0, tk.END)
@@ -430,20 +635,45 @@ class ControleEstoqueApp:
         else:
             messagebox.showerror("Erro", message)
 
+    def import_users_ui(self):
+        path = filedialog.askopenfilename(
+            title="Importar usuários (usuario,senha,perfil)",
+            filetypes=[("Arquivos CSV", "*.csv"), ("Todos os arquivos", "*.*")]
+        )
+        if not path:
+            return
+
+        self._run_in_background(self.service.import_users_csv, path, on_success=self._on_users_imported)
+
+    def _on_users_imported(self, result):
+        created, failures = result
+        self.load_users_to_tree()
+
+        message = f"{created} usuários criados."
+        if failures:
+            message += f"\n{len(failures)} linhas com falha:"
+            for line_num, username, reason in failures[:10]:
+                prefix = f"Linha {line_num} ({username}): " if line_num else ""
+                message += f"\n- {prefix}{reason}"
+            if len(failures) > 10:
+                message += f"\n... e mais {len(failures) - 10}."
+            messagebox.showwarning("Importação concluída com falhas", message)
+        else:
+            messagebox.showinfo("Importação concluída", message)
+
     def load_users_to_tree(self):
         if not self.current_user_role == 'admin':
             return
 
+        self._run_in_background(
+            self.service.get_users,
+            on_success=self._render_users, key='users'
+        )
+
+    def _render_users(self, users):
         for item in self.user_tree.get_children():
             self.user_tree.delete(item)
 
-        conn = self._get_db_connection()
-        if not conn:
-            return
-        cursor = conn.cursor(dictionary=True) # Usar dictionary=True para acesso por nome de coluna
-        users = self._execute_query("SELECT id, username, role FROM users") # Não precisa de fetchall() aqui
-        conn.close()
-
         if users:
             for u in users:
                 self.user_tree.insert("", "end", values=(u['id'], u['username'], u['role']))
@@ -454,6 +684,7 @@ class ControleEstoqueApp:
         self.product_min_qty_entry.delete(0, tk.END)
         self.selected_product_id = None
         self.selected_product_label.config(text="Nenhum")
+        self.history_product_label.config(text="Nenhum")
 
     def _on_product_select(self, event):
         selected_item = self.product_tree.focus()
@@ -469,31 +700,179 @@ class ControleEstoqueApp:
             self.product_min_qty_entry.insert(0, values[4])
 
             self.selected_product_label.config(text=f"{values[1]} (ID: {values[0]})")
+            self.history_product_label.config(text=f"{values[1]} (ID: {values[0]})")
+
+    def _product_window_limit(self):
+        return inventory_service.PRODUCT_PAGE_SIZE * PRODUCT_WINDOW_PAGES
+
+    def _product_sort_value(self, iid):
+        sort_key, _ = self._product_sort
+        return self._product_rows[iid][0][inventory_service.PRODUCT_SORT_COLUMNS[sort_key][1]]
+
+    def _reset_product_window(self):
+        self.product_tree.delete(*self.product_tree.get_children())
+        self._product_rows = {}
+        self._product_has_more = {'before': False, 'after': False}
 
     def load_products_to_tree(self):
-        for item in self.product_tree.get_children():
-            self.product_tree.delete(item)
+        # Recarrega a janela atual a partir da primeira linha exibida; linhas novas
+        # dentro da faixa aparecem e as removidas somem.
+        if self._product_search:
+            self._run_in_background(
+                self.service.search_products, self._product_search,
+                on_success=self._render_search_results,
+                key='products'
+            )
+            return
+        sort_key, descending = self._product_sort
+        children = self.product_tree.get_children()
+        boundary = self._product_sort_value(children[0]) if children else None
+        limit = max(len(children), inventory_service.PRODUCT_PAGE_SIZE)
+        self._run_in_background(
+            self.service.get_products_page, sort_key, descending, boundary, False, True, limit,
+            on_success=lambda products: self._render_products(products, limit),
+            key='products'
+        )
+
+    def _on_product_search_changed(self, *_):
+        # Cada tecla consulta o índice local do serviço; a tarefa anterior ainda não
+        # iniciada é cancelada pela chave 'products'.
+        search = self.product_search_var.get().strip()
+        if search == self._product_search:
+            return
+        self._product_search = search
+        self._reset_product_window()
+        self.load_products_to_tree()
 
-        products = self._get_all_products()
-        if products:
-            for p in products:
-                tags = ()
-                if p['current_quantity'] <= p['min_quantity'] and p['min_quantity'] > 0:
-                    tags = ('low_stock',)
-                self.product_tree.insert("", "end", values=(p['id'], p['name'], p['description'], p['current_quantity'], p['min_quantity']), tags=tags)
+    def _render_search_results(self, products):
+        self._render_products(products, None)
+        self._product_has_more = {'before': False, 'after': False}
 
-        self.product_tree.tag_configure('low_stock', background='red', foreground='white')
+    def _sort_products(self, sort_key):
+        current_key, descending = self._product_sort
+        descending = not descending if sort_key == current_key else False
+        self._product_sort = (sort_key, descending)
+
+        for key, (column, _) in inventory_service.PRODUCT_SORT_COLUMNS.items():
+            text = self.product_tree.heading(column, 'text').rstrip(" ▲▼")
+            if key == sort_key:
+                text += " ▼" if descending else " ▲"
+            self.product_tree.heading(column, text=text)
+
+        self._reset_product_window()
+        self.load_products_to_tree()
+
+    def _on_product_scroll(self, first, last):
+        self.product_yscrollbar.set(first, last)
+        if self._product_page_loading:
+            return
+        if float(last) >= 0.95 and self._product_has_more['after']:
+            self._load_product_page(backward=False)
+        elif float(first) <= 0.05 and self._product_has_more['before']:
+            self._load_product_page(backward=True)
+
+    def _load_product_page(self, backward):
+        children = self.product_tree.get_children()
+        if not children:
+            return
+        sort_key, descending = self._product_sort
+        boundary = self._product_sort_value(children[0] if backward else children[-1])
+
+        self._product_page_loading = True
+        self._run_in_background(
+            self.service.get_products_page, sort_key, descending, boundary, backward,
+            on_success=lambda products: self._render_product_page(products, backward),
+            on_error=self._on_product_page_error,
+            key='product_page'
+        )
+
+    def _on_product_page_error(self, error):
+        self._product_page_loading = False
+        messagebox.showerror("Erro", str(error))
+
+    def _render_product_page(self, products, backward):
+        self._product_page_loading = False
+        side = 'before' if backward else 'after'
+        self._product_has_more[side] = len(products) == inventory_service.PRODUCT_PAGE_SIZE
+
+        anchor = self.product_tree.identify_row(5)
+        for offset, p in enumerate(products):
+            if str(p['id']) in self._product_rows:
+                self._patch_product_row(p)
+            else:
+                self._insert_product_row(p, offset if backward else 'end')
+
+        # Mantém a janela limitada descartando linhas do lado oposto à rolagem.
+        children = self.product_tree.get_children()
+        excess = len(children) - self._product_window_limit()
+        if excess > 0:
+            dropped = children[-excess:] if backward else children[:excess]
+            self.product_tree.delete(*dropped)
+            for iid in dropped:
+                del self._product_rows[iid]
+            self._product_has_more['after' if backward else 'before'] = True
+
+        children = self.product_tree.get_children()
+        if anchor and anchor in self._product_rows:
+            self.product_tree.yview_moveto(children.index(anchor) / len(children))
+
+    def _render_products(self, products, limit):
+        # Diferença por id do produto: só linhas novas, alteradas ou removidas tocam
+        # no Treeview, preservando seleção e posição da rolagem.
+        desired = [str(p['id']) for p in products]
+        desired_set = set(desired)
+        for iid in [iid for iid in self._product_rows if iid not in desired_set]:
+            self.product_tree.delete(iid)
+            del self._product_rows[iid]
+
+        for p in products:
+            if str(p['id']) in self._product_rows:
+                self._patch_product_row(p)
+            else:
+                self._insert_product_row(p, 'end')
+
+        if self.product_tree.get_children() != tuple(desired):
+            for index, iid in enumerate(desired):
+                self.product_tree.move(iid, "", index)
+        self._product_has_more['after'] = len(products) == limit
+
+    def _product_row(self, p):
+        values = (p['id'], p['name'], p['description'], p['current_quantity'], p['min_quantity'])
+        tags = ()
+        if p['current_quantity'] <= p['min_quantity'] and p['min_quantity'] > 0:
+            tags = ('low_stock',)
+        return values, tags
+
+    def _insert_product_row(self, p, index):
+        iid = str(p['id'])
+        values, tags = self._product_row(p)
+        self.product_tree.insert("", index, iid=iid, values=values, tags=tags)
+        self._product_rows[iid] = (values, tags)
+
+    def _patch_product_row(self, p):
+        # Só atualiza linhas já presentes na janela exibida.
+        iid = str(p['id'])
+        row = self._product_row(p)
+        current = self._product_rows.get(iid)
+        if current is None or current == row:
+            return
+        self.product_tree.item(iid, values=row[0], tags=row[1])
+        self._product_rows[iid] = row
 
     def add_product_ui(self):
         name = self.product_name_entry.get()
         description = self.product_desc_entry.get()
         min_qty_str = self.product_min_qty_entry.get()
 
-        success, message = self._add_product(name, description, min_qty_str)
+        self._run_in_background(self.service.save_product, None, name, description, min_qty_str, on_success=self._on_product_saved)
+
+    def _on_product_saved(self, result):
+        success, message, product = result
         if success:
             messagebox.showinfo("Sucesso", message)
             self.load_products_to_tree()
-            self.update_low_stock_display()
+            if product:
+                self._set_low_stock_entry(product)
             self._clear_product_form()
         else:
             messagebox.showerror("Erro", message)
@@ -507,56 +886,282 @@ class ControleEstoqueApp:
         description = self.product_desc_entry.get()
         min_qty_str = self.product_min_qty_entry.get()
 
-        success, message = self._update_product(self.selected_product_id, name, description, min_qty_str)
-        if success:
-            messagebox.showinfo("Sucesso", message)
-            self.load_products_to_tree()
-            self.update_low_stock_display()
-            self._clear_product_form()
-        else:
-            messagebox.showerror("Erro", message)
+        self._run_in_background(
+            self.service.save_product, self.selected_product_id, name, description, min_qty_str,
+            on_success=self._on_product_saved
+        )
 
     def add_stock_ui(self):
         if not hasattr(self, 'selected_product_id') or not self.selected_product_id:
             messagebox.showerror("Erro", "Selecione um produto na lista para movimentar o estoque.")
             return
 
-        qty_str = self.stock_quantity_entry.get()
-        success, message = self._add_stock(self.selected_product_id, qty_str)
-        if success:
-            messagebox.showinfo("Sucesso", message)
-            self.load_products_to_tree()
-            self.update_low_stock_display()
-            self.stock_quantity_entry.delete(0, tk.END)
-        else:
-            messagebox.showerror("Erro", message)
+        self._journal_movement('entrada')
 
     def remove_stock_ui(self):
         if not hasattr(self, 'selected_product_id') or not self.selected_product_id:
             messagebox.showerror("Erro", "Selecione um produto na lista para movimentar o estoque.")
             return
 
-        qty_str = self.stock_quantity_entry.get()
-        success, message = self._remove_stock(self.selected_product_id, qty_str)
-        if success:
-            messagebox.showinfo("Sucesso", message)
-            self.load_products_to_tree()
-            self.update_low_stock_display()
-            self.stock_quantity_entry.delete(0, tk.END)
+        self._journal_movement('saida')
+
+    def _journal_movement(self, movement_type):
+        # Grava no diário local e confirma na hora, com ou sem MySQL; a linha do produto
+        # é corrigida assim que o envio é aplicado (_on_journal_flushed). Saídas recusadas
+        # no envio (estoque insuficiente) são avisadas por _on_journal_conflicts.
+        messages = inventory_service.MOVEMENT_MESSAGES[movement_type]
+        try:
+            quantity = int(self.stock_quantity_entry.get())
+        except ValueError:
+            messagebox.showerror("Erro", "Quantidade deve ser um número inteiro.")
+            return
+        if quantity <= 0:
+            messagebox.showerror("Erro", messages['invalid'])
+            return
+        if quantity > inventory_service.MAX_MOVEMENT_QUANTITY:
+            messagebox.showerror("Erro", inventory_service.QUANTITY_LIMIT_MESSAGE)
+            return
+
+        self.journal.append(self.selected_product_id, movement_type, quantity)
+        self.replayer.notify()
+        self.stock_quantity_entry.delete(0, tk.END)
+        self._update_journal_status(messages['success'])
+
+    def _update_journal_status(self, message=""):
+        if self.journal is None or not getattr(self, 'journal_status_label', None) or not self.journal_status_label.winfo_exists():
+            return
+        pending = self.journal.stats()['pending']
+        if pending and not self.replayer.online:
+            status = f"Sem conexão com o banco: {pending} movimentações aguardando envio."
+        elif pending:
+            status = f"{pending} movimentações aguardando envio."
         else:
-            messagebox.showerror("Erro", message)
+            status = ""
+        self.journal_status_label.config(text=" ".join(part for part in (message, status) if part))
+
+    def _on_journal_flushed(self, count, product_ids):
+        # Relê só os produtos movimentados e corrige suas linhas, sem esperar a
+        # próxima volta da sincronização.
+        self._update_journal_status()
+        if not product_ids or self.current_user_id is None:
+            return
+        generation = self._sync_generation
+        self._run_in_background(
+            self.service.get_products, sorted(product_ids),
+            on_success=lambda products: self._on_journal_products(generation, products),
+            on_error=lambda error: logger.warning("Produtos movimentados não relidos: %s", error)
+        )
+
+    def _on_journal_products(self, generation, products):
+        if generation != self._sync_generation:
+            return
+        for p in products.values():
+            self._patch_product_row(p)
+            self._set_low_stock_entry(p)
+
+    def _on_journal_conflicts(self, conflicts):
+        # As recusas ficam no diário até serem mostradas ao usuário.
+        lines = [
+            f"- {c['recorded_at']}: {'Entrada' if c['type'] == 'entrada' else 'Saída'} de {c['quantity']} do produto {c['product_id']}: {c['reason']}"
+            for c in conflicts[:10]
+        ]
+        if len(conflicts) > 10:
+            lines.append(f"... e mais {len(conflicts) - 10}.")
+        messagebox.showwarning(
+            "Movimentações recusadas",
+            f"{len(conflicts)} movimentações registradas não puderam ser aplicadas:\n" + "\n".join(lines)
+        )
+        self.journal.dismiss_conflicts([c['client_movement_id'] for c in conflicts])
+        self._update_journal_status()
+
+    def export_ui(self, kind, start=None, end=None, product_ids=None):
+        path = filedialog.asksaveasfilename(
+            title="Exportar",
+            defaultextension=".csv",
+            filetypes=[("Arquivos CSV", "*.csv"), ("JSON Lines", "*.jsonl"), ("Todos os arquivos", "*.*")]
+        )
+        if not path:
+            return
 
-    def update_low_stock_display(self):
-        low_stock_products = self._get_low_stock_products()
-        if low_stock_products:
-            alert_text = "ALERTA DE ESTOQUE BAIXO: \n"
-            for p in low_stock_products:
-                alert_text += f"- {p['name']} (Atual: {p['current_quantity']}, Mínimo: {p['min_quantity']})\n"
-            self.low_stock_label.config(text=alert_text)
+        # Importado só no uso, fora do caminho da partida.
+        from inventory_export import export_to_file
+        self._run_in_background(
+            export_to_file, self.service, kind, path, None, start, end, product_ids,
+            on_success=lambda count: messagebox.showinfo("Exportação concluída", f"{count} linhas exportadas para {path}.")
+        )
+
+    def export_history_ui(self):
+        if not hasattr(self, 'selected_product_id') or not self.selected_product_id:
+            messagebox.showwarning("Aviso", "Selecione um produto na aba \"Gerenciar Produtos\" para exportar as movimentações.")
+            return
+        days, _ = HISTORY_PERIODS[self.history_period_var.get()]
+        end = date.today()
+        self.export_ui('movements', end - timedelta(days=days - 1), end, [self.selected_product_id])
+
+    def import_movements_ui(self):
+        path = filedialog.askopenfilename(
+            title="Importar movimentações",
+            filetypes=[("Arquivos CSV", "*.csv"), ("Todos os arquivos", "*.*")]
+        )
+        if not path:
+            return
+
+        self._run_in_background(self.service.import_movements_csv, path, on_success=self._on_movements_imported)
+
+    def _on_movements_imported(self, result):
+        applied, failures = result
+        self.load_products_to_tree()
+        self.update_low_stock_display()
+
+        message = f"{applied} movimentações registradas."
+        if failures:
+            message += f"\n{len(failures)} linhas com falha:"
+            for line_num, _, reason in failures[:10]:
+                prefix = f"Linha {line_num}: " if line_num else ""
+                message += f"\n- {prefix}{reason}"
+            if len(failures) > 10:
+                message += f"\n... e mais {len(failures) - 10}."
+            messagebox.showwarning("Importação concluída com falhas", message)
         else:
-            self.low_stock_label.config(text="Todos os produtos estão em nível de estoque adequado.")
+            messagebox.showinfo("Importação concluída", message)
 
-if __name__ == "__main__":
+    def load_history_ui(self):
+        if not hasattr(self, 'selected_product_id') or not self.selected_product_id:
+            messagebox.showwarning("Aviso", "Selecione um produto na aba \"Gerenciar Produtos\" para ver o histórico.")
+            return
+
+        days, granularity = HISTORY_PERIODS[self.history_period_var.get()]
+        end = date.today()
+        start = end - timedelta(days=days - 1)
+        product_id = self.selected_product_id
+        self._run_in_background(
+            lambda: (
+                self.service.get_product_trend(product_id, start, end, granularity),
+                self.service.get_movement_history(product_id, start, end)
+            ),
+            on_success=lambda result: self._render_history(granularity, *result),
+            key='history'
+        )
+
+    def _history_period_label(self, period, granularity):
+        if granularity == 'month':
+            return period.strftime("%m/%Y")
+        return period.strftime("%d/%m/%Y")
+
+    def _render_history(self, granularity, trend, movements):
+        self.history_trend_tree.delete(*self.history_trend_tree.get_children())
+        for row in reversed(trend):
+            self.history_trend_tree.insert("", "end", values=(
+                self._history_period_label(row['period'], granularity), row['entradas'], row['saidas'], row['movements']
+            ))
+
+        self.history_movements_tree.delete(*self.history_movements_tree.get_children())
+        for m in movements:
+            self.history_movements_tree.insert("", "end", values=(m['movement_date'], m['type'], m['quantity']))
+
+        self._draw_history_chart(trend)
+
+    def _draw_history_chart(self, trend):
+        chart = self.history_chart
+        chart.delete("all")
+        width = chart.winfo_width() or 760
+        height = HISTORY_CHART_HEIGHT
+        peak = max((max(row['entradas'], row['saidas']) for row in trend), default=0)
+        if not trend or peak == 0:
+            chart.create_text(width / 2, height / 2, text="Sem movimentações no período.")
+            return
+
+        slot = width / len(trend)
+        bar = max(1, slot / 2 - 1)
+        scale = (height - 20) / peak
+        for index, row in enumerate(trend):
+            x = index * slot
+            chart.create_rectangle(x, height - row['entradas'] * scale, x + bar, height, fill='green', width=0)
+            chart.create_rectangle(x + bar, height - row['saidas'] * scale, x + 2 * bar, height, fill='red', width=0)
+        chart.create_text(4, 4, anchor='nw', text=f"máx. {peak}")
+
+    def load_forecast_ui(self):
+        self._run_in_background(self.service.get_stock_forecast, on_success=self._render_forecast, key='forecast')
+
+    def _render_forecast(self, forecast):
+        self.forecast_tree.delete(*self.forecast_tree.get_children())
+        for row in forecast:
+            days = row['days_to_stockout']
+            self.forecast_tree.insert("", "end", values=(
+                row['product_id'], row['name'], row['current_quantity'], f"{row['daily_rate']:.2f}",
+                "-" if days is None else f"{days:.1f}",
+                "-" if row['stockout_date'] is None else date.fromisoformat(row['stockout_date']).strftime("%d/%m/%Y"),
+                row['suggested_quantity'] or "-"
+            ), tags=('reorder',) if row['suggested_quantity'] else ())
+
+    def update_low_stock_display(self):
+        self._run_in_background(self.service.get_low_stock_products, on_success=self._render_low_stock, key='low_stock')
+
+    def _render_low_stock(self, low_stock_products):
+        low_stock_products = low_stock_products or []
+        current_ids = {p['id'] for p in low_stock_products}
+        for product_id in [pid for pid in self._low_stock_entries if pid not in current_ids]:
+            self._remove_low_stock_entry(product_id)
+        for p in low_stock_products:
+            self._set_low_stock_entry(p)
+        self._update_low_stock_header()
+
+    def _set_low_stock_entry(self, p):
+        # Mantém o conjunto de produtos em alerta a partir de uma única linha alterada.
+        if not (p['current_quantity'] <= p['min_quantity'] and p['min_quantity'] > 0):
+            if p['id'] in self._low_stock_entries:
+                self._remove_low_stock_entry(p['id'])
+                self._update_low_stock_header()
+            return
+
+        text = f"- {p['name']} (Atual: {p['current_quantity']}, Mínimo: {p['min_quantity']})"
+        entry = self._low_stock_entries.get(p['id'])
+        if entry is None:
+            label = ttk.Label(self.low_stock_frame, text=text, foreground='red', wraplength=750, font=("Arial", 10, "bold"))
+            label.pack(side="top", fill="x")
+            self._low_stock_entries[p['id']] = (label, text)
+            self._update_low_stock_header()
+        elif entry[1] != text:
+            entry[0].config(text=text)
+            self._low_stock_entries[p['id']] = (entry[0], text)
+
+    def _remove_low_stock_entry(self, product_id):
+        label, _ = self._low_stock_entries.pop(product_id)
+        label.destroy()
+
+    def _update_low_stock_header(self):
+        if self._low_stock_entries:
+            text = "ALERTA DE ESTOQUE BAIXO:"
+        else:
+            text = "Todos os produtos estão em nível de estoque adequado."
+        if self.low_stock_label.cget('text') != text:
+            self.low_stock_label.config(text=text)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BioSync - Controle de Estoque.")
+    parser.add_argument("--profile-startup", action="store_true", help="mede as etapas até a janela de login e encerra")
+    parser.add_argument("--startup-target-ms", type=float, default=STARTUP_TARGET_MS)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    profile = StartupProfile(args.startup_target_ms) if args.profile_startup else None
+    if profile:
+        profile.mark("imports da interface")
     root = tk.Tk()
-    app = ControleEstoqueApp(root)
+    if profile:
+        profile.mark("Tk iniciado")
+    app = ControleEstoqueApp(root, profile)
     root.mainloop()
+    if app.replayer:
+        app.replayer.stop(timeout=2)
+        app.journal.close()
+    if app.executor:
+        app.executor.shutdown(wait=False, cancel_futures=True)
+    if app.service:
+        app.service.close()
+    if profile and not profile.within_target:
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+from datetime import date, datetime, timedelta
+import math
+
+try:
+    import numpy as np
+except ImportError: # dependência opcional: sem ela só a previsão fica indisponível
+    np = None
+
+FORECAST_CONFIG = {
+    'history_days': 90, # dias completos de saídas considerados
+    'smoothing': 0.1, # alfa da média móvel exponencial diária
+    'lead_time_days': 7, # prazo de entrega do fornecedor
+    'coverage_days': 30, # dias de consumo que uma compra deve cobrir
+    'safety_days': 3 # estoque de segurança, em dias de consumo
+}
+
+def _day(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+class StockForecaster:
+    # Previsão de ruptura do catálogo inteiro em arrays NumPy: uma linha por produto
+    # (ordenada por id) e uma coluna por dia da janela de saídas. As taxas de consumo
+    # saem de um único produto matriz-vetor com os pesos da média exponencial, e as
+    # alterações chegam pelo feed de sincronização, sem recarregar a janela.
+    def __init__(self, config=FORECAST_CONFIG):
+        if np is None:
+            raise Exception("A previsão de estoque requer o NumPy (pip install numpy).")
+        self.config = dict(config)
+        self.days = self.config['history_days']
+
+        # Pesos dos dias completos, o mais recente por último, normalizados para que um
+        # consumo constante resulte na própria taxa. Hoje ainda está em andamento e
+        # fica fora da taxa (peso zero) até virar o dia.
+        alpha = self.config['smoothing']
+        weights = alpha * (1 - alpha) ** np.arange(self.days - 1, -1, -1)
+        self.weights = np.append(weights / weights.sum(), 0.0).astype(np.float32)
+
+        self.today = None
+        self.marks = None
+        self.product_ids = np.empty(0, dtype=np.int64)
+        self.quantity = np.empty(0)
+        self.min_quantity = np.empty(0)
+        self.saidas = np.empty((0, self.days + 1), dtype=np.float32)
+        self.rate = np.empty(0)
+        self.days_to_stockout = np.empty(0)
+        self.reorder_point = np.empty(0)
+        self.suggested_quantity = np.empty(0)
+        self._product_chunks = []
+
+    @property
+    def first_day(self):
+        return self.today - timedelta(days=self.days)
+
+    def start(self, today):
+        # Devolve o primeiro dia da janela, a partir do qual as saídas devem ser carregadas.
+        self.today = today
+        return self.first_day
+
+    def load_products(self, rows):
+        # Lotes de (id, quantidade atual, quantidade mínima) em ordem crescente de id.
+        self._product_chunks.append(np.array(rows, dtype=np.int64).reshape(-1, 3))
+
+    def load_saidas(self, rows):
+        # Lotes de (produto, dias desde first_day, saídas) da tabela diária; chamado
+        # depois de todos os lotes de load_products.
+        if self._product_chunks:
+            products = np.concatenate(self._product_chunks)
+            self._product_chunks = []
+            self.product_ids = products[:, 0].copy()
+            self.quantity = products[:, 1].astype(np.float64)
+            self.min_quantity = products[:, 2].astype(np.float64)
+            self.saidas = np.zeros((len(products), self.days + 1), dtype=np.float32)
+            for name in ('rate', 'days_to_stockout', 'reorder_point', 'suggested_quantity'):
+                setattr(self, name, np.zeros(len(products)))
+
+        batch = np.array(rows, dtype=np.int64).reshape(-1, 3)
+        self._add_saidas(batch[:, 0], batch[:, 1], batch[:, 2].astype(np.float32))
+
+    def finish_load(self, marks):
+        if self._product_chunks:
+            self.load_saidas([])
+        self.marks = marks
+        self.recompute()
+
+    def _rows(self, product_ids):
+        rows = np.searchsorted(self.product_ids, product_ids)
+        known = rows < len(self.product_ids)
+        known[known] = self.product_ids[rows[known]] == product_ids[known]
+        return rows, known
+
+    def _add_saidas(self, product_ids, offsets, quantities):
+        if not len(product_ids):
+            return
+        rows, known = self._rows(product_ids)
+        inside = known & (offsets >= 0) & (offsets <= self.days)
+        np.add.at(self.saidas, (rows[inside], offsets[inside]), quantities[inside])
+
+    def _insert_products(self, product_ids):
+        positions = np.searchsorted(self.product_ids, product_ids)
+        self.product_ids = np.insert(self.product_ids, positions, product_ids)
+        zeros = np.zeros(len(product_ids))
+        self.quantity = np.insert(self.quantity, positions, zeros)
+        self.min_quantity = np.insert(self.min_quantity, positions, zeros)
+        self.saidas = np.insert(self.saidas, positions, 0.0, axis=0)
+        for name in ('rate', 'days_to_stockout', 'reorder_point', 'suggested_quantity'):
+            setattr(self, name, np.insert(getattr(self, name), positions, zeros))
+
+    def advance_to(self, today):
+        # Na virada do dia a janela anda: as colunas deslizam para a esquerda e a
+        # coluna de hoje recomeça zerada; todas as taxas são recalculadas.
+        shift = (today - self.today).days
+        if shift <= 0:
+            return
+        if shift > self.days:
+            self.saidas[:] = 0
+        else:
+            self.saidas[:, :-shift] = self.saidas[:, shift:]
+            self.saidas[:, -shift:] = 0
+        self.today = today
+        self.recompute()
+
+    def apply_changes(self, changes):
+        # Recebe o resultado de InventoryService.fetch_changes.
+        products = changes['products']
+        touched = []
+        if products:
+            product_ids = np.array([p['id'] for p in products], dtype=np.int64)
+            _, known = self._rows(product_ids)
+            if not known.all():
+                self._insert_products(np.unique(product_ids[~known]))
+            rows, _ = self._rows(product_ids)
+            self.quantity[rows] = [p['current_quantity'] for p in products]
+            self.min_quantity[rows] = [p['min_quantity'] for p in products]
+            touched.append(rows)
+
+        saidas = [m for m in changes['movements'] if m['type'] == 'saida']
+        if saidas:
+            product_ids = np.array([m['product_id'] for m in saidas], dtype=np.int64)
+            offsets = np.array([(_day(m['movement_date']) - self.first_day).days for m in saidas], dtype=np.int64)
+            self._add_saidas(product_ids, offsets, np.array([m['quantity'] for m in saidas], dtype=np.float32))
+            rows, known = self._rows(product_ids)
+            touched.append(rows[known])
+
+        self.marks = changes['marks']
+        if touched:
+            self.recompute(np.unique(np.concatenate(touched)))
+
+    def recompute(self, rows=None):
+        if rows is None:
+            rows = slice(None)
+        rate = (self.saidas[rows] @ self.weights).astype(np.float64)
+        quantity = self.quantity[rows]
+        config = self.config
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.days_to_stockout[rows] = np.where(rate > 0, quantity / rate, np.inf)
+        safety = np.maximum(self.min_quantity[rows], rate * config['safety_days'])
+        reorder_point = rate * config['lead_time_days'] + safety
+        target = reorder_point + rate * config['coverage_days']
+        self.rate[rows] = rate
+        self.reorder_point[rows] = reorder_point
+        self.suggested_quantity[rows] = np.where(quantity <= reorder_point, np.ceil(np.maximum(target - quantity, 0)), 0)
+
+    def _result(self, row):
+        days_to_stockout = float(self.days_to_stockout[row])
+        return {
+            'product_id': int(self.product_ids[row]),
+            'current_quantity': int(self.quantity[row]),
+            'daily_rate': round(float(self.rate[row]), 3),
+            'days_to_stockout': round(days_to_stockout, 1) if math.isfinite(days_to_stockout) else None,
+            'stockout_date': (self.today + timedelta(days=int(days_to_stockout))).isoformat() if math.isfinite(days_to_stockout) else None,
+            'reorder_point': math.ceil(float(self.reorder_point[row])),
+            'suggested_quantity': int(self.suggested_quantity[row])
+        }
+
+    def at_risk(self, limit):
+        # Produtos que já pedem compra primeiro; entre eles, e depois nos demais com
+        # consumo, os que zeram antes.
+        needs_reorder = self.suggested_quantity > 0
+        candidates = np.flatnonzero(needs_reorder | np.isfinite(self.days_to_stockout))
+        order = np.lexsort((self.days_to_stockout[candidates], ~needs_reorder[candidates]))
+        return [self._result(row) for row in candidates[order[:limit]]]
+
+    def forecast_for(self, product_ids):
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        rows, known = self._rows(product_ids)
+        return [self._result(row) for row in rows[known]]
@@ -0,0 +1,431 @@
+import argparse
+import json
+import logging
+import re
+import secrets
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import inventory_service
+from inventory_service import DB_CONFIG, InventoryService
+
+logger = logging.getLogger("biosync")
+
+API_CONFIG = {
+    'host': '127.0.0.1',
+    'port': 8765,
+    'session_ttl': 12 * 3600,
+    'max_body_bytes': 10 * 1024 * 1024,
+    'max_batch_requests': 500
+}
+
+# Mensagens de recusa do serviço que correspondem a um status HTTP específico;
+# as demais recusas são erros de validação (400).
+MESSAGE_STATUS = {
+    "Produto não encontrado.": 404,
+    "Quantidade insuficiente em estoque.": 409
+}
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class BadRequestError(ApiError):
+    # Corpo ou parâmetros da requisição inválidos: sempre 400. Qualquer outra exceção
+    # dos handlers é falha do servidor (500) e vai para o log.
+    def __init__(self, message):
+        super().__init__(400, message)
+
+_REQUIRED = object()
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"Tipo não serializável: {type(value).__name__}")
+
+def _refusal_status(message):
+    if message in MESSAGE_STATUS:
+        return MESSAGE_STATUS[message]
+    return 500 if message.startswith("Erro") else 400
+
+class InventoryApi:
+    # Roteamento independente do transporte: recebe método, caminho, corpo e token e
+    # devolve (status, payload). O handler HTTP e o endpoint /batch usam o mesmo caminho.
+    def __init__(self, service):
+        self.service = service
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+        self.routes = [
+            ('POST', r'/auth/login', self.login, None),
+            ('POST', r'/auth/logout', self.logout, 'comum'),
+            ('GET', r'/users', self.list_users, 'admin'),
+            ('POST', r'/users', self.create_user, 'admin'),
+            ('GET', r'/products', self.list_products, 'comum'),
+            ('POST', r'/products', self.create_product, 'comum'),
+            ('GET', r'/products/search', self.search_products, 'comum'),
+            ('GET', r'/products/(?P<product_id>\d+)', self.show_product, 'comum'),
+            ('PUT', r'/products/(?P<product_id>\d+)', self.update_product, 'comum'),
+            ('POST', r'/movements', self.create_movement, 'comum'),
+            ('POST', r'/movements/batch', self.create_movements_batch, 'comum'),
+            ('GET', r'/products/(?P<product_id>\d+)/history', self.show_product_history, 'comum'),
+            ('GET', r'/low-stock', self.list_low_stock, 'comum'),
+            ('GET', r'/reports/consumption', self.consumption_report, 'comum'),
+            ('GET', r'/forecast', self.stock_forecast, 'comum'),
+            ('GET', r'/changes', self.list_changes, 'comum'),
+            ('POST', r'/batch', self.batch, 'comum')
+        ]
+        self.routes = [(method, re.compile(f"^{pattern}$"), handler, role) for method, pattern, handler, role in self.routes]
+
+    def _session(self, token):
+        with self._sessions_lock:
+            session = self._sessions.get(token)
+            if session and session['expires_at'] < time.monotonic():
+                del self._sessions[token]
+                session = None
+        return session
+
+    def dispatch(self, method, path, body, token, query=None):
+        path_matched = False
+        for route_method, pattern, handler, role in self.routes:
+            match = pattern.match(path)
+            if not match:
+                continue
+            path_matched = True
+            if route_method != method:
+                continue
+
+            session = None
+            if role is not None:
+                session = self._session(token)
+                if session is None:
+                    return 401, {'error': "Autenticação necessária."}
+                if role == 'admin' and session['role'] != 'admin':
+                    return 403, {'error': "Acesso restrito a administradores."}
+            if body is not None and not isinstance(body, dict):
+                return 400, {'error': "O corpo da requisição deve ser um objeto JSON."}
+            try:
+                return handler(session=session, body=body or {}, query=query or {}, token=token, **match.groupdict())
+            except ApiError as e:
+                return e.status, {'error': e.message}
+            except Exception as e:
+                logger.exception("Erro ao atender %s %s", method, path)
+                return 500, {'error': str(e)}
+        if path_matched:
+            return 405, {'error': "Método não permitido."}
+        return 404, {'error': "Recurso não encontrado."}
+
+    def _refusal(self, message):
+        raise ApiError(_refusal_status(message), message)
+
+    def _query_value(self, query, name, default=None):
+        values = query.get(name)
+        return values[0] if values else default
+
+    def _to_int(self, value, name):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise BadRequestError(f"{name} deve ser um número inteiro.")
+
+    def _field(self, body, name, types=str, default=_REQUIRED):
+        # Campo do corpo JSON com o tipo esperado; bool não passa por número.
+        if name not in body:
+            if default is _REQUIRED:
+                raise BadRequestError(f"Campo obrigatório: {name}.")
+            return default
+        value = body[name]
+        if types is not None and (not isinstance(value, types) or isinstance(value, bool)):
+            raise BadRequestError(f"Tipo inválido no campo {name}.")
+        return value
+
+    def _query_limit(self, query, default):
+        limit = self._to_int(self._query_value(query, 'limit', default), 'limit')
+        if limit < 1:
+            raise BadRequestError("limit deve ser positivo.")
+        return min(limit, 1000)
+
+    def _query_date(self, query, name, default):
+        value = self._query_value(query, name)
+        if value is None:
+            return default
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise BadRequestError(f"{name} deve ser uma data no formato AAAA-MM-DD.")
+
+    def login(self, body, **kwargs):
+        user_id, role = self.service.authenticate_user(self._field(body, 'username'), self._field(body, 'password'))
+        if not user_id:
+            raise ApiError(401, "Usuário ou senha inválidos.")
+        token = secrets.token_urlsafe(32)
+        now = time.monotonic()
+        with self._sessions_lock:
+            # Sessões vencidas cujo token nunca mais foi usado saem aqui; sem isso só
+            # seriam removidas no próximo uso do próprio token.
+            for expired in [t for t, s in self._sessions.items() if s['expires_at'] < now]:
+                del self._sessions[expired]
+            self._sessions[token] = {
+                'user_id': user_id,
+                'role': role,
+                'expires_at': now + API_CONFIG['session_ttl']
+            }
+        return 200, {'token': token, 'user_id': user_id, 'role': role}
+
+    def logout(self, token, **kwargs):
+        with self._sessions_lock:
+            self._sessions.pop(token, None)
+        return 200, {}
+
+    def list_users(self, **kwargs):
+        return 200, {'users': self.service.get_users() or []}
+
+    def create_user(self, body, **kwargs):
+        role = self._field(body, 'role', default='comum')
+        if role not in ('admin', 'comum'):
+            raise BadRequestError("Perfil deve ser 'admin' ou 'comum'.")
+        success, message = self.service.register_user(self._field(body, 'username'), self._field(body, 'password'), role)
+        if not success:
+            self._refusal(message)
+        return 201, {'message': message}
+
+    def list_products(self, query, **kwargs):
+        sort_key = self._query_value(query, 'sort', 'id')
+        if sort_key not in inventory_service.PRODUCT_SORT_COLUMNS:
+            raise BadRequestError(f"Ordenação inválida: {sort_key}.")
+        descending = self._query_value(query, 'desc', 'false').lower() in ('1', 'true')
+        limit = self._query_limit(query, inventory_service.PRODUCT_PAGE_SIZE)
+        after = self._query_value(query, 'after')
+        if after is not None and sort_key == 'id':
+            after = self._to_int(after, 'after')
+
+        products = self.service.get_products_page(sort_key, descending, after, limit=limit)
+        next_after = None
+        if len(products) == limit:
+            next_after = products[-1][sort_key]
+        return 200, {'products': products, 'next': next_after}
+
+    def search_products(self, query, **kwargs):
+        limit = self._query_limit(query, inventory_service.SEARCH_CONFIG['limit'])
+        return 200, {'products': self.service.search_products(self._query_value(query, 'q', ""), limit)}
+
+    def show_product(self, product_id, **kwargs):
+        product = self.service.get_product(int(product_id))
+        if not product:
+            raise ApiError(404, "Produto não encontrado.")
+        return 200, {'product': product}
+
+    def create_product(self, body, **kwargs):
+        success, message, product = self.service.save_product(
+            None, self._field(body, 'name'), self._field(body, 'description', default=""),
+            self._field(body, 'min_quantity', (int, str), default=0)
+        )
+        if not success:
+            self._refusal(message)
+        return 201, {'message': message, 'product': product}
+
+    def update_product(self, product_id, body, **kwargs):
+        success, message, product = self.service.save_product(
+            int(product_id), self._field(body, 'name'), self._field(body, 'description', default=""),
+            self._field(body, 'min_quantity', (int, str), default=0)
+        )
+        if not success:
+            self._refusal(message)
+        return 200, {'message': message, 'product': product}
+
+    def create_movement(self, body, **kwargs):
+        movement_type = self._field(body, 'type')
+        if movement_type not in ('entrada', 'saida'):
+            raise BadRequestError("Tipo deve ser 'entrada' ou 'saida'.")
+        product_id = self._to_int(self._field(body, 'product_id', (int, str)), 'product_id')
+        success, message, product = self.service.record_movement(product_id, movement_type, self._field(body, 'quantity', (int, str)))
+        if not success:
+            self._refusal(message)
+        return 201, {'message': message, 'product': product}
+
+    def create_movements_batch(self, body, **kwargs):
+        # Itens como objeto ou como [produto, tipo, quantidade]; o conteúdo de cada um é
+        # validado pelo serviço e as recusas voltam em failures.
+        movements = [
+            tuple(self._field(m, name, None) for name in ('product_id', 'type', 'quantity')) if isinstance(m, dict) else m
+            for m in self._field(body, 'movements', list)
+        ]
+        applied, failures = self.service.apply_movements_batch(movements)
+        return 200, {
+            'applied': applied,
+            'failures': [{'index': index, 'movement': movement, 'error': reason} for index, movement, reason in failures]
+        }
+
+    def _date_range(self, query):
+        # Padrão: os últimos 30 dias, incluindo hoje.
+        end = self._query_date(query, 'end', date.today())
+        start = self._query_date(query, 'start', end - timedelta(days=29))
+        if start > end:
+            raise BadRequestError("A data inicial deve ser anterior à final.")
+        return start, end
+
+    def show_product_history(self, product_id, query, **kwargs):
+        start, end = self._date_range(query)
+        granularity = self._query_value(query, 'granularity', 'day')
+        if granularity not in inventory_service.HISTORY_GRANULARITIES:
+            raise BadRequestError(f"Agrupamento inválido: {granularity}.")
+        return 200, {
+            'trend': self.service.get_product_trend(int(product_id), start, end, granularity),
+            'movements': self.service.get_movement_history(int(product_id), start, end)
+        }
+
+    def consumption_report(self, query, **kwargs):
+        start, end = self._date_range(query)
+        return 200, {'start': start, 'end': end, 'products': self.service.get_consumption_report(start, end)}
+
+    def stock_forecast(self, query, **kwargs):
+        product_ids = self._query_value(query, 'products')
+        if product_ids:
+            product_ids = [self._to_int(i, 'products') for i in product_ids.split(',')]
+            return 200, {'forecast': self.service.get_stock_forecast(product_ids=product_ids)}
+        limit = self._query_limit(query, inventory_service.FORECAST_LIMIT)
+        return 200, {'forecast': self.service.get_stock_forecast(limit)}
+
+    def list_low_stock(self, **kwargs):
+        return 200, {'products': self.service.get_low_stock_products() or []}
+
+    def list_changes(self, query, **kwargs):
+        # Sem marcas o cliente recebe as marcas atuais e começa a acompanhar a partir delas.
+        if 'movement_id' not in query:
+            return 200, {'movements': [], 'products': [], 'marks': self.service.get_sync_marks()}
+        try:
+            product_version = datetime.fromisoformat(self._query_value(query, 'product_version', ''))
+        except ValueError:
+            raise BadRequestError("product_version deve ser uma data e hora ISO 8601.")
+        marks = {
+            'movement_id': self._to_int(self._query_value(query, 'movement_id'), 'movement_id'),
+            'product_version': product_version,
+            'recent_movement_ids': frozenset(self._to_int(i, 'recent') for i in self._query_value(query, 'recent', '').split(',') if i)
+        }
+        return 200, self.service.fetch_changes(marks)
+
+    def batch(self, body, token, **kwargs):
+        requests = self._field(body, 'requests', None)
+        if not isinstance(requests, list):
+            raise BadRequestError("requests deve ser uma lista.")
+        if len(requests) > API_CONFIG['max_batch_requests']:
+            raise ApiError(413, f"No máximo {API_CONFIG['max_batch_requests']} requisições por lote.")
+
+        responses = []
+        for request in requests:
+            if not isinstance(request, dict) or not isinstance(request.get('path'), str) or not isinstance(request.get('method', 'GET'), str):
+                responses.append({'status': 400, 'body': {'error': "Cada requisição do lote precisa de path e method em texto."}})
+                continue
+            if request['path'].split('?')[0] == '/batch':
+                responses.append({'status': 400, 'body': {'error': "Lotes não podem ser aninhados."}})
+                continue
+            url = urlsplit(request['path'])
+            status, payload = self.dispatch(
+                request.get('method', 'GET').upper(), url.path, request.get('body'), token, parse_qs(url.query)
+            )
+            responses.append({'status': status, 'body': payload})
+        return 200, {'responses': responses}
+
+class InventoryRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1: a conexão permanece aberta entre requisições (keep-alive). Sem o
+    # algoritmo de Nagle, cabeçalho e corpo não esperam o ACK atrasado do cliente.
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    api = None
+
+    def _handle(self):
+        url = urlsplit(self.path)
+        # /metrics fica fora da autenticação para o coletor do Prometheus, como o
+        # servidor de METRICS_CONFIG['port']: só tem contadores e modelos de consulta
+        # sem os valores dos parâmetros, nenhum dado de estoque ou de usuário.
+        if self.command == 'GET' and url.path == '/metrics':
+            self._send(200, self.api.service.render_metrics().encode('utf-8'), "text/plain; version=0.0.4; charset=utf-8")
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > API_CONFIG['max_body_bytes']:
+            self._send_json(413, {'error': "Corpo da requisição muito grande."})
+            self.close_connection = True
+            return
+        body = None
+        if length:
+            try:
+                body = json.loads(self.rfile.read(length))
+            except ValueError:
+                self._send_json(400, {'error': "JSON inválido."})
+                return
+
+        token = None
+        authorization = self.headers.get('Authorization', '')
+        if authorization.startswith('Bearer '):
+            token = authorization[len('Bearer '):].strip()
+
+        status, payload = self.api.dispatch(self.command, url.path, body, token, parse_qs(url.query))
+        self._send_json(status, payload)
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload, default=_json_default, ensure_ascii=False).encode('utf-8'), "application/json; charset=utf-8")
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _handle
+    do_POST = _handle
+    do_PUT = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+def create_server(service, host=None, port=None):
+    api = InventoryApi(service)
+    handler = type("BoundInventoryRequestHandler", (InventoryRequestHandler,), {'api': api})
+    server = ThreadingHTTPServer((host or API_CONFIG['host'], port or API_CONFIG['port']), handler)
+    server.daemon_threads = True
+    return server
+
+def _refresh_search_index(service, stop):
+    # A busca não lê o banco a cada requisição: o índice local acompanha o feed de
+    # alterações nesta thread.
+    while not stop.wait(inventory_service.SEARCH_CONFIG['refresh_interval']):
+        try:
+            service.refresh_search_index()
+        except Exception as e:
+            logger.warning("Índice de busca não atualizado: %s", e)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API HTTP/JSON do BioSync.")
+    parser.add_argument("--host", default=API_CONFIG['host'])
+    parser.add_argument("--port", type=int, default=API_CONFIG['port'])
+    parser.add_argument("--pool-size", type=int, default=None, help="conexões MySQL simultâneas")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.pool_size:
+        inventory_service.POOL_CONFIG['pool_size'] = args.pool_size
+    service = InventoryService(DB_CONFIG)
+    service.init_db()
+    server = create_server(service, args.host, args.port)
+    stop = threading.Event()
+    threading.Thread(target=_refresh_search_index, args=(service, stop), daemon=True).start()
+    print(f"API do BioSync em http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+        service.close()
+
+if __name__ == "__main__":
+    main()
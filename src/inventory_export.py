@@ -0,0 +1,88 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from datetime import date, datetime
+
+from inventory_service import DB_CONFIG, EXPORT_SOURCES, InventoryService
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+# Buffer de escrita grande: cada lote vira poucas chamadas de write no disco.
+EXPORT_BUFFER_BYTES = 1024 * 1024
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(value).__name__}")
+
+def write_csv(batches, columns, output):
+    writer = csv.writer(output)
+    writer.writerow(columns)
+    count = 0
+    for rows in batches:
+        writer.writerows(rows)
+        count += len(rows)
+    return count
+
+def write_jsonl(batches, columns, output):
+    encode = json.JSONEncoder(ensure_ascii=False, default=_json_default).encode
+    count = 0
+    for rows in batches:
+        output.write("".join([encode(dict(zip(columns, row))) + "\n" for row in rows]))
+        count += len(rows)
+    return count
+
+WRITERS = {'csv': write_csv, 'jsonl': write_jsonl}
+
+def export_format(path):
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    return 'jsonl' if extension in ('jsonl', 'json', 'ndjson') else 'csv'
+
+def export_to_file(service, kind, path, fmt=None, start=None, end=None, product_ids=None):
+    # Escreve em um arquivo temporário ao lado do destino e só o renomeia no fim, para
+    # que uma exportação interrompida não deixe um arquivo aparentemente completo.
+    fmt = fmt or export_format(path)
+    if fmt not in WRITERS:
+        raise ValueError(f"Formato desconhecido: {fmt}.")
+    if kind not in EXPORT_SOURCES:
+        raise ValueError(f"Relatório desconhecido: {kind}.")
+    batches = service.stream_export(kind, start, end, product_ids)
+    partial = f"{path}.part"
+    try:
+        with open(partial, "w", newline="", encoding="utf-8", buffering=EXPORT_BUFFER_BYTES) as output:
+            count = WRITERS[fmt](batches, EXPORT_SOURCES[kind]['columns'], output)
+        os.replace(partial, path)
+    except BaseException:
+        batches.close()
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    return count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta produtos, movimentações e estoque baixo do BioSync.")
+    parser.add_argument("kind", choices=list(EXPORT_SOURCES))
+    parser.add_argument("output", help="arquivo de destino (.csv ou .jsonl)")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, help="padrão: pela extensão do arquivo")
+    parser.add_argument("--start", type=date.fromisoformat, help="primeiro dia (AAAA-MM-DD), só movimentações")
+    parser.add_argument("--end", type=date.fromisoformat, help="último dia (AAAA-MM-DD), só movimentações")
+    parser.add_argument("--products", help="ids separados por vírgula")
+    args = parser.parse_args(argv)
+
+    product_ids = [int(p) for p in args.products.split(",") if p.strip()] if args.products else None
+    service = InventoryService(DB_CONFIG)
+    try:
+        service.init_db()
+        count = export_to_file(service, args.kind, args.output, args.format, args.start, args.end, product_ids)
+    except Exception as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        service.close()
+    print(f"{count} linhas exportadas para {args.output}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
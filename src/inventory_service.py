@@ -0,0 +1,2204 @@
+from datetime import date, datetime, timedelta
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import bisect
+import csv
+import heapq
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+
+from storage import Error, IntegrityError, NoSuchTableError, OperationalError, create_backend
+
+logger = logging.getLogger("biosync")
+
+# 'backend' escolhe o armazenamento (storage.BACKENDS); as demais chaves vão para ele.
+# 'mysql' conecta ao servidor com host, user, password e database. 'sqlite' usa um
+# banco embarcado no arquivo 'path', para lojas de um terminal só, ou ':memory:' para
+# testes: {'backend': 'sqlite', 'path': 'estoque_biosync.db'}.
+DB_CONFIG = {
+    'backend': 'mysql',
+    'host': 'localhost',
+    'user': 'your_mysql_user',
+    'password': 'your_mysql_password',
+    'database': 'estoque_biosync'
+}
+
+MOVEMENT_BATCH_SIZE = 500
+MAX_MOVEMENT_QUANTITY = 2147483647 # maior valor da coluna INT de quantidade
+
+PRODUCT_COLUMNS = "id, name, description, current_quantity, min_quantity"
+PRODUCT_PAGE_SIZE = 200
+
+# Colunas ordenáveis da lista de produtos: todas únicas e indexadas, o que
+# permite paginação por chave (WHERE coluna > último valor) em vez de OFFSET.
+PRODUCT_SORT_COLUMNS = {
+    'id': ("ID", 0),
+    'name': ("Nome", 1)
+}
+
+# Agrupamentos aceitos pelo histórico; os totais saem sempre da tabela diária.
+HISTORY_GRANULARITIES = ('day', 'week', 'month')
+HISTORY_RECENT_LIMIT = 100
+
+# Previsão de ruptura: produtos devolvidos por consulta e tamanho dos lotes lidos
+# do servidor ao montar os arrays do catálogo inteiro.
+FORECAST_LIMIT = 100
+FORECAST_FETCH_SIZE = 10000
+
+# Exportação: colunas de cada relatório e os filtros que ele aceita. As linhas vêm
+# de um cursor sem buffer em lotes de EXPORT_FETCH_SIZE.
+EXPORT_SOURCES = {
+    'products': {
+        'query': f"SELECT {PRODUCT_COLUMNS} FROM products",
+        'columns': ('id', 'name', 'description', 'current_quantity', 'min_quantity'),
+        'product_column': 'id',
+        'date_column': None,
+        'order_by': 'id'
+    },
+    'movements': {
+        'query': "SELECT id, product_id, type, quantity, movement_date FROM {table}",
+        'columns': ('id', 'product_id', 'type', 'quantity', 'movement_date'),
+        'product_column': 'product_id',
+        'date_column': 'movement_date',
+        'order_by': 'id',
+        'archived': True # lê também as tabelas mensais de arquivo
+    },
+    'low_stock': {
+        'query': "SELECT id, name, current_quantity, min_quantity FROM products WHERE is_low_stock = 1",
+        'columns': ('id', 'name', 'current_quantity', 'min_quantity'),
+        'product_column': 'id',
+        'date_column': None,
+        'order_by': 'id'
+    }
+}
+EXPORT_FETCH_SIZE = 5000
+
+# Arquivamento: movimentações anteriores a horizon_days saem de stock_movements para
+# tabelas mensais (stock_movements_AAAAMM) em transações de batch_size linhas.
+ARCHIVE_CONFIG = {
+    'horizon_days': 365,
+    'batch_size': 1000,
+    'pause': 0.05, # segundos entre lotes, para não disputar com o balcão
+    'row_format': 'COMPRESSED' # ROW_FORMAT das tabelas de arquivo; None mantém o padrão
+}
+ARCHIVE_LOCK_NAME = "biosync_archive"
+
+# Conciliação do estoque com o histórico: produtos conferidos por consulta agrupada.
+RECONCILE_BATCH_SIZE = 1000
+RECONCILE_LOCK_NAME = "biosync_reconcile"
+
+MOVEMENT_MESSAGES = {
+    'entrada': {
+        'invalid': "Quantidade de entrada deve ser um número inteiro positivo.",
+        'success': "Entrada de estoque registrada com sucesso.",
+        'error': "Erro ao adicionar estoque"
+    },
+    'saida': {
+        'invalid': "Quantidade de saída deve ser um número inteiro positivo.",
+        'success': "Saída de estoque registrada com sucesso.",
+        'error': "Erro ao remover estoque"
+    }
+}
+QUANTITY_LIMIT_MESSAGE = f"Quantidade deve ser no máximo {MAX_MOVEMENT_QUANTITY}."
+
+POOL_CONFIG = {
+    'pool_size': 5,
+    'checkout_timeout': 10,
+    'idle_timeout': 300,
+    'health_check_interval': 30
+}
+
+class PoolExhaustedError(Error):
+    pass
+
+class ServiceUnavailableError(Exception):
+    # Banco fora do ar, sem conexão livre ou travado: a operação pode ser repetida mais tarde.
+    pass
+
+# Trava nomeada (GET_LOCK no MySQL) que serializa migrações disparadas por terminais abertos juntos.
+SCHEMA_LOCK_NAME = "biosync_schema"
+SCHEMA_LOCK_TIMEOUT = 30
+
+# Custo do hash de senha, no formato de método do werkzeug. O método fica gravado no
+# próprio hash ("pbkdf2:sha256:600000$sal$hash"); hashes feitos com outro método são
+# refeitos no próximo login bem-sucedido.
+PASSWORD_CONFIG = {
+    'method': 'pbkdf2:sha256:600000',
+    'salt_length': 16,
+    'import_workers': None # processos na importação em massa; None = um por núcleo
+}
+
+USER_IMPORT_BATCH_SIZE = 500
+
+# werkzeug importa boa parte da pilha HTTP e não é necessário para abrir o app: só é
+# carregado no primeiro login ou cadastro.
+def _hash_password(password, method=None, salt_length=None):
+    from werkzeug.security import generate_password_hash
+    return generate_password_hash(
+        password,
+        method=method or PASSWORD_CONFIG['method'],
+        salt_length=salt_length or PASSWORD_CONFIG['salt_length']
+    )
+
+def _check_password(password_hash, password):
+    from werkzeug.security import check_password_hash
+    return check_password_hash(password_hash, password)
+
+def _password_needs_rehash(password_hash):
+    return password_hash.split('$', 1)[0] != PASSWORD_CONFIG['method']
+
+def _timestamp(value):
+    # Colunas calculadas como MAX(updated_at) não têm tipo declarado: o SQLite as devolve
+    # como o texto ISO guardado, o MySQL já como datetime.
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+def _history_period(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+METRICS_CONFIG = {
+    'slow_query_threshold': 0.5,
+    'port': None # ex.: 9108 para expor /metrics em texto do Prometheus
+}
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_PHASES = ('connect', 'execute', 'fetch')
+
+class QueryMetrics:
+    _LITERALS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\b\d+\b|%s")
+    _IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+    _CASE_LISTS = re.compile(r"(?:WHEN \? THEN \?\s*)+")
+    _SPACES = re.compile(r"\s+")
+
+    def __init__(self, slow_query_threshold=0.5, max_templates=1000):
+        self.slow_query_threshold = slow_query_threshold
+        self.max_templates = max_templates
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._templates = {}
+
+    def normalize(self, query):
+        # As consultas do app são quase todas strings constantes: o modelo é calculado uma vez por texto.
+        template = self._templates.get(query)
+        if template is None:
+            template = self._LITERALS.sub("?", query)
+            template = self._IN_LISTS.sub("(...)", template)
+            template = self._CASE_LISTS.sub("WHEN ... ", template)
+            template = self._SPACES.sub(" ", template).strip()
+            if len(self._templates) < self.max_templates:
+                self._templates[query] = template
+        return template
+
+    def record(self, query, caller, connect=0.0, execute=0.0, fetch=0.0, rows=0, error=False):
+        template = self.normalize(query)
+        with self._lock:
+            stats = self._stats.get(template)
+            if stats is None:
+                stats = {
+                    'buckets': {phase: [0] * len(LATENCY_BUCKETS) for phase in QUERY_PHASES},
+                    'sum': dict.fromkeys(QUERY_PHASES, 0.0),
+                    'count': 0,
+                    'rows': 0,
+                    'errors': 0
+                }
+                self._stats[template] = stats
+            for phase, elapsed in zip(QUERY_PHASES, (connect, execute, fetch)):
+                index = bisect.bisect_left(LATENCY_BUCKETS, elapsed)
+                if index < len(LATENCY_BUCKETS):
+                    stats['buckets'][phase][index] += 1
+                stats['sum'][phase] += elapsed
+            stats['count'] += 1
+            stats['rows'] += max(rows, 0)
+            if error:
+                stats['errors'] += 1
+
+        total = connect + execute + fetch
+        if total >= self.slow_query_threshold:
+            logger.warning(
+                "Consulta lenta (%.3fs: conexão %.3fs, execução %.3fs, leitura %.3fs) em %s: %s",
+                total, connect, execute, fetch, self._caller_chain(caller), template
+            )
+
+    def _caller_chain(self, frame, depth=3):
+        # Recebe o frame de quem chamou a consulta; os nomes só são resolvidos para consultas lentas.
+        names = []
+        while frame is not None and len(names) < depth:
+            names.append(frame.f_code.co_name)
+            frame = frame.f_back
+        return " < ".join(names)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                template: {
+                    'count': stats['count'],
+                    'rows': stats['rows'],
+                    'errors': stats['errors'],
+                    'sum': dict(stats['sum'])
+                }
+                for template, stats in self._stats.items()
+            }
+
+    def _label(self, value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    def render_prometheus(self, gauges=None):
+        lines = [
+            "# HELP biosync_query_duration_seconds Latência das consultas por fase.",
+            "# TYPE biosync_query_duration_seconds histogram"
+        ]
+        with self._lock:
+            items = [(template, {
+                'buckets': {phase: list(counts) for phase, counts in stats['buckets'].items()},
+                'sum': dict(stats['sum']),
+                'count': stats['count'],
+                'rows': stats['rows'],
+                'errors': stats['errors']
+            }) for template, stats in self._stats.items()]
+
+        for template, stats in items:
+            query = self._label(template)
+            for phase in QUERY_PHASES:
+                labels = f'query="{query}",phase="{phase}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, stats['buckets'][phase]):
+                    cumulative += count
+                    lines.append(f'biosync_query_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'biosync_query_duration_seconds_bucket{{{labels},le="+Inf"}} {stats["count"]}')
+                lines.append(f'biosync_query_duration_seconds_sum{{{labels}}} {stats["sum"][phase]}')
+                lines.append(f'biosync_query_duration_seconds_count{{{labels}}} {stats["count"]}')
+
+        lines.append("# TYPE biosync_query_rows_total counter")
+        lines.extend(f'biosync_query_rows_total{{query="{self._label(t)}"}} {st["rows"]}' for t, st in items)
+        lines.append("# TYPE biosync_query_errors_total counter")
+        lines.extend(f'biosync_query_errors_total{{query="{self._label(t)}"}} {st["errors"]}' for t, st in items)
+
+        for name, value in (gauges or {}).items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = self.service.render_metrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+CACHE_CONFIG = {
+    'max_size': 10000,
+    'version_check_interval': 2.0
+}
+
+SYNC_CONFIG = {
+    'interval_ms': 3000,
+    'max_movements': 1000
+}
+
+# Ids de AUTO_INCREMENT de transações concorrentes podem ser confirmados fora de
+# ordem; o feed relê estas últimas linhas e descarta as já vistas.
+MOVEMENT_OVERLAP_ROWS = 100
+
+# Escritas confirmadas fora de ordem podem ter updated_at um pouco anterior à marca
+# d'água já lida; a verificação de versão relê esta margem para não perdê-las.
+VERSION_OVERLAP = timedelta(seconds=1)
+
+class ProductCache:
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, product_id):
+        with self._lock:
+            product = self._items.get(product_id)
+            if product is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(product_id)
+            self.hits += 1
+            return dict(product)
+
+    def put(self, product):
+        with self._lock:
+            self._items[product['id']] = dict(product)
+            self._items.move_to_end(product['id'])
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, product_id):
+        with self._lock:
+            if self._items.pop(product_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._items)
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._items),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+SEARCH_CONFIG = {
+    'max_local_products': 50000, # acima disso a busca usa o índice FULLTEXT do servidor
+    'description_chars': 200, # trecho da descrição indexado localmente
+    'refresh_interval': 5.0, # segundos entre leituras do feed pelo índice na API (a interface usa o ciclo da sincronização)
+    'limit': 200
+}
+
+def _search_key(text):
+    # Minúsculas e sem acentos: "acucar" encontra "Açúcar".
+    decomposed = unicodedata.normalize('NFKD', (text or "").casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+def _like_escape(text):
+    # Escape de LIKE com '!', que vale igual no MySQL e no SQLite (a barra não).
+    return text.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+
+class ProductSearchIndex:
+    # Índice local da busca enquanto o usuário digita. Nomes normalizados ficam em uma
+    # lista ordenada (prefixo por bisect) e trigramas de nome e descrição apontam para
+    # os ids (substring). As listas de trigramas só crescem: ids que deixaram de conter
+    # um trigrama após uma edição são descartados na conferência do texto e removidos
+    # quando o índice é reconstruído.
+    def __init__(self, description_chars=200):
+        self.description_chars = description_chars
+        self.marks = None
+        self._rows = {} # id -> (id, nome, descrição, quantidade atual, quantidade mínima)
+        self._texts = {} # id -> "nome\0descrição" normalizados
+        self._names = [] # (nome normalizado, id), ordenada
+        self._trigrams = {} # trigrama -> array de ids
+        self._stale = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def put(self, product):
+        product_id = product['id']
+        row = (product_id, product['name'], product['description'], product['current_quantity'], product['min_quantity'])
+        old = self._rows.get(product_id)
+        self._rows[product_id] = row
+        if old and old[1:3] == row[1:3]:
+            return # só as quantidades mudaram
+
+        name = _search_key(row[1])
+        text = name + "\0" + _search_key(row[2])[:self.description_chars]
+        old_grams = set()
+        if old:
+            old_text = self._texts[product_id]
+            del self._names[bisect.bisect_left(self._names, (old_text.split("\0", 1)[0], product_id))]
+            old_grams = self._text_trigrams(old_text)
+            self._stale += 1
+        bisect.insort(self._names, (name, product_id))
+        self._texts[product_id] = text
+        for gram in self._text_trigrams(text) - old_grams:
+            self._trigrams.setdefault(gram, array('i')).append(product_id)
+
+        if self._stale > len(self._rows) // 4 + 100:
+            self._rebuild_trigrams()
+
+    def _text_trigrams(self, text):
+        # Trigramas que atravessam o separador entre nome e descrição não são indexados.
+        return {gram for gram in (text[i:i + 3] for i in range(len(text) - 2)) if "\0" not in gram}
+
+    def _rebuild_trigrams(self):
+        self._trigrams = {}
+        for product_id, text in self._texts.items():
+            for gram in self._text_trigrams(text):
+                self._trigrams.setdefault(gram, array('i')).append(product_id)
+        self._stale = 0
+
+    def _product(self, product_id):
+        return dict(zip(('id', 'name', 'description', 'current_quantity', 'min_quantity'), self._rows[product_id]))
+
+    def search(self, query, limit):
+        # Primeiro os nomes que começam com o termo, em ordem alfabética; depois os que
+        # o contêm no nome e, por fim, só na descrição.
+        term = _search_key(query).strip()
+        if not term:
+            return []
+
+        found = []
+        start = bisect.bisect_left(self._names, (term,))
+        for name, product_id in self._names[start:start + limit]:
+            if not name.startswith(term):
+                break
+            found.append(product_id)
+
+        if len(found) < limit and len(term) >= 3:
+            postings = [self._trigrams.get(term[i:i + 3]) for i in range(len(term) - 2)]
+            if all(postings):
+                seen = set(found)
+                texts = self._texts
+                in_name, in_description = [], []
+                # Basta percorrer o trigrama mais raro e conferir o texto de cada candidato.
+                for product_id in min(postings, key=len):
+                    if product_id in seen:
+                        continue
+                    seen.add(product_id)
+                    text = texts[product_id]
+                    position = text.find(term)
+                    if position >= 0:
+                        (in_description if position > text.index("\0") else in_name).append(product_id)
+                for matches in (in_name, in_description):
+                    found.extend(heapq.nsmallest(limit - len(found), matches, key=texts.__getitem__))
+        return [self._product(product_id) for product_id in found]
+
+class ConnectionPool:
+    def __init__(self, backend, pool_size=5, checkout_timeout=10, idle_timeout=300, health_check_interval=30):
+        self.backend = backend
+        self.pool_size = min(pool_size, backend.max_connections or pool_size)
+        self.checkout_timeout = checkout_timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle = deque() # (conexão, instante da devolução)
+        self._in_use = 0
+        self._cond = threading.Condition()
+
+        self.checkouts = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.timeouts = 0
+        self.reconnects = 0
+
+    def _connect(self):
+        return self.backend.connect()
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Error:
+            pass
+
+    def _evict_idle(self):
+        # Chamado com self._cond adquirido; as conexões mais antigas ficam à esquerda.
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] > self.idle_timeout:
+            conn, _ = self._idle.popleft()
+            self._close_quietly(conn)
+
+    def _is_healthy(self, conn, released_at):
+        if time.monotonic() - released_at < self.health_check_interval:
+            return True
+        try:
+            conn.ping()
+            return True
+        except Error:
+            return False
+
+    def acquire(self):
+        start = time.monotonic()
+        deadline = start + self.checkout_timeout
+        conn, released_at = None, None
+        with self._cond:
+            while True:
+                self._evict_idle()
+                if self._idle:
+                    conn, released_at = self._idle.pop()
+                    break
+                if self._in_use < self.pool_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolExhaustedError(msg=f"Nenhuma conexão livre no pool após {self.checkout_timeout}s.")
+                self._cond.wait(remaining)
+
+            self._in_use += 1
+            waited = time.monotonic() - start
+            self.checkouts += 1
+            self.total_wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+
+        try:
+            if conn is not None and not self._is_healthy(conn, released_at):
+                self._close_quietly(conn)
+                conn = None
+                self.reconnects += 1
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def release(self, conn, discard=False):
+        if not discard:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            except Error:
+                discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            if discard:
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._evict_idle()
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                self._close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'pool_size': self.pool_size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'checkouts': self.checkouts,
+                'total_wait_time': self.total_wait_time,
+                'avg_wait_time': self.total_wait_time / self.checkouts if self.checkouts else 0.0,
+                'max_wait_time': self.max_wait_time,
+                'timeouts': self.timeouts,
+                'reconnects': self.reconnects
+            }
+
+class InventoryService:
+    def __init__(self, db_config=DB_CONFIG):
+        self.backend = create_backend(db_config)
+        self.pool = ConnectionPool(self.backend, **POOL_CONFIG)
+        self.metrics = QueryMetrics(METRICS_CONFIG['slow_query_threshold'])
+        self.metrics_server = None
+        if METRICS_CONFIG['port']:
+            self.start_metrics_server(METRICS_CONFIG['port'])
+        self.product_cache = ProductCache(CACHE_CONFIG['max_size'])
+        self._product_version = None
+        self._product_version_checked_at = 0.0
+        self._product_version_lock = threading.Lock()
+        self.forecaster = None
+        self._forecast_lock = threading.Lock()
+        self.search_index = None
+        self._search_local = None
+        self._search_lock = threading.Lock()
+        self._search_load_lock = threading.Lock()
+        self._search_refresh_lock = threading.Lock()
+
+    def close(self):
+        if self.metrics_server:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+        self.pool.close_all()
+        self.backend.close()
+
+    def start_metrics_server(self, port):
+        handler = type("BoundMetricsRequestHandler", (MetricsRequestHandler,), {'service': self})
+        self.metrics_server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        threading.Thread(target=self.metrics_server.serve_forever, name="biosync-metrics", daemon=True).start()
+
+    def render_metrics(self):
+        gauges = {f"biosync_pool_{name}": value for name, value in self.pool.stats().items()}
+        gauges.update({f"biosync_product_cache_{name}": value for name, value in self.product_cache.stats().items()})
+        return self.metrics.render_prometheus(gauges)
+
+    def _execute_on_cursor(self, cursor, query, params=(), many=False):
+        # Instrumenta instruções executadas dentro de transações abertas manualmente.
+        caller = sys._getframe(1)
+        start = time.perf_counter()
+        try:
+            if many:
+                cursor.executemany(query, params)
+            else:
+                cursor.execute(query, params)
+        except Error:
+            self.metrics.record(query, caller, execute=time.perf_counter() - start, error=True)
+            raise
+        self.metrics.record(query, caller, execute=time.perf_counter() - start, rows=cursor.rowcount)
+
+    def _get_db_connection(self):
+        try:
+            return self.pool.acquire()
+        except PoolExhaustedError as e:
+            raise ServiceUnavailableError(f"Banco de dados ocupado: {e}")
+        except Error as e:
+            raise ServiceUnavailableError(f"Erro ao conectar ao {self.backend.label}: {e}")
+
+    def _release_db_connection(self, conn, discard=False):
+        self.pool.release(conn, discard=discard)
+
+    def init_db(self):
+        # Com o esquema em dia, a partida custa uma única consulta de versão; as
+        # migrações só rodam quando o banco está atrás do código.
+        conn = self._get_db_connection()
+        cursor = conn.cursor(buffered=True)
+
+        try:
+            version = self._schema_version(cursor)
+            if version < len(self.SCHEMA_MIGRATIONS):
+                return self._migrate_schema(conn, cursor)
+            if version > len(self.SCHEMA_MIGRATIONS):
+                logger.warning("Esquema do banco na versão %d, mais nova que a do app (%d).", version, len(self.SCHEMA_MIGRATIONS))
+            return []
+
+        except Error as e:
+            logger.error("Erro ao inicializar o banco de dados ou garantir usuário admin: %s", e)
+            raise Exception(f"Não foi possível inicializar o banco de dados: {e}")
+        finally:
+            if cursor:
+                cursor.close()
+            self._release_db_connection(conn)
+
+    def _schema_version(self, cursor):
+        try:
+            cursor.execute("SELECT version FROM schema_version WHERE id = 1")
+        except NoSuchTableError:
+            return 0
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def _migrate_schema(self, conn, cursor):
+        if not self.backend.acquire_lock(cursor, SCHEMA_LOCK_NAME, SCHEMA_LOCK_TIMEOUT):
+            raise Exception("Outro terminal está atualizando o banco de dados; tente novamente.")
+
+        applied = []
+        try:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    id TINYINT PRIMARY KEY,
+                    version INT NOT NULL,
+                    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                );
+            ''')
+            # Relida sob a trava: outro terminal pode ter migrado enquanto esperávamos.
+            version = self._schema_version(cursor)
+            for number, migration in enumerate(self.SCHEMA_MIGRATIONS[version:], start=version + 1):
+                migration(self, cursor)
+                cursor.execute(self.backend.upsert('schema_version', ('id', 'version'), {'version': "{new}"}), (1, number))
+                conn.commit()
+                applied.append(number)
+                logger.info("Esquema do banco migrado para a versão %d.", number)
+        finally:
+            self.backend.release_lock(cursor, SCHEMA_LOCK_NAME)
+        return applied
+
+    # Migrações do esquema, em ordem; a posição na lista SCHEMA_MIGRATIONS é a versão.
+    # Bancos anteriores ao controle de versão partem da 0, então cada passo tolera
+    # encontrar o que ele cria já existente. Migrações publicadas não são editadas:
+    # mudanças novas entram como um passo a mais no fim da lista. O DDL é o do MySQL;
+    # o backend SQLite o traduz, e o banco embarcado segue os mesmos passos.
+    def _migration_initial_tables(self, cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                username VARCHAR(255) NOT NULL UNIQUE,
+                password VARCHAR(255) NOT NULL,
+                role VARCHAR(50) NOT NULL CHECK(role IN ('admin', 'comum'))
+            );
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS products (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                name VARCHAR(255) NOT NULL UNIQUE,
+                description TEXT,
+                current_quantity INT NOT NULL DEFAULT 0 CHECK(current_quantity >= 0),
+                min_quantity INT NOT NULL DEFAULT 0 CHECK(min_quantity >= 0)
+            );
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_movements (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                product_id INT NOT NULL,
+                type VARCHAR(50) NOT NULL CHECK(type IN ('entrada', 'saida')),
+                quantity INT NOT NULL CHECK(quantity > 0),
+                movement_date DATETIME NOT NULL,
+                FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+            );
+        ''')
+
+        cursor.execute("SELECT COUNT(*) FROM users WHERE role = 'admin'")
+        if cursor.fetchone()[0] == 0:
+            admin_username = "admin"
+            admin_password = "adminpass"
+            hashed_password = _hash_password(admin_password)
+
+            cursor.execute(
+                "INSERT INTO users (username, password, role) VALUES (%s, %s, %s)",
+                (admin_username, hashed_password, 'admin')
+            )
+            logger.warning("Usuário administrador padrão criado (admin/adminpass).")
+
+    def _migration_low_stock_column(self, cursor):
+        # A comparação entre duas colunas não usa índice, então o estado de estoque
+        # baixo é materializado em uma coluna gerada e indexada.
+        self._ensure_column(
+            cursor, 'products', 'is_low_stock',
+            "ADD COLUMN is_low_stock TINYINT(1) AS (current_quantity <= min_quantity AND min_quantity > 0) STORED, "
+            "ADD INDEX idx_products_low_stock (is_low_stock)"
+        )
+
+    def _migration_product_updated_at(self, cursor):
+        # Marca d'água do cache de produtos e da sincronização entre terminais.
+        self._ensure_column(
+            cursor, 'products', 'updated_at',
+            "ADD COLUMN updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6), "
+            "ADD INDEX idx_products_updated_at (updated_at)"
+        )
+
+    def _migration_movement_history(self, cursor):
+        # Consultas de histórico filtram por produto e período; sem o índice composto
+        # cada relatório percorreria a tabela inteira de movimentações.
+        self._ensure_index(
+            cursor, 'stock_movements', 'idx_movements_product_date',
+            "ADD INDEX idx_movements_product_date (product_id, movement_date)"
+        )
+        # Totais diários por produto, mantidos na mesma transação que grava cada
+        # movimentação: relatórios de meses leem dezenas de linhas, não milhares.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_movement_daily (
+                product_id INT NOT NULL,
+                day DATE NOT NULL,
+                entradas INT NOT NULL DEFAULT 0,
+                saidas INT NOT NULL DEFAULT 0,
+                movements INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (product_id, day),
+                INDEX idx_movement_daily_day (day),
+                FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+            );
+        ''')
+        cursor.execute('''
+            INSERT INTO stock_movement_daily (product_id, day, entradas, saidas, movements)
+            SELECT product_id, DATE(movement_date),
+                   SUM(CASE WHEN type = 'entrada' THEN quantity ELSE 0 END),
+                   SUM(CASE WHEN type = 'saida' THEN quantity ELSE 0 END),
+                   COUNT(*)
+            FROM stock_movements
+            GROUP BY product_id, DATE(movement_date)
+            ON DUPLICATE KEY UPDATE entradas = VALUES(entradas), saidas = VALUES(saidas), movements = VALUES(movements)
+        ''')
+
+    def _migration_product_fulltext(self, cursor):
+        # Busca no servidor para catálogos grandes demais para o índice local.
+        self._ensure_index(
+            cursor, 'products', 'ft_products_search',
+            "ADD FULLTEXT INDEX ft_products_search (name, description)"
+        )
+
+    def _migration_client_movement_id(self, cursor):
+        # Id gerado pelo terminal para movimentações do diário local: o índice único
+        # torna o reenvio de um lote idempotente.
+        self._ensure_column(
+            cursor, 'stock_movements', 'client_movement_id',
+            "ADD COLUMN client_movement_id CHAR(32) NULL, "
+            "ADD UNIQUE INDEX uq_movements_client_id (client_movement_id)"
+        )
+
+    def _migration_movement_archive(self, cursor):
+        # O arquivamento procura as movimentações mais antigas pela data.
+        self._ensure_index(
+            cursor, 'stock_movements', 'idx_movements_date',
+            "ADD INDEX idx_movements_date (movement_date)"
+        )
+        # Tabelas mensais de arquivo existentes, para consultas que cobrem períodos antigos.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_movement_archives (
+                month DATE PRIMARY KEY,
+                table_name VARCHAR(64) NOT NULL,
+                movements INT NOT NULL DEFAULT 0
+            );
+        ''')
+        # Saldo de abertura por produto: soma das movimentações já arquivadas. O estoque
+        # confere com balance + movimentações que continuam em stock_movements.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_movement_checkpoints (
+                product_id INT PRIMARY KEY,
+                balance INT NOT NULL DEFAULT 0,
+                movements INT NOT NULL DEFAULT 0,
+                archived_through DATETIME NOT NULL,
+                FOREIGN KEY (product_id) REFERENCES products(id)
+            );
+        ''')
+
+    def _migration_reconciliation_marks(self, cursor):
+        # Marcas d'água da última conciliação: a próxima confere só os produtos com
+        # movimentações ou alterações posteriores.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_reconciliation (
+                id TINYINT PRIMARY KEY,
+                movement_id BIGINT NOT NULL,
+                product_version TIMESTAMP(6) NULL,
+                reconciled_at DATETIME NOT NULL
+            );
+        ''')
+
+    def _migration_archived_client_ids(self, cursor):
+        # Ids de cliente das movimentações arquivadas: o reenvio de um lote do diário
+        # continua idempotente depois que a movimentação sai de stock_movements.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_movement_archived_client_ids (
+                client_movement_id CHAR(32) PRIMARY KEY,
+                movement_id INT NOT NULL
+            );
+        ''')
+        cursor.execute("SELECT table_name FROM stock_movement_archives")
+        for (table,) in cursor.fetchall():
+            cursor.execute(f'''
+                INSERT INTO stock_movement_archived_client_ids (client_movement_id, movement_id)
+                SELECT client_movement_id, id FROM {table} WHERE client_movement_id IS NOT NULL
+                ON DUPLICATE KEY UPDATE movement_id = VALUES(movement_id)
+            ''')
+
+    SCHEMA_MIGRATIONS = (
+        _migration_initial_tables,
+        _migration_low_stock_column,
+        _migration_product_updated_at,
+        _migration_movement_history,
+        _migration_product_fulltext,
+        _migration_client_movement_id,
+        _migration_movement_archive,
+        _migration_reconciliation_marks,
+        _migration_archived_client_ids
+    )
+
+    def _ensure_column(self, cursor, table, column, alter_clause):
+        if not self.backend.column_exists(cursor, table, column):
+            cursor.execute(f"ALTER TABLE {table} {alter_clause}")
+
+    def _ensure_index(self, cursor, table, index, alter_clause):
+        if not self.backend.index_exists(cursor, table, index):
+            cursor.execute(f"ALTER TABLE {table} {alter_clause}")
+
+    def _execute_query(self, query, params=(), fetch_one=False):
+        is_select = query.strip().lower().startswith('select')
+        caller = sys._getframe(1)
+        # Uma leitura que falha por conexão perdida é repetida uma vez com conexão nova.
+        attempts = 2 if is_select else 1
+        for attempt in range(attempts):
+            start = time.perf_counter()
+            try:
+                conn = self._get_db_connection()
+            except Exception:
+                self.metrics.record(query, caller, connect=time.perf_counter() - start, error=True)
+                raise
+            connected = time.perf_counter()
+            executed = None
+            cursor = conn.cursor(dictionary=True, buffered=True)
+            results = None
+            discard = False
+            try:
+                cursor.execute(query, params)
+                conn.commit()
+                executed = time.perf_counter()
+
+                if is_select:
+                    results = cursor.fetchone() if fetch_one else cursor.fetchall()
+                    rows = 0 if results is None else (1 if fetch_one else len(results))
+                else:
+                    rows = cursor.rowcount
+                self.metrics.record(
+                    query, caller, connected - start, executed - connected, time.perf_counter() - executed, rows
+                )
+                return results
+            except Error as e:
+                now = time.perf_counter()
+                self.metrics.record(
+                    query, caller, connected - start, (executed or now) - connected,
+                    now - executed if executed else 0.0, error=True
+                )
+                if isinstance(e, OperationalError):
+                    discard = True
+                    if attempt + 1 < attempts:
+                        continue
+                    raise Exception(f"Erro ao executar query: {e}")
+                if isinstance(e, IntegrityError) and e.key in ('username', 'name'):
+                     raise ValueError(f"Erro de integridade: Nome já existe ou duplicado.")
+                else:
+                    raise Exception(f"Erro ao executar query: {e}")
+            finally:
+                try:
+                    cursor.close()
+                except Error:
+                    discard = True
+                self._release_db_connection(conn, discard=discard)
+
+    def authenticate_user(self, username, password):
+        user = self._execute_query("SELECT id, username, password, role FROM users WHERE username = %s", (username,), fetch_one=True)
+        if user:
+            if _check_password(user['password'], password):
+                if _password_needs_rehash(user['password']):
+                    self._rehash_password(user['id'], user['password'], password)
+                return user['id'], user['role']
+        return None, None
+
+    def _rehash_password(self, user_id, old_hash, password):
+        # Só substitui o hash verificado: se a senha foi trocada nesse meio-tempo, nada muda.
+        try:
+            self._execute_query(
+                "UPDATE users SET password = %s WHERE id = %s AND password = %s",
+                (_hash_password(password), user_id, old_hash)
+            )
+        except Exception as e:
+            logger.warning("Não foi possível atualizar o hash da senha do usuário %s: %s", user_id, e)
+
+    def register_user(self, username, password, role):
+        if not username or not password:
+            return False, "Nome de usuário e senha são obrigatórios."
+
+        hashed_password = _hash_password(password)
+        try:
+            self._execute_query(
+                "INSERT INTO users (username, password, role) VALUES (%s, %s, %s)",
+                (username, hashed_password, role)
+            )
+            return True, "Usuário registrado com sucesso."
+        except ValueError as e:
+            return False, str(e)
+        except Exception as e:
+            return False, f"Erro inesperado: {e}"
+
+    def add_product(self, name, description, min_quantity):
+        if not name:
+            return False, "Nome do produto é obrigatório."
+        try:
+            min_quantity = int(min_quantity)
+            if min_quantity < 0:
+                return False, "Quantidade mínima não pode ser negativa."
+        except ValueError:
+            return False, "Quantidade mínima deve ser um número inteiro."
+
+        try:
+            self._execute_query(
+                "INSERT INTO products (name, description, min_quantity) VALUES (%s, %s, %s)",
+                (name, description, min_quantity)
+            )
+            return True, "Produto adicionado com sucesso."
+        except ValueError as e:
+            return False, str(e)
+        except Exception as e:
+            return False, f"Erro inesperado: {e}"
+
+    def get_all_products(self):
+        return self._execute_query(f"SELECT {PRODUCT_COLUMNS} FROM products ORDER BY id")
+
+    def _check_product_version(self, force=False):
+        # Detecta escritas de outros terminais pela marca d'água products.updated_at
+        # (índice) e invalida só as linhas alteradas desde a última verificação.
+        now = time.monotonic()
+        if not force and now - self._product_version_checked_at < CACHE_CONFIG['version_check_interval']:
+            return
+        if not self._product_version_lock.acquire(blocking=False):
+            return
+        try:
+            if self._product_version is None:
+                row = self._execute_query("SELECT MAX(updated_at) AS version FROM products", fetch_one=True)
+                self.product_cache.clear()
+                self._product_version = _timestamp(row['version']) if row and row['version'] else datetime(1970, 1, 1)
+            else:
+                changed = self._execute_query(
+                    "SELECT id, updated_at FROM products WHERE updated_at > %s",
+                    (self._product_version - VERSION_OVERLAP,)
+                ) or []
+                for row in changed:
+                    self.product_cache.invalidate(row['id'])
+                    self._product_version = max(self._product_version, row['updated_at'])
+            self._product_version_checked_at = now
+        finally:
+            self._product_version_lock.release()
+
+    def get_product(self, product_id):
+        self._check_product_version()
+        product = self.product_cache.get(product_id)
+        if product is None:
+            product = self._execute_query(f"SELECT {PRODUCT_COLUMNS} FROM products WHERE id = %s", (product_id,), fetch_one=True)
+            if product:
+                self.product_cache.put(product)
+        return product
+
+    def get_products(self, product_ids):
+        self._check_product_version()
+        products = {}
+        missing = []
+        for product_id in product_ids:
+            product = self.product_cache.get(product_id)
+            if product is None:
+                missing.append(product_id)
+            else:
+                products[product_id] = product
+
+        if missing:
+            placeholders = ", ".join(["%s"] * len(missing))
+            rows = self._execute_query(f"SELECT {PRODUCT_COLUMNS} FROM products WHERE id IN ({placeholders})", tuple(missing)) or []
+            for product in rows:
+                self.product_cache.put(product)
+                products[product['id']] = product
+        return products
+
+    def get_sync_marks(self):
+        row = self._execute_query(
+            "SELECT (SELECT COALESCE(MAX(id), 0) FROM stock_movements) AS movement_id, "
+            "(SELECT MAX(updated_at) FROM products) AS product_version",
+            fetch_one=True
+        )
+        movement_id = row['movement_id']
+        # A próxima leitura relê a janela de sobreposição abaixo da marca; os ids que já
+        # existiam nela não são novidade.
+        recent = self._execute_query(
+            "SELECT id FROM stock_movements WHERE id > %s AND id <= %s",
+            (max(movement_id - MOVEMENT_OVERLAP_ROWS, 0), movement_id)
+        ) or []
+        return {
+            'movement_id': movement_id,
+            'product_version': _timestamp(row['product_version']) or datetime(1970, 1, 1),
+            'recent_movement_ids': frozenset(r['id'] for r in recent)
+        }
+
+    def fetch_changes(self, marks, limit=None):
+        # Feed de alterações: movimentações com id acima da marca e produtos com
+        # updated_at acima da marca, ambos servidos por índice; custo O(alterações).
+        limit = limit or SYNC_CONFIG['max_movements']
+        rows = self._execute_query(
+            "SELECT id, product_id, type, quantity, movement_date FROM stock_movements WHERE id > %s ORDER BY id LIMIT %s",
+            (max(marks['movement_id'] - MOVEMENT_OVERLAP_ROWS, 0), limit + MOVEMENT_OVERLAP_ROWS)
+        ) or []
+        movements = [m for m in rows if m['id'] not in marks['recent_movement_ids']]
+        movement_id = max([marks['movement_id']] + [m['id'] for m in rows])
+        recent_movement_ids = frozenset(
+            movement['id'] for movement in rows if movement['id'] > movement_id - MOVEMENT_OVERLAP_ROWS
+        ) | frozenset(i for i in marks['recent_movement_ids'] if i > movement_id - MOVEMENT_OVERLAP_ROWS)
+
+        products = self._execute_query(
+            f"SELECT {PRODUCT_COLUMNS}, updated_at FROM products WHERE updated_at > %s",
+            (marks['product_version'] - VERSION_OVERLAP,)
+        ) or []
+        product_version = marks['product_version']
+        for product in products:
+            product_version = max(product_version, product.pop('updated_at'))
+            self.product_cache.put(product)
+
+        # Produtos movimentados que não vieram pela marca de updated_at.
+        moved_ids = {m['product_id'] for m in movements} - {p['id'] for p in products}
+        for product_id in moved_ids:
+            self.product_cache.invalidate(product_id)
+        if moved_ids:
+            products.extend(self.get_products(sorted(moved_ids)).values())
+
+        return {
+            'movements': movements,
+            'products': products,
+            'marks': {
+                'movement_id': movement_id,
+                'product_version': product_version,
+                'recent_movement_ids': recent_movement_ids
+            }
+        }
+
+    def get_products_page(self, sort_key='id', descending=False, boundary=None, backward=False, inclusive=False, limit=PRODUCT_PAGE_SIZE):
+        if sort_key not in PRODUCT_SORT_COLUMNS:
+            raise ValueError(f"Ordenação inválida: {sort_key}.")
+
+        ascending = descending == backward
+        where = ""
+        params = []
+        if boundary is not None:
+            operator = ">" if ascending else "<"
+            if inclusive:
+                operator += "="
+            where = f"WHERE {sort_key} {operator} %s"
+            params.append(boundary)
+        params.append(limit)
+
+        products = self._execute_query(
+            f"SELECT {PRODUCT_COLUMNS} FROM products {where} ORDER BY {sort_key} {'ASC' if ascending else 'DESC'} LIMIT %s",
+            tuple(params)
+        ) or []
+        for product in products:
+            self.product_cache.put(product)
+        if backward:
+            products.reverse()
+        return products
+
+    def update_product(self, product_id, name, description, min_quantity):
+        if not name:
+            return False, "Nome do produto é obrigatório."
+        try:
+            min_quantity = int(min_quantity)
+            if min_quantity < 0:
+                return False, "Quantidade mínima não pode ser negativa."
+        except ValueError:
+            return False, "Quantidade mínima deve ser um número inteiro."
+
+        try:
+            self._execute_query(
+                "UPDATE products SET name = %s, description = %s, min_quantity = %s WHERE id = %s",
+                (name, description, min_quantity, product_id)
+            )
+            self.product_cache.invalidate(product_id)
+            return True, "Produto atualizado com sucesso."
+        except ValueError as e:
+            return False, str(e)
+        except Exception as e:
+            return False, f"Erro inesperado: {e}"
+
+    def _apply_movement(self, product_id, movement_type, quantity):
+        conn = self._get_db_connection()
+        cursor = conn.cursor()
+        discard = False
+        try:
+            # Delta e registro no histórico na mesma transação; a condição do UPDATE
+            # impede que duas saídas simultâneas deixem o estoque negativo.
+            if movement_type == 'entrada':
+                self._execute_on_cursor(
+                    cursor,
+                    "UPDATE products SET current_quantity = current_quantity + %s WHERE id = %s",
+                    (quantity, product_id)
+                )
+            else:
+                self._execute_on_cursor(
+                    cursor,
+                    "UPDATE products SET current_quantity = current_quantity - %s WHERE id = %s AND current_quantity >= %s",
+                    (quantity, product_id, quantity)
+                )
+
+            if cursor.rowcount == 0:
+                conn.rollback()
+                if movement_type == 'saida':
+                    self._execute_on_cursor(cursor, "SELECT 1 FROM products WHERE id = %s", (product_id,))
+                    exists = cursor.fetchone() is not None
+                    conn.rollback()
+                    if exists:
+                        return False, "Quantidade insuficiente em estoque."
+                return False, "Produto não encontrado."
+
+            movement_date = datetime.now()
+            self._execute_on_cursor(
+                cursor,
+                "INSERT INTO stock_movements (product_id, type, quantity, movement_date) VALUES (%s, %s, %s, %s)",
+                (product_id, movement_type, quantity, movement_date.strftime('%Y-%m-%d %H:%M:%S'))
+            )
+            self._add_daily_totals(cursor, [(product_id, movement_date.date(), movement_type, quantity)])
+            # Linha já travada pelo UPDATE: devolve o estado final para a interface
+            # atualizar só este produto, sem recarregar a tabela.
+            self._execute_on_cursor(cursor, f"SELECT {PRODUCT_COLUMNS} FROM products WHERE id = %s", (product_id,))
+            product = dict(zip(cursor.column_names, cursor.fetchone()))
+            conn.commit()
+            self.product_cache.put(product)
+        except Error as e:
+            try:
+                conn.rollback()
+            except Error:
+                discard = True
+            raise Exception(f"Erro ao registrar movimentação: {e}")
+        finally:
+            try:
+                cursor.close()
+            except Error:
+                discard = True
+            self._release_db_connection(conn, discard=discard)
+        # Só depois de devolver a conexão: a atualização do índice pega _search_lock, e
+        # quem segura _search_lock não pode ficar esperando conexão do pool.
+        self._index_product(product)
+        return True, product
+
+    def _add_daily_totals(self, cursor, movements):
+        # Chamado dentro da transação da movimentação, com as linhas dos produtos já
+        # travadas pelo UPDATE; recebe (produto, dia, tipo, quantidade).
+        totals = {}
+        for product_id, day, movement_type, quantity in movements:
+            entry = totals.setdefault((product_id, day), [0, 0, 0])
+            entry[0 if movement_type == 'entrada' else 1] += quantity
+            entry[2] += 1
+        self._execute_on_cursor(
+            cursor,
+            self.backend.upsert(
+                'stock_movement_daily', ('product_id', 'day', 'entradas', 'saidas', 'movements'),
+                {'entradas': "entradas + {new}", 'saidas': "saidas + {new}", 'movements': "movements + {new}"}
+            ),
+            [(product_id, day, entradas, saidas, count) for (product_id, day), (entradas, saidas, count) in sorted(totals.items())],
+            many=True
+        )
+
+    def record_movement(self, product_id, movement_type, quantity):
+        messages = MOVEMENT_MESSAGES[movement_type]
+        try:
+            quantity = int(quantity)
+            if quantity <= 0:
+                return False, messages['invalid'], None
+            if quantity > MAX_MOVEMENT_QUANTITY:
+                return False, QUANTITY_LIMIT_MESSAGE, None
+        except ValueError:
+            return False, "Quantidade deve ser um número inteiro.", None
+
+        try:
+            success, result = self._apply_movement(product_id, movement_type, quantity)
+            if not success:
+                return False, result, None
+            return True, messages['success'], result
+        except Exception as e:
+            return False, f"{messages['error']}: {e}", None
+
+    def add_stock(self, product_id, quantity):
+        return self.record_movement(product_id, 'entrada', quantity)[:2]
+
+    def remove_stock(self, product_id, quantity):
+        return self.record_movement(product_id, 'saida', quantity)[:2]
+
+    def _normalize_movement(self, movement):
+        try:
+            product_id, movement_type, quantity = movement
+            product_id = int(product_id)
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            raise ValueError("Linha inválida: esperado produto, tipo e quantidade inteiros.")
+
+        movement_type = str(movement_type).strip().lower().replace('í', 'i')
+        if movement_type not in ('entrada', 'saida'):
+            raise ValueError(f"Tipo de movimentação inválido: {movement_type}.")
+        if quantity <= 0:
+            raise ValueError("Quantidade deve ser um número inteiro positivo.")
+        if quantity > MAX_MOVEMENT_QUANTITY:
+            raise ValueError(QUANTITY_LIMIT_MESSAGE)
+        return product_id, movement_type, quantity
+
+    def _write_movements(self, cursor, movements, failures):
+        # Dentro de uma transação aberta: trava os produtos, confere os saldos e grava
+        # deltas, histórico e totais diários. movements: (referência, produto, tipo,
+        # quantidade, id do cliente ou None, data). Recusas vão para failures; devolve
+        # os deltas por produto e a quantidade de movimentações gravadas.
+        deltas = {}
+        if not movements:
+            return deltas, 0
+        # Ids ordenados: terminais importando lotes sobrepostos travam as linhas na mesma ordem.
+        product_ids = sorted({pid for _, pid, _, _, _, _ in movements})
+        placeholders = ", ".join(["%s"] * len(product_ids))
+        self._execute_on_cursor(
+            cursor,
+            f"SELECT id, current_quantity FROM products WHERE id IN ({placeholders}) FOR UPDATE",
+            product_ids
+        )
+        balances = dict(cursor.fetchall())
+
+        ledger_rows = []
+        for ref, pid, mtype, qty, client_id, movement_date in movements:
+            if pid not in balances:
+                failures.append((ref, (pid, mtype, qty), "Produto não encontrado."))
+                continue
+            delta = qty if mtype == 'entrada' else -qty
+            if balances[pid] + delta < 0:
+                failures.append((ref, (pid, mtype, qty), "Quantidade insuficiente em estoque."))
+                continue
+            balances[pid] += delta
+            deltas[pid] = deltas.get(pid, 0) + delta
+            ledger_rows.append((pid, mtype, qty, movement_date, client_id))
+
+        if deltas:
+            cases = " ".join(["WHEN %s THEN %s"] * len(deltas))
+            params = [value for pid, delta in deltas.items() for value in (pid, delta)]
+            params.extend(deltas.keys())
+            self._execute_on_cursor(
+                cursor,
+                f"UPDATE products SET current_quantity = current_quantity + CASE id {cases} END "
+                f"WHERE id IN ({', '.join(['%s'] * len(deltas))})",
+                params
+            )
+        if ledger_rows:
+            self._execute_on_cursor(
+                cursor,
+                "INSERT INTO stock_movements (product_id, type, quantity, movement_date, client_movement_id) VALUES (%s, %s, %s, %s, %s)",
+                ledger_rows, many=True
+            )
+            self._add_daily_totals(cursor, [(pid, movement_date.date(), mtype, qty) for pid, mtype, qty, movement_date, _ in ledger_rows])
+        return deltas, len(ledger_rows)
+
+    def _apply_movement_chunk(self, chunk, failures):
+        # chunk: lista de (referência, movimentação). Falhas individuais vão para
+        # failures sem abortar o lote; retorna a quantidade aplicada.
+        valid = []
+        for ref, movement in chunk:
+            try:
+                valid.append((ref,) + self._normalize_movement(movement))
+            except ValueError as e:
+                failures.append((ref, movement, str(e)))
+        if not valid:
+            return 0
+
+        movement_date = datetime.now().replace(microsecond=0)
+        try:
+            return self._write_movement_chunk(valid, movement_date, failures)
+        except ServiceUnavailableError as e:
+            failures.extend((ref, (pid, mtype, qty), str(e)) for ref, pid, mtype, qty in valid)
+            return 0
+        except Error as e:
+            if len(valid) == 1:
+                ref, pid, mtype, qty = valid[0]
+                failures.append((ref, (pid, mtype, qty), f"Recusada pelo banco: {e}"))
+                return 0
+        # Como em apply_journal_batch: o erro veio de alguma linha (gatilho, restrição,
+        # saldo fora do intervalo da coluna) e desfez o lote; uma a uma, só a recusada
+        # vira falha e as demais são aplicadas.
+        applied = 0
+        for ref, pid, mtype, qty in valid:
+            try:
+                applied += self._write_movement_chunk([(ref, pid, mtype, qty)], movement_date, failures)
+            except ServiceUnavailableError as e:
+                failures.append((ref, (pid, mtype, qty), str(e)))
+            except Error as e:
+                failures.append((ref, (pid, mtype, qty), f"Recusada pelo banco: {e}"))
+        return applied
+
+    def _write_movement_chunk(self, valid, movement_date, failures):
+        # Uma transação; falha de conexão ou de trava vira ServiceUnavailableError, os
+        # demais erros do banco propagam. As recusas só entram em failures se o lote
+        # for gravado.
+        conn = self._get_db_connection()
+        cursor = conn.cursor()
+        discard = False
+        try:
+            refused = []
+            deltas, written = self._write_movements(
+                cursor, [(ref, pid, mtype, qty, None, movement_date) for ref, pid, mtype, qty in valid], refused
+            )
+            conn.commit()
+            failures.extend(refused)
+            for pid in deltas:
+                self.product_cache.invalidate(pid)
+            return written
+        except Error as e:
+            try:
+                conn.rollback()
+            except Error:
+                discard = True
+            if isinstance(e, OperationalError):
+                discard = True
+                raise ServiceUnavailableError(f"Erro no lote: {e}") from e
+            raise
+        finally:
+            try:
+                cursor.close()
+            except Error:
+                discard = True
+            self._release_db_connection(conn, discard=discard)
+
+    def apply_movements_batch(self, movements, chunk_size=MOVEMENT_BATCH_SIZE):
+        applied = 0
+        failures = []
+        chunk = []
+        for index, movement in enumerate(movements):
+            chunk.append((index, movement))
+            if len(chunk) >= chunk_size:
+                applied += self._apply_movement_chunk(chunk, failures)
+                chunk = []
+        if chunk:
+            applied += self._apply_movement_chunk(chunk, failures)
+        return applied, failures
+
+    def apply_journal_batch(self, entries):
+        # entries: (id do cliente, produto, tipo, quantidade, data) do diário local de um
+        # terminal. Idempotente: ids que já estão em stock_movements (ou arquivados)
+        # contam como aplicados, então reenviar um lote interrompido não duplica nada.
+        # Banco fora do ar ou travado levanta ServiceUnavailableError e o lote é
+        # reenviado mais tarde; devolve os conflitos (id do cliente, motivo) das
+        # movimentações recusadas.
+        conflicts = []
+        movements = []
+        for client_id, *movement, movement_date in entries:
+            try:
+                movements.append((client_id,) + self._normalize_movement(movement) + (client_id, movement_date))
+            except ValueError as e:
+                conflicts.append((client_id, str(e)))
+        if not movements:
+            return conflicts
+
+        try:
+            return conflicts + self._apply_journal_movements(movements)
+        except Error as e:
+            if len(movements) == 1:
+                return conflicts + [(movements[0][0], f"Recusada pelo banco: {e}")]
+        # Outro erro do banco vem de alguma das movimentações (ex.: saldo fora do
+        # intervalo da coluna) e desfez o lote: uma a uma, só a recusada vira conflito
+        # e as seguintes não ficam presas atrás dela.
+        for movement in movements:
+            try:
+                conflicts.extend(self._apply_journal_movements([movement]))
+            except Error as e:
+                conflicts.append((movement[0], f"Recusada pelo banco: {e}"))
+        return conflicts
+
+    def _apply_journal_movements(self, movements):
+        # Uma transação; erros de conexão e de trava viram ServiceUnavailableError, os
+        # demais erros do banco propagam.
+        conn = self._get_db_connection()
+        cursor = conn.cursor()
+        discard = False
+        try:
+            client_ids = [movement[0] for movement in movements]
+            placeholders = ", ".join(["%s"] * len(client_ids))
+            self._execute_on_cursor(
+                cursor,
+                f"SELECT client_movement_id FROM stock_movements WHERE client_movement_id IN ({placeholders}) UNION ALL "
+                f"SELECT client_movement_id FROM stock_movement_archived_client_ids WHERE client_movement_id IN ({placeholders})",
+                client_ids * 2
+            )
+            applied = {row[0] for row in cursor.fetchall()}
+            failures = []
+            deltas, _ = self._write_movements(cursor, [m for m in movements if m[0] not in applied], failures)
+            conn.commit()
+            for pid in deltas:
+                self.product_cache.invalidate(pid)
+            return [(client_id, reason) for client_id, _, reason in failures]
+        except Error as e:
+            try:
+                conn.rollback()
+            except Error:
+                discard = True
+            if isinstance(e, OperationalError):
+                discard = True
+                raise ServiceUnavailableError(f"Erro ao enviar movimentações pendentes: {e}") from e
+            raise
+        finally:
+            try:
+                cursor.close()
+            except Error:
+                discard = True
+            self._release_db_connection(conn, discard=discard)
+
+    def _read_movements_csv(self, path):
+        # Gerador: lê o arquivo linha a linha, então a memória não cresce com o tamanho da carga.
+        # utf-8-sig descarta o BOM que o Excel grava no início do arquivo.
+        with open(path, newline='', encoding='utf-8-sig') as csv_file:
+            reader = csv.reader(csv_file)
+            first = True
+            for row in reader:
+                if not row or not any(cell.strip() for cell in row):
+                    continue
+                if first:
+                    # Cabeçalho só na primeira linha com conteúdo, mesmo após linhas em branco.
+                    first = False
+                    if not row[0].strip().isdigit():
+                        continue
+                yield reader.line_num, [cell.strip() for cell in row]
+
+    def import_movements_csv(self, path, chunk_size=MOVEMENT_BATCH_SIZE):
+        applied = 0
+        failures = []
+        chunk = []
+        try:
+            for line_num, row in self._read_movements_csv(path):
+                chunk.append((line_num, row))
+                if len(chunk) >= chunk_size:
+                    applied += self._apply_movement_chunk(chunk, failures)
+                    chunk = []
+            if chunk:
+                applied += self._apply_movement_chunk(chunk, failures)
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            failures.append((None, None, f"Erro ao ler o arquivo: {e}"))
+        return applied, failures
+
+    def _read_users_csv(self, path):
+        with open(path, newline='', encoding='utf-8-sig') as csv_file:
+            reader = csv.reader(csv_file)
+            first = True
+            for row in reader:
+                if not row or not any(cell.strip() for cell in row):
+                    continue
+                row = [cell.strip() for cell in row]
+                if first:
+                    first = False
+                    if row[0].lower() in ('usuario', 'usuário', 'username'):
+                        continue # cabeçalho
+                yield reader.line_num, row
+
+    def _hash_passwords(self, passwords):
+        # O hash é limitado por CPU e o GIL o prende a um núcleo, então a importação usa
+        # processos. 'spawn' porque o app já tem threads (Tk, pool) e um fork copiaria
+        # travas em uso por elas.
+        hash_password = partial(_hash_password, method=PASSWORD_CONFIG['method'], salt_length=PASSWORD_CONFIG['salt_length'])
+        workers = min(PASSWORD_CONFIG['import_workers'] or os.cpu_count() or 1, len(passwords))
+        if workers <= 1:
+            return [hash_password(password) for password in passwords]
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            return list(executor.map(hash_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+    def _existing_usernames(self, usernames):
+        # Em casefold: username não diferencia maiúsculas nos dois bancos (collation
+        # _ci no MySQL, NOCASE no SQLite).
+        existing = set()
+        for start in range(0, len(usernames), USER_IMPORT_BATCH_SIZE):
+            batch = usernames[start:start + USER_IMPORT_BATCH_SIZE]
+            rows = self._execute_query(
+                f"SELECT username FROM users WHERE username IN ({', '.join(['%s'] * len(batch))})", batch
+            ) or []
+            existing.update(row['username'].casefold() for row in rows)
+        return existing
+
+    def _insert_users_batch(self, batch, failures):
+        try:
+            conn = self._get_db_connection()
+        except Exception as e:
+            failures.extend((line_num, username, str(e)) for line_num, username, _, _ in batch)
+            return 0
+
+        cursor = conn.cursor()
+        discard = False
+        try:
+            self._execute_on_cursor(
+                cursor,
+                "INSERT INTO users (username, password, role) VALUES (%s, %s, %s)",
+                [(username, password_hash, role) for _, username, password_hash, role in batch], many=True
+            )
+            conn.commit()
+            return len(batch)
+        except Error as e:
+            try:
+                conn.rollback()
+            except Error:
+                discard = True
+            if len(batch) == 1:
+                line_num, username, _, _ = batch[0]
+                failures.append((line_num, username, "Usuário já existe." if isinstance(e, IntegrityError) else f"Erro ao inserir: {e}"))
+                return 0
+        finally:
+            try:
+                cursor.close()
+            except Error:
+                discard = True
+            self._release_db_connection(conn, discard=discard)
+        # Um conflito (ex.: usuário criado por outro terminal no meio da importação)
+        # desfaz o lote inteiro: as linhas vão uma a uma, e só a recusada falha.
+        return sum(self._insert_users_batch([user], failures) for user in batch)
+
+    def import_users_csv(self, path, batch_size=USER_IMPORT_BATCH_SIZE):
+        # Arquivo com usuario,senha[,perfil]; devolve (criados, falhas) como a
+        # importação de movimentações, com falhas (linha, usuário, motivo).
+        failures = []
+        users = []
+        seen = set()
+        try:
+            for line_num, row in self._read_users_csv(path):
+                username = row[0]
+                password = row[1] if len(row) > 1 else ""
+                role = row[2] if len(row) > 2 and row[2] else 'comum'
+                if not username or not password:
+                    failures.append((line_num, username, "Nome de usuário e senha são obrigatórios."))
+                elif role not in ('admin', 'comum'):
+                    failures.append((line_num, username, f"Perfil inválido: {role}."))
+                elif username.casefold() in seen:
+                    failures.append((line_num, username, "Usuário repetido no arquivo."))
+                else:
+                    seen.add(username.casefold())
+                    users.append((line_num, username, password, role))
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            return 0, [(None, None, f"Erro ao ler o arquivo: {e}")]
+
+        # Usuários já cadastrados saem antes do hash, que é a parte cara da importação.
+        existing = self._existing_usernames([username for _, username, _, _ in users])
+        failures.extend((line_num, username, "Usuário já existe.") for line_num, username, _, _ in users if username.casefold() in existing)
+        users = [user for user in users if user[1].casefold() not in existing]
+
+        password_hashes = self._hash_passwords([password for _, _, password, _ in users])
+        users = [(line_num, username, password_hash, role) for (line_num, username, _, role), password_hash in zip(users, password_hashes)]
+
+        created = 0
+        for start in range(0, len(users), batch_size):
+            created += self._insert_users_batch(users[start:start + batch_size], failures)
+        failures.sort(key=lambda failure: failure[0] or 0)
+        return created, failures
+
+    def get_movement_history(self, product_id, start, end, limit=HISTORY_RECENT_LIMIT):
+        # Movimentações de um produto entre os dias start e end (inclusive), mais
+        # recentes primeiro; percorre só o trecho do índice (product_id, movement_date)
+        # de stock_movements e das tabelas de arquivo que cobrem o período.
+        select = (
+            "SELECT id, type, quantity, movement_date FROM {table} "
+            "WHERE product_id = %s AND movement_date >= %s AND movement_date < %s "
+            "ORDER BY movement_date DESC, id DESC LIMIT %s"
+        )
+        params = (product_id, start, end + timedelta(days=1), limit)
+        tables = self._movement_tables(start, end)
+        if len(tables) == 1:
+            return self._execute_query(select.format(table=tables[0]), params) or []
+        union = self.backend.union_all([select.format(table=table) for table in tables])
+        return self._execute_query(
+            f"SELECT * FROM ({union}) AS history ORDER BY movement_date DESC, id DESC LIMIT %s", params * len(tables) + (limit,)
+        ) or []
+
+    def _movement_tables(self, start=None, end=None):
+        # Tabelas com movimentações entre os dias start e end, mais antigas primeiro:
+        # as mensais de arquivo que cobrem o período e, por último, stock_movements.
+        conditions, params = [], []
+        if start is not None:
+            conditions.append("month >= %s")
+            params.append(start.replace(day=1))
+        if end is not None:
+            conditions.append("month <= %s")
+            params.append(end)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._execute_query(f"SELECT table_name FROM stock_movement_archives{where} ORDER BY month", tuple(params)) or []
+        return [row['table_name'] for row in rows] + ['stock_movements']
+
+    def _create_archive_table(self, conn, cursor, month):
+        # DDL encerra a transação implicitamente, então roda fora dos lotes.
+        table = f"stock_movements_{month:%Y%m}"
+        self.backend.create_table_like(cursor, table, 'stock_movements', ARCHIVE_CONFIG['row_format'])
+        cursor.execute(
+            self.backend.upsert('stock_movement_archives', ('month', 'table_name'), {'table_name': "{new}"}), (month, table)
+        )
+        conn.commit()
+        return table
+
+    def _archive_batch(self, conn, cursor, cutoff, batch_size, tables):
+        # Um lote em uma transação curta: copia as linhas para as tabelas mensais, soma
+        # o saldo delas aos pontos de controle e as apaga de stock_movements. Só as
+        # linhas do lote ficam travadas; produtos e movimentações novas seguem livres.
+        self._execute_on_cursor(
+            cursor,
+            "SELECT id, product_id, type, quantity, movement_date, client_movement_id FROM stock_movements "
+            "WHERE movement_date < %s ORDER BY movement_date, id LIMIT %s FOR UPDATE",
+            (cutoff, batch_size)
+        )
+        rows = cursor.fetchall()
+        missing = {row[4].date().replace(day=1) for row in rows} - tables.keys()
+        if missing:
+            conn.rollback()
+            for month in sorted(missing):
+                tables[month] = self._create_archive_table(conn, cursor, month)
+            return self._archive_batch(conn, cursor, cutoff, batch_size, tables)
+        if not rows:
+            conn.commit()
+            return 0
+
+        by_month = {}
+        checkpoints = {}
+        for row in rows:
+            product_id, movement_type, quantity, movement_date = row[1:5]
+            by_month.setdefault(movement_date.date().replace(day=1), []).append(row)
+            checkpoint = checkpoints.setdefault(product_id, [0, 0, movement_date])
+            checkpoint[0] += quantity if movement_type == 'entrada' else -quantity
+            checkpoint[1] += 1
+            checkpoint[2] = max(checkpoint[2], movement_date)
+
+        for month, month_rows in sorted(by_month.items()):
+            self._execute_on_cursor(
+                cursor,
+                f"INSERT INTO {tables[month]} (id, product_id, type, quantity, movement_date, client_movement_id) "
+                "VALUES (%s, %s, %s, %s, %s, %s)",
+                month_rows, many=True
+            )
+            self._execute_on_cursor(
+                cursor, "UPDATE stock_movement_archives SET movements = movements + %s WHERE month = %s", (len(month_rows), month)
+            )
+        client_ids = [(row[5], row[0]) for row in rows if row[5] is not None]
+        if client_ids:
+            self._execute_on_cursor(
+                cursor,
+                "INSERT INTO stock_movement_archived_client_ids (client_movement_id, movement_id) VALUES (%s, %s)",
+                client_ids, many=True
+            )
+        self._execute_on_cursor(
+            cursor,
+            self.backend.upsert(
+                'stock_movement_checkpoints', ('product_id', 'balance', 'movements', 'archived_through'),
+                {'balance': "balance + {new}", 'movements': "movements + {new}", 'archived_through': "{greatest}(archived_through, {new})"}
+            ),
+            [(product_id,) + tuple(values) for product_id, values in sorted(checkpoints.items())], many=True
+        )
+        ids = [row[0] for row in rows]
+        self._execute_on_cursor(cursor, f"DELETE FROM stock_movements WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+        conn.commit()
+        return len(rows)
+
+    def archive_movements(self, horizon_days=None, batch_size=None, pause=None):
+        # Move as movimentações anteriores ao horizonte (dias completos) para as tabelas
+        # mensais, lote a lote. A cada commit vale current_quantity = saldo do ponto de
+        # controle + movimentações em stock_movements. Totais diários, histórico e
+        # exportação continuam cobrindo o período arquivado. Devolve quantas
+        # movimentações foram arquivadas.
+        horizon_days = ARCHIVE_CONFIG['horizon_days'] if horizon_days is None else horizon_days
+        batch_size = batch_size or ARCHIVE_CONFIG['batch_size']
+        pause = ARCHIVE_CONFIG['pause'] if pause is None else pause
+        cutoff = datetime.combine(date.today() - timedelta(days=horizon_days), datetime.min.time())
+
+        conn = self._get_db_connection()
+        cursor = conn.cursor()
+        discard = False
+        try:
+            if not self.backend.acquire_lock(cursor, ARCHIVE_LOCK_NAME, 0):
+                raise Exception("Outro terminal já está arquivando movimentações.")
+            try:
+                cursor.execute("SELECT month, table_name FROM stock_movement_archives")
+                tables = dict(cursor.fetchall())
+                conn.commit()
+                archived = 0
+                while True:
+                    count = self._archive_batch(conn, cursor, cutoff, batch_size, tables)
+                    archived += count
+                    if count < batch_size:
+                        return archived
+                    time.sleep(pause)
+            finally:
+                self.backend.release_lock(cursor, ARCHIVE_LOCK_NAME)
+        except Error as e:
+            try:
+                conn.rollback()
+            except Error:
+                discard = True
+            raise Exception(f"Erro ao arquivar movimentações: {e}")
+        finally:
+            try:
+                cursor.close()
+            except Error:
+                discard = True
+            self._release_db_connection(conn, discard=discard)
+
+    def get_product_trend(self, product_id, start, end, granularity='week'):
+        # Totais por dia, semana ou mês lidos da tabela diária, com zeros nos períodos
+        # sem movimentação para que a tendência não tenha buracos.
+        if granularity not in HISTORY_GRANULARITIES:
+            raise ValueError(f"Agrupamento inválido: {granularity}.")
+        rows = self._execute_query(
+            "SELECT day, entradas, saidas, movements FROM stock_movement_daily "
+            "WHERE product_id = %s AND day BETWEEN %s AND %s ORDER BY day",
+            (product_id, start, end)
+        ) or []
+
+        periods = OrderedDict()
+        day = start
+        while day <= end:
+            periods.setdefault(_history_period(day, granularity), {'entradas': 0, 'saidas': 0, 'movements': 0})
+            day += timedelta(days=1)
+        for row in rows:
+            totals = periods[_history_period(row['day'], granularity)]
+            for column in ('entradas', 'saidas', 'movements'):
+                totals[column] += int(row[column])
+        return [dict(period=period, **totals) for period, totals in periods.items()]
+
+    def get_consumption_report(self, start, end):
+        # Entradas e saídas de todos os produtos no período, também a partir da tabela diária.
+        rows = self._execute_query(
+            "SELECT d.product_id, p.name, SUM(d.entradas) AS entradas, SUM(d.saidas) AS saidas, SUM(d.movements) AS movements "
+            "FROM stock_movement_daily d JOIN products p ON p.id = d.product_id "
+            "WHERE d.day BETWEEN %s AND %s GROUP BY d.product_id, p.name ORDER BY saidas DESC, d.product_id",
+            (start, end)
+        ) or []
+        for row in rows:
+            for column in ('entradas', 'saidas', 'movements'):
+                row[column] = int(row[column])
+        return rows
+
+    def _read_forecast_snapshot(self, first_day, on_products, on_saidas):
+        # Lê produtos e saídas diárias em um snapshot consistente, em lotes e sem
+        # bufferizar o resultado. As marcas d'água saem do mesmo snapshot, então o feed
+        # de alterações continua exatamente de onde os totais pararam.
+        conn = self._get_db_connection()
+        cursor = conn.cursor()
+        discard = False
+        try:
+            conn.start_transaction(consistent_snapshot=True, readonly=True)
+            self._execute_on_cursor(
+                cursor,
+                "SELECT (SELECT COALESCE(MAX(id), 0) FROM stock_movements), (SELECT MAX(updated_at) FROM products)"
+            )
+            movement_id, product_version = cursor.fetchall()[0]
+            self._execute_on_cursor(cursor, "SELECT id FROM stock_movements WHERE id > %s", (max(movement_id - MOVEMENT_OVERLAP_ROWS, 0),))
+            marks = {
+                'movement_id': movement_id,
+                'product_version': _timestamp(product_version) or datetime(1970, 1, 1),
+                'recent_movement_ids': frozenset(row[0] for row in cursor.fetchall())
+            }
+
+            for query, params, consumer in (
+                ("SELECT id, current_quantity, min_quantity FROM products ORDER BY id", (), on_products),
+                (
+                    f"SELECT product_id, {self.backend.days_between('day', '%s')}, saidas FROM stock_movement_daily "
+                    "WHERE day >= %s AND saidas > 0",
+                    (first_day, first_day), on_saidas
+                )
+            ):
+                self._execute_on_cursor(cursor, query, params)
+                while True:
+                    rows = cursor.fetchmany(FORECAST_FETCH_SIZE)
+                    if not rows:
+                        break
+                    consumer(rows)
+            conn.commit()
+            return marks
+        except Error as e:
+            try:
+                conn.rollback()
+            except Error:
+                discard = True
+            raise Exception(f"Erro ao carregar dados da previsão: {e}")
+        finally:
+            try:
+                cursor.close()
+            except Error:
+                discard = True
+            self._release_db_connection(conn, discard=discard)
+
+    def _refresh_forecast(self):
+        # Chamado com _forecast_lock adquirido. A primeira chamada carrega o catálogo
+        # inteiro; as seguintes só aplicam o que chegou pelo feed de alterações.
+        today = date.today()
+        if self.forecaster is None:
+            # Importado aqui: NumPy é opcional e pesado para a partida do app.
+            from forecasting import StockForecaster
+            forecaster = StockForecaster()
+            first_day = forecaster.start(today)
+            forecaster.finish_load(self._read_forecast_snapshot(first_day, forecaster.load_products, forecaster.load_saidas))
+            self.forecaster = forecaster
+            return
+
+        self.forecaster.advance_to(today)
+        while True:
+            changes = self.fetch_changes(self.forecaster.marks)
+            self.forecaster.apply_changes(changes)
+            if len(changes['movements']) < SYNC_CONFIG['max_movements']:
+                break
+
+    def get_stock_forecast(self, limit=FORECAST_LIMIT, product_ids=None):
+        # Taxa de consumo, dias até zerar e sugestão de compra; sem product_ids,
+        # devolve os produtos mais próximos da ruptura.
+        with self._forecast_lock:
+            self._refresh_forecast()
+            if product_ids is None:
+                forecast = self.forecaster.at_risk(limit)
+            else:
+                forecast = self.forecaster.forecast_for(product_ids)
+
+        products = self.get_products([row['product_id'] for row in forecast])
+        for row in forecast:
+            product = products.get(row['product_id'])
+            row['name'] = product['name'] if product else None
+            row['min_quantity'] = product['min_quantity'] if product else None
+        return forecast
+
+    def _index_product(self, product):
+        # Escritas deste terminal entram no índice na hora; as dos outros chegam pelo feed.
+        if self.search_index is not None:
+            with self._search_lock:
+                self.search_index.put(product)
+
+    def _load_search_index(self):
+        # Leitura fora de _search_lock (quem segura o lock não espera conexão do pool);
+        # devolve None quando o catálogo é grande demais para o índice local.
+        with self._search_load_lock:
+            if self._search_local is None:
+                total = self._execute_query("SELECT COUNT(*) AS total FROM products", fetch_one=True)['total']
+                self._search_local = total <= SEARCH_CONFIG['max_local_products']
+            if self._search_local and self.search_index is None:
+                index = ProductSearchIndex(SEARCH_CONFIG['description_chars'])
+                # Marcas antes da leitura: o que mudar no meio é relido pelo feed.
+                index.marks = self.get_sync_marks()
+                for product in self.get_all_products() or []:
+                    index.put(product)
+                self.search_index = index
+            return self.search_index
+
+    def refresh_search_index(self):
+        # Chamado junto com a sincronização (interface) ou por uma thread periódica (API),
+        # nunca pela busca: a digitação não faz ida ao banco. Só as recargas entre si
+        # esperam _search_refresh_lock; a busca não o usa. O feed é lido sem as travas
+        # da busca e o resultado é juntado ao índice com _search_lock.
+        with self._search_refresh_lock:
+            index = self.search_index
+            if index is None:
+                return
+            changes = self.fetch_changes(index.marks)
+            with self._search_lock:
+                for product in changes['products']:
+                    index.put(product)
+            index.marks = changes['marks']
+
+    def _search_products_server(self, term, limit):
+        # Prefixo do nome pelo índice único de name e, para completar, palavras com o
+        # prefixo digitado em nome ou descrição pelo índice FULLTEXT. O FULLTEXT não acha
+        # trechos no meio das palavras nem termos com menos de 3 letras.
+        prefix = _like_escape(term) + "%"
+        products = self._execute_query(
+            f"SELECT {PRODUCT_COLUMNS} FROM products WHERE name LIKE %s ESCAPE '!' ORDER BY name LIMIT %s", (prefix, limit)
+        ) or []
+        words = [word for word in re.findall(r"\w+", term) if len(word) >= 3]
+        if len(products) < limit and words:
+            seen = {p['id'] for p in products}
+            if self.backend.fulltext:
+                condition, params = "MATCH(name, description) AGAINST (%s IN BOOLEAN MODE)", [" ".join(f"+{word}*" for word in words)]
+            else:
+                # Sem FULLTEXT (SQLite), cada palavra é procurada em nome ou descrição.
+                condition = " AND ".join(["(name LIKE %s ESCAPE '!' OR description LIKE %s ESCAPE '!')"] * len(words))
+                params = [pattern for word in words for pattern in [f"%{_like_escape(word)}%"] * 2]
+            matches = self._execute_query(
+                f"SELECT {PRODUCT_COLUMNS} FROM products WHERE {condition} LIMIT %s", tuple(params) + (limit,)
+            ) or []
+            products.extend(p for p in matches if p['id'] not in seen)
+        return products[:limit]
+
+    def search_products(self, term, limit=None):
+        limit = limit or SEARCH_CONFIG['limit']
+        term = term.strip()
+        if not term:
+            return []
+        # O índice vazio (catálogo sem produtos) também vale: só a primeira busca carrega.
+        index = self.search_index
+        if index is None and self._search_local is not False:
+            index = self._load_search_index()
+        if index is not None:
+            with self._search_lock:
+                return index.search(term, limit)
+        return self._search_products_server(term, limit)
+
+    def _ledger_drift(self, cursor, product_ids=None):
+        # Uma consulta agrupada por lote de produtos: saldo de abertura do ponto de
+        # controle + soma das movimentações em stock_movements, comparado com
+        # current_quantity. Sem product_ids confere o catálogo inteiro.
+        query = (
+            "SELECT p.id, p.current_quantity, COALESCE(c.balance, 0) + COALESCE(SUM("
+            "CASE WHEN m.type = 'entrada' THEN m.quantity ELSE -m.quantity END), 0) AS ledger_balance "
+            "FROM products p "
+            "LEFT JOIN stock_movement_checkpoints c ON c.product_id = p.id "
+            "LEFT JOIN stock_movements m ON m.product_id = p.id "
+            "{where}GROUP BY p.id, p.current_quantity, c.balance "
+            "HAVING p.current_quantity <> ledger_balance"
+        )
+        if product_ids is None:
+            self._execute_on_cursor(cursor, query.format(where=""))
+            return [tuple(int(value) for value in row) for row in cursor.fetchall()]
+        drift = []
+        product_ids = sorted(product_ids)
+        for start in range(0, len(product_ids), RECONCILE_BATCH_SIZE):
+            batch = product_ids[start:start + RECONCILE_BATCH_SIZE]
+            self._execute_on_cursor(
+                cursor, query.format(where=f"WHERE p.id IN ({', '.join(['%s'] * len(batch))}) "), batch
+            )
+            drift.extend(tuple(int(value) for value in row) for row in cursor.fetchall())
+        return drift
+
+    def _repair_drift(self, conn, cursor, product_id):
+        # Com a linha do produto travada nenhuma movimentação dele avança, então o saldo
+        # do histórico relido aqui é definitivo. Devolve o novo estoque ou None quando o
+        # histórico está negativo e não pode virar estoque.
+        self._execute_on_cursor(cursor, "SELECT id FROM products WHERE id = %s FOR UPDATE", (product_id,))
+        cursor.fetchall()
+        drift = self._ledger_drift(cursor, [product_id])
+        if not drift:
+            conn.commit()
+            return None
+        _, _, ledger_balance = drift[0]
+        if ledger_balance < 0:
+            conn.rollback()
+            return None
+        self._execute_on_cursor(cursor, "UPDATE products SET current_quantity = %s WHERE id = %s", (ledger_balance, product_id))
+        conn.commit()
+        self.product_cache.invalidate(product_id)
+        return ledger_balance
+
+    def reconcile_stock(self, repair=False, full=False):
+        # Confere current_quantity com o histórico de movimentações. Incremental: a partir
+        # das marcas da última execução, só entram os produtos com movimentações novas
+        # ou linhas alteradas (updated_at), descobertos por uma consulta agrupada; a
+        # primeira execução, ou full=True, confere o catálogo inteiro. A leitura é feita
+        # em um snapshot consistente, então movimentações simultâneas não aparecem como
+        # divergência. Com repair=True o estoque divergente é corrigido para o saldo do
+        # histórico. Devolve {'checked', 'drift': [{product_id, current_quantity,
+        # ledger_balance, repaired}]}.
+        conn = self._get_db_connection()
+        cursor = conn.cursor()
+        discard = False
+        try:
+            if not self.backend.acquire_lock(cursor, RECONCILE_LOCK_NAME, 0):
+                raise Exception("Outro terminal já está conciliando o estoque.")
+            try:
+                conn.commit()
+                conn.start_transaction(consistent_snapshot=True, readonly=True)
+                self._execute_on_cursor(cursor, "SELECT movement_id, product_version FROM stock_reconciliation WHERE id = 1")
+                marks = next(iter(cursor.fetchall()), None)
+                if full:
+                    marks = None
+                self._execute_on_cursor(
+                    cursor,
+                    "SELECT (SELECT COALESCE(MAX(id), 0) FROM stock_movements), (SELECT MAX(updated_at) FROM products)"
+                )
+                movement_id, product_version = cursor.fetchall()[0]
+                product_version = _timestamp(product_version)
+
+                if marks is None:
+                    product_ids = None
+                    self._execute_on_cursor(cursor, "SELECT COUNT(*) FROM products")
+                    checked = cursor.fetchall()[0][0]
+                else:
+                    # Relê uma margem antes das marcas: ids e updated_at de transações
+                    # concorrentes podem ser confirmados fora de ordem.
+                    last_movement_id, last_version = marks
+                    self._execute_on_cursor(
+                        cursor,
+                        "SELECT DISTINCT product_id FROM stock_movements WHERE id > %s",
+                        (max(last_movement_id - MOVEMENT_OVERLAP_ROWS, 0),)
+                    )
+                    product_ids = {row[0] for row in cursor.fetchall()}
+                    if last_version is not None:
+                        self._execute_on_cursor(
+                            cursor, "SELECT id FROM products WHERE updated_at > %s", (last_version - VERSION_OVERLAP,)
+                        )
+                        product_ids.update(row[0] for row in cursor.fetchall())
+                    checked = len(product_ids)
+                drift = self._ledger_drift(cursor, product_ids) if product_ids is None or product_ids else []
+                conn.commit()
+
+                report = []
+                for product_id, current_quantity, ledger_balance in drift:
+                    repaired = self._repair_drift(conn, cursor, product_id) if repair else None
+                    logger.warning(
+                        "Estoque divergente do histórico: produto %s com %s, histórico %s%s",
+                        product_id, current_quantity, ledger_balance, " (corrigido)" if repaired is not None else ""
+                    )
+                    report.append({
+                        'product_id': product_id,
+                        'current_quantity': current_quantity,
+                        'ledger_balance': ledger_balance,
+                        'repaired': repaired is not None
+                    })
+
+                # Divergência não corrigida segura as marcas: a próxima execução
+                # incremental volta a conferir esses produtos até baterem.
+                if all(row['repaired'] for row in report):
+                    self._execute_on_cursor(
+                        cursor,
+                        self.backend.upsert(
+                            'stock_reconciliation', ('id', 'movement_id', 'product_version', 'reconciled_at'),
+                            {'movement_id': "{new}", 'product_version': "{new}", 'reconciled_at': "{new}"}
+                        ),
+                        (1, movement_id, product_version, datetime.now().replace(microsecond=0))
+                    )
+                    conn.commit()
+                return {'checked': checked, 'drift': report}
+            finally:
+                self.backend.release_lock(cursor, RECONCILE_LOCK_NAME)
+        except Error as e:
+            try:
+                conn.rollback()
+            except Error:
+                discard = True
+            raise Exception(f"Erro ao conciliar o estoque: {e}")
+        finally:
+            try:
+                cursor.close()
+            except Error:
+                discard = True
+            self._release_db_connection(conn, discard=discard)
+
+    def _export_queries(self, kind, start=None, end=None, product_ids=None):
+        source = EXPORT_SOURCES.get(kind)
+        if source is None:
+            raise ValueError(f"Relatório desconhecido: {kind}.")
+        conditions, params = [], []
+        if start is not None or end is not None:
+            if source['date_column'] is None:
+                raise ValueError(f"O relatório {kind} não aceita filtro de datas.")
+            if start is not None:
+                conditions.append(f"{source['date_column']} >= %s")
+                params.append(start)
+            if end is not None:
+                conditions.append(f"{source['date_column']} < %s")
+                params.append(end + timedelta(days=1))
+        if product_ids:
+            product_ids = sorted({int(product_id) for product_id in product_ids})
+            conditions.append(f"{source['product_column']} IN ({', '.join(['%s'] * len(product_ids))})")
+            params.extend(product_ids)
+
+        query = source['query']
+        if conditions:
+            query += (" AND " if " WHERE " in query else " WHERE ") + " AND ".join(conditions)
+        query = f"{query} ORDER BY {source['order_by']}"
+        tables = self._movement_tables(start, end) if source.get('archived') else [None]
+        return [(query.format(table=table), tuple(params)) for table in tables]
+
+    def stream_export(self, kind, start=None, end=None, product_ids=None):
+        # Gerador de lotes de tuplas (na ordem de EXPORT_SOURCES[kind]['columns']) lidos
+        # de um cursor sem buffer: o servidor envia as linhas conforme são consumidas e a
+        # memória fica limitada a um lote. start e end são dias, inclusive.
+        queries = self._export_queries(kind, start, end, product_ids)
+        conn = self._get_db_connection()
+        cursor = conn.cursor()
+        discard = False
+        finished = False
+        try:
+            for query, params in queries:
+                self._execute_on_cursor(cursor, query, params)
+                while True:
+                    rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+                    if not rows:
+                        break
+                    yield rows
+            conn.commit()
+            finished = True
+        except Error as e:
+            discard = True
+            raise Exception(f"Erro ao exportar dados: {e}")
+        finally:
+            # Interrompido no meio, o resultado não lido fica preso na conexão; ela é
+            # descartada em vez de voltar ao pool.
+            discard = discard or not finished
+            try:
+                cursor.close()
+            except Error:
+                discard = True
+            self._release_db_connection(conn, discard=discard)
+
+    def get_users(self):
+        return self._execute_query("SELECT id, username, role FROM users")
+
+    def get_low_stock_products(self):
+        return self._execute_query("SELECT id, name, current_quantity, min_quantity FROM products WHERE is_low_stock = 1 ORDER BY id")
+
+    def save_product(self, product_id, name, description, min_quantity):
+        if product_id is None:
+            success, message = self.add_product(name, description, min_quantity)
+        else:
+            success, message = self.update_product(product_id, name, description, min_quantity)
+
+        product = None
+        if success:
+            if product_id is None:
+                product = self._execute_query(f"SELECT {PRODUCT_COLUMNS} FROM products WHERE name = %s", (name,), fetch_one=True)
+                if product:
+                    self.product_cache.put(product)
+            else:
+                product = self.get_product(product_id)
+            if product:
+                self._index_product(product)
+        return success, message, product
@@ -0,0 +1,50 @@
+import argparse
+import logging
+import sys
+import time
+
+from inventory_service import ARCHIVE_CONFIG, DB_CONFIG, InventoryService
+
+def run_archive(service, args):
+    start = time.perf_counter()
+    archived = service.archive_movements(args.horizon_days, args.batch_size)
+    print(f"{archived} movimentações arquivadas em {time.perf_counter() - start:.1f}s.")
+    return 0
+
+def run_reconcile(service, args):
+    start = time.perf_counter()
+    result = service.reconcile_stock(repair=args.repair, full=args.full)
+    for drift in result['drift']:
+        status = " (corrigido)" if drift['repaired'] else ""
+        print(f"Produto {drift['product_id']}: estoque {drift['current_quantity']}, histórico {drift['ledger_balance']}{status}")
+    print(f"{result['checked']} produtos conferidos em {time.perf_counter() - start:.1f}s; {len(result['drift'])} divergentes.")
+    return 1 if any(not drift['repaired'] for drift in result['drift']) else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tarefas de manutenção do banco do BioSync.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    archive = commands.add_parser("archive", help="move movimentações antigas para as tabelas mensais de arquivo")
+    archive.add_argument("--horizon-days", type=int, default=ARCHIVE_CONFIG['horizon_days'], help="dias que ficam em stock_movements")
+    archive.add_argument("--batch-size", type=int, default=ARCHIVE_CONFIG['batch_size'])
+    archive.set_defaults(run=run_archive)
+
+    reconcile = commands.add_parser("reconcile", help="confere o estoque com o histórico de movimentações")
+    reconcile.add_argument("--full", action="store_true", help="confere todos os produtos, não só os alterados")
+    reconcile.add_argument("--repair", action="store_true", help="corrige o estoque divergente para o saldo do histórico")
+    reconcile.set_defaults(run=run_reconcile)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    service = InventoryService(DB_CONFIG)
+    try:
+        service.init_db()
+        return args.run(service, args)
+    except Exception as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        service.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
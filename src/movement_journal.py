@@ -0,0 +1,198 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from inventory_service import ServiceUnavailableError
+
+logger = logging.getLogger("biosync")
+
+JOURNAL_CONFIG = {
+    'path': os.path.join(os.path.expanduser("~"), ".biosync_journal.db"),
+    'batch_size': 200, # movimentações por transação no MySQL
+    'flush_delay': 0.05, # espera após um registro para juntar os seguintes no mesmo lote
+    'retry_interval': 5.0 # segundos entre tentativas com o MySQL fora do ar
+}
+
+JOURNAL_COLUMNS = ('client_movement_id', 'product_id', 'type', 'quantity', 'recorded_at')
+
+class MovementJournal:
+    # Diário local (SQLite em modo WAL) das movimentações registradas no terminal. O
+    # registro é um INSERT local, confirmado na hora; o envio ao MySQL fica com o
+    # JournalReplayer. Cada movimentação leva um id gerado aqui, que o servidor usa
+    # para descartar reenvios.
+    def __init__(self, path=None):
+        self.path = path or JOURNAL_CONFIG['path']
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        # WAL com synchronous=NORMAL: o commit não espera o fsync, e o que foi
+        # confirmado sobrevive a uma queda do app (não necessariamente à do sistema).
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS journal (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                client_movement_id TEXT NOT NULL UNIQUE,
+                product_id INTEGER NOT NULL,
+                type TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                recorded_at TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending' CHECK(status IN ('pending', 'applied', 'conflict')),
+                reason TEXT
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_journal_status ON journal (status, seq)")
+
+    def append(self, product_id, movement_type, quantity):
+        client_id = uuid.uuid4().hex
+        recorded_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO journal (client_movement_id, product_id, type, quantity, recorded_at) VALUES (?, ?, ?, ?, ?)",
+                (client_id, product_id, movement_type, quantity, recorded_at)
+            )
+        return client_id
+
+    def pending(self, limit):
+        # Em ordem de registro: uma saída só é conferida depois das entradas anteriores.
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT client_movement_id, product_id, type, quantity, recorded_at FROM journal "
+                "WHERE status = 'pending' ORDER BY seq LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [
+            (client_id, product_id, movement_type, quantity, datetime.strptime(recorded_at, '%Y-%m-%d %H:%M:%S'))
+            for client_id, product_id, movement_type, quantity, recorded_at in rows
+        ]
+
+    def mark_done(self, client_ids, conflicts):
+        # conflicts: (id do cliente, motivo) recusados pelo servidor; os demais de
+        # client_ids foram aplicados.
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "UPDATE journal SET status = 'conflict', reason = ? WHERE client_movement_id = ?",
+                    [(reason, client_id) for client_id, reason in conflicts]
+                )
+                rejected = {client_id for client_id, _ in conflicts}
+                self._conn.executemany(
+                    "UPDATE journal SET status = 'applied' WHERE client_movement_id = ?",
+                    [(client_id,) for client_id in client_ids if client_id not in rejected]
+                )
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def conflicts(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT client_movement_id, product_id, type, quantity, recorded_at, reason FROM journal "
+                "WHERE status = 'conflict' ORDER BY seq"
+            ).fetchall()
+        return [dict(zip(JOURNAL_COLUMNS + ('reason',), row)) for row in rows]
+
+    def dismiss_conflicts(self, client_ids):
+        with self._lock:
+            self._conn.executemany("DELETE FROM journal WHERE client_movement_id = ? AND status = 'conflict'", [(i,) for i in client_ids])
+
+    def purge_applied(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM journal WHERE status = 'applied'")
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM journal GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in ('pending', 'applied', 'conflict')}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class JournalReplayer:
+    # Thread que envia o diário ao MySQL em lotes, na ordem de registro. Com o banco
+    # fora do ar espera retry_interval e tenta de novo; nada se perde, pois as
+    # movimentações só saem de 'pending' depois do commit no servidor. Movimentações
+    # que o banco recusa voltam do serviço como conflitos e não seguram as seguintes.
+    def __init__(self, journal, service, on_flushed=None, on_conflicts=None, on_offline=None, config=JOURNAL_CONFIG):
+        self.journal = journal
+        self.service = service
+        self.on_flushed = on_flushed
+        self.on_conflicts = on_conflicts
+        self.on_offline = on_offline
+        self.config = dict(config)
+        self.online = True
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="biosync-journal", daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        self.journal.purge_applied()
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                flushed = self.flush()
+            except ServiceUnavailableError as e:
+                if self.online:
+                    logger.warning("Diário de movimentações: envio adiado (%s)", e)
+                    self.online = False
+                    if self.on_offline:
+                        self.on_offline(e)
+                # Novos registros não antecipam a tentativa: só o intervalo ou o fim.
+                self._stop.wait(self.config['retry_interval'])
+                continue
+            except Exception:
+                # Falha que não é de conexão (ex.: no diário local): registrada sem dar
+                # o terminal como desconectado, e tentada de novo após o intervalo.
+                logger.exception("Diário de movimentações: falha no envio")
+                self._stop.wait(self.config['retry_interval'])
+                continue
+            if not flushed:
+                self._wake.wait()
+                if not self._stop.is_set():
+                    time.sleep(self.config['flush_delay'])
+
+    def flush(self):
+        # Envia tudo o que está pendente; devolve quantas movimentações saíram do diário.
+        # on_flushed recebe também os produtos cujo estoque mudou.
+        flushed = 0
+        product_ids = set()
+        while not self._stop.is_set():
+            entries = self.journal.pending(self.config['batch_size'])
+            if not entries:
+                break
+            conflicts = self.service.apply_journal_batch(entries)
+            self.journal.mark_done([entry[0] for entry in entries], conflicts)
+            flushed += len(entries)
+            refused = {client_id for client_id, _ in conflicts}
+            product_ids.update(entry[1] for entry in entries if entry[0] not in refused)
+            self.online = True
+            if conflicts and self.on_conflicts:
+                by_id = {entry[0]: entry for entry in entries}
+                self.on_conflicts([
+                    dict(zip(JOURNAL_COLUMNS, by_id[client_id]), reason=reason)
+                    for client_id, reason in conflicts
+                ])
+        if flushed:
+            self.journal.purge_applied()
+            if self.on_flushed:
+                self.on_flushed(flushed, product_ids)
+        return flushed
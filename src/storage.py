@@ -0,0 +1,583 @@
+import itertools
+import re
+import sqlite3
+import threading
+from datetime import date, datetime
+from functools import lru_cache
+
+# Backends de armazenamento do InventoryService. O serviço escreve SQL no dialeto do
+# MySQL com placeholders %s; cada backend entrega conexões e cursores com a mesma
+# interface (a do mysql.connector), traduz os erros do driver para as classes abaixo e
+# monta o SQL que difere entre os bancos: upserts, travas nomeadas, datas, uniões e a
+# cópia de tabelas.
+
+class Error(Exception):
+    # Erro de banco comum aos backends; o erro original do driver fica em __cause__.
+    def __init__(self, msg=None, errno=None):
+        super().__init__(msg)
+        self.msg = msg
+        self.errno = errno
+
+class OperationalError(Error):
+    # Conexão perdida, banco indisponível ou espera por trava estourada: vale repetir
+    # (com outra conexão) mais tarde.
+    pass
+
+class IntegrityError(Error):
+    # Violação de restrição; key é a coluna ou índice único duplicado, quando há.
+    def __init__(self, msg=None, errno=None, key=None):
+        super().__init__(msg, errno)
+        self.key = key
+
+class NoSuchTableError(Error):
+    pass
+
+class _Cursor:
+    def __init__(self, backend, cursor):
+        self._backend = backend
+        self._cursor = cursor
+
+    def _call(self, method, *args):
+        try:
+            return method(*args)
+        except self._backend.driver_error as e:
+            raise self._backend.translate(e) from e
+
+    def execute(self, query, params=()):
+        self._call(self._cursor.execute, query, params)
+
+    def executemany(self, query, params):
+        self._call(self._cursor.executemany, query, params)
+
+    def fetchone(self):
+        return self._call(self._cursor.fetchone)
+
+    def fetchall(self):
+        return self._call(self._cursor.fetchall)
+
+    def fetchmany(self, size):
+        return self._call(self._cursor.fetchmany, size)
+
+    def close(self):
+        self._call(self._cursor.close)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def column_names(self):
+        return tuple(column[0] for column in self._cursor.description or ())
+
+class _Connection:
+    def __init__(self, backend, conn):
+        self._backend = backend
+        self._conn = conn
+
+    def _call(self, method, *args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        except self._backend.driver_error as e:
+            raise self._backend.translate(e) from e
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def commit(self):
+        self._call(self._conn.commit)
+
+    def rollback(self):
+        self._call(self._conn.rollback)
+
+    def close(self):
+        self._call(self._conn.close)
+
+class MySQLConnection(_Connection):
+    def cursor(self, dictionary=False, buffered=False):
+        return _Cursor(self._backend, self._call(self._conn.cursor, dictionary=dictionary, buffered=buffered))
+
+    def start_transaction(self, consistent_snapshot=False, readonly=False):
+        self._call(self._conn.start_transaction, consistent_snapshot=consistent_snapshot, readonly=readonly)
+
+    def ping(self):
+        self._call(self._conn.ping, reconnect=True, attempts=1)
+
+class MySQLBackend:
+    name = 'mysql'
+    label = 'MySQL'
+    max_connections = None
+    fulltext = True
+    greatest = 'GREATEST'
+
+    def __init__(self, **connect_args):
+        # Importado só aqui: quem usa o SQLite não precisa do driver instalado.
+        import mysql.connector
+        self._mysql = mysql.connector
+        self.driver_error = mysql.connector.Error
+        self.transient_errnos = {mysql.connector.errorcode.ER_LOCK_WAIT_TIMEOUT, mysql.connector.errorcode.ER_LOCK_DEADLOCK}
+        self.connect_args = connect_args
+        self._upserts = {}
+
+    def connect(self):
+        try:
+            return MySQLConnection(self, self._mysql.connect(**self.connect_args))
+        except self.driver_error as e:
+            raise self.translate(e) from e
+
+    def close(self):
+        pass
+
+    def translate(self, e):
+        errors = self._mysql.errors
+        message = str(e)
+        if isinstance(e, (errors.OperationalError, errors.InterfaceError)) or e.errno in self.transient_errnos:
+            return OperationalError(message, e.errno)
+        if isinstance(e, errors.IntegrityError):
+            # MySQL 8 qualifica o índice com a tabela: "for key 'products.name'".
+            match = re.search(r"for key '(?:[^'.]*\.)?([^']*)'", message)
+            return IntegrityError(message, e.errno, key=match.group(1) if match else None)
+        if e.errno == self._mysql.errorcode.ER_NO_SUCH_TABLE:
+            return NoSuchTableError(message, e.errno)
+        return Error(message, e.errno)
+
+    def upsert(self, table, columns, update):
+        # INSERT que atualiza a linha existente na chave duplicada. update: coluna ->
+        # expressão, onde {new} é o valor que seria inserido e {greatest} a função de máximo.
+        key = (table, columns, tuple(update.items()))
+        query = self._upserts.get(key)
+        if query is None:
+            assignments = ", ".join(
+                f"{column} = {expression.format(new=f'VALUES({column})', greatest=self.greatest)}"
+                for column, expression in update.items()
+            )
+            query = self._upserts[key] = (
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+                f"ON DUPLICATE KEY UPDATE {assignments}"
+            )
+        return query
+
+    def acquire_lock(self, cursor, name, timeout):
+        # Trava nomeada do servidor, vale entre todos os terminais.
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (name, timeout))
+        return bool(cursor.fetchall()[0][0])
+
+    def release_lock(self, cursor, name):
+        cursor.execute("DO RELEASE_LOCK(%s)", (name,))
+
+    def column_exists(self, cursor, table, column):
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+            (table, column)
+        )
+        return cursor.fetchone()[0] > 0
+
+    def index_exists(self, cursor, table, index):
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s",
+            (table, index)
+        )
+        return cursor.fetchone()[0] > 0
+
+    def days_between(self, later, earlier):
+        return f"DATEDIFF({later}, {earlier})"
+
+    def union_all(self, selects):
+        return " UNION ALL ".join(f"({select})" for select in selects)
+
+    def create_table_like(self, cursor, table, source, row_format=None):
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} LIKE {source}")
+        if row_format:
+            cursor.execute(f"ALTER TABLE {table} ROW_FORMAT={row_format}")
+
+SQLITE_CONFIG = {
+    'path': 'estoque_biosync.db',
+    'timeout': 5.0, # segundos esperando a trava de escrita de outra conexão
+    'cached_statements': 256, # instruções preparadas mantidas por conexão
+    'pragmas': {
+        'journal_mode': 'WAL', # leitores não bloqueiam o escritor, nem o contrário
+        'synchronous': 'NORMAL', # com WAL, o commit não espera o fsync
+        'foreign_keys': 'ON',
+        'cache_size': -65536, # em KiB quando negativo: 64 MB de cache de páginas
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY'
+    }
+}
+
+# O SQLite guarda datas como texto ISO. A conversão é feita pelo backend, nas conexões
+# dele, e não pelos adaptadores globais do módulo sqlite3 (que valeriam para todo
+# sqlite3 do processo, inclusive o diário local): datas nos parâmetros viram texto, e
+# colunas declaradas DATE, DATETIME e TIMESTAMP voltam como date/datetime, como no MySQL.
+# Colunas calculadas (MAX(updated_at) etc.) não têm tipo declarado e voltam como texto;
+# quem as lê converte.
+SQLITE_DATE_TYPES = {
+    'DATE': date.fromisoformat,
+    'DATETIME': datetime.fromisoformat,
+    'TIMESTAMP': datetime.fromisoformat
+}
+
+def _sqlite_params(params):
+    if not any(isinstance(value, date) for value in params):
+        return params
+    return tuple(
+        value.isoformat(" ") if isinstance(value, datetime) else value.isoformat() if isinstance(value, date) else value
+        for value in params
+    )
+
+_FOR_UPDATE = re.compile(r"\s+FOR\s+UPDATE\s*$", re.IGNORECASE)
+_WRITE_STATEMENT = re.compile(r"\s*(?:INSERT|UPDATE|DELETE|REPLACE|CREATE|ALTER|DROP)\b", re.IGNORECASE)
+_DDL_STATEMENT = re.compile(r"\s*(?:CREATE|ALTER|DROP)\b", re.IGNORECASE)
+
+# Tradução do DDL das migrações (escrito para o MySQL) para o SQLite, para que o banco
+# embarcado siga os mesmos passos de SCHEMA_MIGRATIONS.
+_CREATE_TABLE = re.compile(r"\s*CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?(\w+)\s*\((.*)\)\s*;?\s*$", re.IGNORECASE | re.DOTALL)
+_ALTER_TABLE = re.compile(r"\s*ALTER\s+TABLE\s+(\w+)\s+(.*?)\s*;?\s*$", re.IGNORECASE | re.DOTALL)
+_ADD_INDEX = re.compile(r"ADD\s+(UNIQUE\s+|FULLTEXT\s+)?INDEX\s+(\w+)\s*\((.*)\)$", re.IGNORECASE | re.DOTALL)
+_ADD_COLUMN = re.compile(r"ADD\s+COLUMN\s+(\w+)\s+(.*)$", re.IGNORECASE | re.DOTALL)
+_INLINE_INDEX = re.compile(r"(UNIQUE\s+)?(?:INDEX|KEY)\s+(\w+)\s*\((.*)\)$", re.IGNORECASE | re.DOTALL)
+_AUTO_INCREMENT = re.compile(r"\bINT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY\b", re.IGNORECASE)
+_ON_UPDATE_NOW = re.compile(r"\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP(?:\(\d\))?", re.IGNORECASE)
+_DEFAULT_NOW = re.compile(r"\bDEFAULT\s+CURRENT_TIMESTAMP(?:\(\d\))?", re.IGNORECASE)
+_CHAR_TYPE = re.compile(r"\b(?:VAR)?CHAR\(\d+\)(?!\s+COLLATE)", re.IGNORECASE)
+_STORED = re.compile(r"\bSTORED\b", re.IGNORECASE)
+_ON_DUPLICATE_KEY = re.compile(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", re.IGNORECASE)
+_VALUES_OF = re.compile(r"\bVALUES\((\w+)\)", re.IGNORECASE)
+_SQLITE_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')"
+
+def _split_clauses(text):
+    # Divide nas vírgulas de fora dos parênteses: colunas de um CREATE TABLE ou
+    # cláusulas de um ALTER TABLE.
+    clauses, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            clauses.append(text[start:i].strip())
+            start = i + 1
+    clauses.append(text[start:].strip())
+    return [clause for clause in clauses if clause]
+
+def _sqlite_column(definition):
+    # Tipos e defaults do MySQL no SQLite. Texto sem diferenciar maiúsculas, como as
+    # collations _ci do MySQL; o ON UPDATE vira gatilho (devolve se havia um).
+    on_update = bool(_ON_UPDATE_NOW.search(definition))
+    definition = _ON_UPDATE_NOW.sub("", definition)
+    definition = _AUTO_INCREMENT.sub("INTEGER PRIMARY KEY AUTOINCREMENT", definition)
+    definition = _CHAR_TYPE.sub(lambda match: f"{match.group(0)} COLLATE NOCASE", definition)
+    return definition, on_update
+
+def _sqlite_touch_trigger(table, column, event):
+    # Preenche a coluna de data com o momento da inserção ou da alteração da linha; a
+    # condição evita que o gatilho dispare pela própria atualização da coluna.
+    condition = f" WHEN NEW.{column} IS OLD.{column}" if event == 'UPDATE' else ""
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS trg_{table}_{column}_{event.lower()} AFTER {event} ON {table}{condition} "
+        f"BEGIN UPDATE {table} SET {column} = {_SQLITE_NOW} WHERE rowid = NEW.rowid; END"
+    )
+
+def _sqlite_create_table(if_not_exists, table, body):
+    columns, statements = [], []
+    for clause in _split_clauses(body):
+        index = _INLINE_INDEX.match(clause)
+        if index:
+            unique, name, indexed = index.groups()
+            statements.append(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({indexed})")
+            continue
+        clause, on_update = _sqlite_column(clause)
+        columns.append(_DEFAULT_NOW.sub(f"DEFAULT ({_SQLITE_NOW})", clause))
+        if on_update:
+            statements.append(_sqlite_touch_trigger(table, clause.split()[0], 'UPDATE'))
+    create = f"CREATE TABLE {if_not_exists or ''}{table} ({', '.join(columns)})"
+    return (create,) + tuple(statements)
+
+def _sqlite_alter_table(table, clauses):
+    statements = []
+    for clause in _split_clauses(clauses):
+        index = _ADD_INDEX.match(clause)
+        if index:
+            kind, name, indexed = index.groups()
+            kind = (kind or "").strip().upper()
+            if kind != 'FULLTEXT': # sem FULLTEXT no SQLite: a busca no servidor usa LIKE
+                statements.append(f"CREATE {'UNIQUE ' if kind else ''}INDEX IF NOT EXISTS {name} ON {table} ({indexed})")
+            continue
+        column = _ADD_COLUMN.match(clause)
+        if not column:
+            if clause.upper().startswith("ROW_FORMAT"):
+                continue
+            raise ValueError(f"ALTER TABLE sem tradução para o SQLite: {clause}")
+        name, definition = column.groups()
+        definition, on_update = _sqlite_column(definition)
+        # O ALTER do SQLite não aceita coluna gerada STORED nem default que não seja
+        # constante: a coluna gerada fica VIRTUAL (também indexável) e a data da
+        # criação vem de um gatilho, com as linhas existentes preenchidas agora.
+        definition = _STORED.sub("VIRTUAL", definition)
+        default_now = bool(_DEFAULT_NOW.search(definition))
+        definition = _DEFAULT_NOW.sub("DEFAULT '1970-01-01 00:00:00'", definition)
+        statements.append(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+        if default_now:
+            statements.append(f"UPDATE {table} SET {name} = {_SQLITE_NOW}")
+            statements.append(_sqlite_touch_trigger(table, name, 'INSERT'))
+        if on_update:
+            statements.append(_sqlite_touch_trigger(table, name, 'UPDATE'))
+    return tuple(statements)
+
+@lru_cache(maxsize=1024)
+def _sqlite_statement(query):
+    # Devolve as instruções do SQLite para uma do MySQL e se ela escreve. Placeholders
+    # do MySQL viram "?" e FOR UPDATE vira uma transação IMMEDIATE: o SQLite trava o
+    # banco inteiro para escrita, e pedir a trava já no início evita que uma transação
+    # que leu e depois escreve falhe por ter visto dados antigos.
+    create = _CREATE_TABLE.match(query)
+    if create:
+        return _sqlite_create_table(*create.groups()), True
+    alter = _ALTER_TABLE.match(query)
+    if alter:
+        return _sqlite_alter_table(*alter.groups()), True
+    locking = bool(_FOR_UPDATE.search(query))
+    if locking:
+        query = _FOR_UPDATE.sub("", query)
+    if _ON_DUPLICATE_KEY.search(query):
+        insert, update = _ON_DUPLICATE_KEY.split(query, 1)
+        query = f"{insert} ON CONFLICT DO UPDATE SET " + _VALUES_OF.sub(r"excluded.\1", update)
+    return (query.replace("%s", "?"),), locking or bool(_WRITE_STATEMENT.match(query))
+
+class SQLiteCursor(_Cursor):
+    def __init__(self, backend, cursor, dictionary=False):
+        super().__init__(backend, cursor)
+        self._dictionary = dictionary
+        self._names = ()
+        self._converters = ()
+
+    def execute(self, query, params=()):
+        statements, writes = _sqlite_statement(query)
+        try:
+            if writes and not self._cursor.connection.in_transaction:
+                self._cursor.execute("BEGIN IMMEDIATE")
+            for statement in statements:
+                self._cursor.execute(statement, _sqlite_params(params))
+        except sqlite3.Error as e:
+            raise self._backend.translate(e) from e
+        if _DDL_STATEMENT.match(query):
+            self._backend.schema_changed()
+        self._describe()
+
+    def executemany(self, query, params):
+        (query,), _ = _sqlite_statement(query)
+        try:
+            if not self._cursor.connection.in_transaction:
+                self._cursor.execute("BEGIN IMMEDIATE")
+            self._cursor.executemany(query, (_sqlite_params(row) for row in params))
+        except sqlite3.Error as e:
+            raise self._backend.translate(e) from e
+        self._describe()
+
+    def _describe(self):
+        description = self._cursor.description
+        self._names = tuple(column[0] for column in description) if description else ()
+        if self._names:
+            converters = self._backend.date_columns(self._cursor.connection)
+            self._converters = tuple((i, converters[name]) for i, name in enumerate(self._names) if name in converters)
+        else:
+            self._converters = ()
+
+    def _row(self, row):
+        if self._converters:
+            row = list(row)
+            for i, convert in self._converters:
+                if isinstance(row[i], str):
+                    row[i] = convert(row[i])
+            row = tuple(row)
+        return dict(zip(self._names, row)) if self._dictionary else row
+
+    def fetchone(self):
+        row = self._call(self._cursor.fetchone)
+        return None if row is None else self._row(row)
+
+    def fetchall(self):
+        rows = self._call(self._cursor.fetchall)
+        return [self._row(row) for row in rows] if self._dictionary or self._converters else rows
+
+    def fetchmany(self, size):
+        rows = self._call(self._cursor.fetchmany, size)
+        return [self._row(row) for row in rows] if self._dictionary or self._converters else rows
+
+    @property
+    def column_names(self):
+        return self._names
+
+class SQLiteConnection(_Connection):
+    def cursor(self, dictionary=False, buffered=False):
+        # O cursor do SQLite lê sob demanda, com ou sem buffer: a leitura é local.
+        return SQLiteCursor(self._backend, self._call(self._conn.cursor), dictionary)
+
+    def start_transaction(self, consistent_snapshot=False, readonly=False):
+        self._call(self._conn.execute, "BEGIN")
+        if consistent_snapshot:
+            # No WAL o snapshot começa na primeira leitura, não no BEGIN.
+            self._call(self._conn.execute, "SELECT COUNT(*) FROM sqlite_master")
+
+    def ping(self):
+        self._call(self._conn.execute, "SELECT 1")
+
+    def close(self):
+        try:
+            # Atualiza as estatísticas do planejador que mudaram durante a conexão.
+            self._conn.execute("PRAGMA optimize")
+        except sqlite3.Error:
+            pass
+        self._call(self._conn.close)
+
+class SQLiteBackend:
+    name = 'sqlite'
+    label = 'SQLite'
+    fulltext = False
+    greatest = 'MAX'
+    driver_error = sqlite3.Error
+
+    _memory_ids = itertools.count(1)
+
+    def __init__(self, path=None, timeout=None, cached_statements=None, pragmas=None):
+        self.path = path or SQLITE_CONFIG['path']
+        self.timeout = SQLITE_CONFIG['timeout'] if timeout is None else timeout
+        self.cached_statements = cached_statements or SQLITE_CONFIG['cached_statements']
+        self.pragmas = dict(SQLITE_CONFIG['pragmas'], **(pragmas or {}))
+        self.max_connections = None
+        self._keeper = None
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._upserts = {}
+        self._date_columns = None
+        self.database, self.uri = self.path, False
+        if self.path == ':memory:':
+            # Banco em memória compartilhado pelas conexões do pool, vivo enquanto o
+            # backend existir. Uma conexão de cada vez: o cache compartilhado trava por
+            # tabela e não espera pelo busy timeout.
+            self.database = f"file:biosync-{next(self._memory_ids)}?mode=memory&cache=shared"
+            self.uri = True
+            self.max_connections = 1
+            self._keeper = sqlite3.connect(self.database, uri=True, check_same_thread=False)
+
+    def connect(self):
+        try:
+            conn = sqlite3.connect(
+                self.database, uri=self.uri, timeout=self.timeout, isolation_level=None, check_same_thread=False,
+                cached_statements=self.cached_statements
+            )
+            for pragma, value in self.pragmas.items():
+                conn.execute(f"PRAGMA {pragma} = {value}")
+        except sqlite3.Error as e:
+            raise self.translate(e) from e
+        return SQLiteConnection(self, conn)
+
+    def close(self):
+        if self._keeper is not None:
+            self._keeper.close()
+            self._keeper = None
+
+    def date_columns(self, conn):
+        # Nome da coluna -> conversão, lido das declarações do esquema e guardado até
+        # a próxima mudança de esquema. Nomes declarados com tipos diferentes em tabelas
+        # diferentes ficam sem conversão.
+        columns = self._date_columns
+        if columns is None:
+            declared = {}
+            for name, declared_type in conn.execute(
+                "SELECT p.name, p.type FROM sqlite_master m, pragma_table_xinfo(m.name) p WHERE m.type = 'table'"
+            ):
+                declared.setdefault(name, set()).add(SQLITE_DATE_TYPES.get(declared_type.split('(')[0].strip().upper()))
+            columns = {name: types.pop() for name, types in declared.items() if len(types) == 1 and None not in types}
+            self._date_columns = columns
+        return columns
+
+    def schema_changed(self):
+        self._date_columns = None
+
+    def translate(self, e):
+        message = str(e)
+        if isinstance(e, sqlite3.IntegrityError):
+            match = re.search(r"UNIQUE constraint failed: \w+\.(\w+)", message)
+            return IntegrityError(message, key=match.group(1) if match else None)
+        if message.startswith("no such table"):
+            return NoSuchTableError(message)
+        if message.startswith(("database is locked", "disk I/O error", "unable to open", "Cannot operate on a closed")):
+            return OperationalError(message)
+        return Error(message)
+
+    def upsert(self, table, columns, update):
+        # Mesmo contrato de MySQLBackend.upsert: conflito em qualquer chave única, como
+        # no ON DUPLICATE KEY (ON CONFLICT sem alvo, SQLite 3.35+).
+        key = (table, columns, tuple(update.items()))
+        query = self._upserts.get(key)
+        if query is None:
+            assignments = ", ".join(
+                f"{column} = {expression.format(new=f'excluded.{column}', greatest=self.greatest)}"
+                for column, expression in update.items()
+            )
+            query = self._upserts[key] = (
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+                f"ON CONFLICT DO UPDATE SET {assignments}"
+            )
+        return query
+
+    def acquire_lock(self, cursor, name, timeout):
+        # O banco é de um processo só, então a trava nomeada é uma trava do processo.
+        with self._locks_guard:
+            lock = self._locks.setdefault(name, threading.Lock())
+        return lock.acquire(timeout=timeout) if timeout else lock.acquire(blocking=False)
+
+    def release_lock(self, cursor, name):
+        self._locks[name].release()
+
+    def column_exists(self, cursor, table, column):
+        # table_xinfo inclui as colunas geradas, que table_info omite.
+        cursor.execute("SELECT COUNT(*) FROM pragma_table_xinfo(%s) WHERE name = %s", (table, column))
+        return cursor.fetchone()[0] > 0
+
+    def index_exists(self, cursor, table, index):
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s", (table, index))
+        return cursor.fetchone()[0] > 0
+
+    def days_between(self, later, earlier):
+        return f"CAST(julianday({later}) - julianday({earlier}) AS INTEGER)"
+
+    def union_all(self, selects):
+        # Partes de um UNION no SQLite não aceitam ORDER BY/LIMIT sem subconsulta.
+        return " UNION ALL ".join(f"SELECT * FROM ({select})" for select in selects)
+
+    def create_table_like(self, cursor, table, source, row_format=None):
+        # Copia a definição da tabela e dos seus índices, com os nomes trocados.
+        cursor.execute(
+            "SELECT type, name, sql FROM sqlite_master WHERE tbl_name = %s AND type IN ('table', 'index') "
+            "AND sql IS NOT NULL ORDER BY type DESC",
+            (source,)
+        )
+        for kind, name, sql in cursor.fetchall():
+            if kind == 'table':
+                sql = re.sub(rf'^CREATE TABLE "?{source}"?', f"CREATE TABLE IF NOT EXISTS {table}", sql)
+            else:
+                sql = re.sub(
+                    rf'^CREATE (UNIQUE )?INDEX "?{name}"? ON "?{source}"?',
+                    rf"CREATE \1INDEX IF NOT EXISTS {table}_{name} ON {table}", sql
+                )
+            cursor.execute(sql)
+
+BACKENDS = {
+    'mysql': MySQLBackend,
+    'sqlite': SQLiteBackend
+}
+
+def create_backend(db_config):
+    # db_config['backend'] escolhe a implementação; as demais chaves vão para ela.
+    options = dict(db_config)
+    name = options.pop('backend', 'mysql')
+    if name not in BACKENDS:
+        raise ValueError(f"Backend de armazenamento desconhecido: {name}.")
+    return BACKENDS[name](**options)
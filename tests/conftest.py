@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import inventory_service
+from inventory_service import InventoryService
+
+
+@pytest.fixture(autouse=True)
+def fast_passwords(monkeypatch):
+    # O hash real (werkzeug, pbkdf2 com 600 mil iterações) só deixaria a suíte lenta.
+    monkeypatch.setattr(inventory_service, "_hash_password", lambda password, method=None, salt_length=None: "plain$" + password)
+    monkeypatch.setattr(inventory_service, "_check_password", lambda password_hash, password: password_hash == "plain$" + password)
+    monkeypatch.setattr(inventory_service, "_password_needs_rehash", lambda password_hash: False)
+    monkeypatch.setitem(inventory_service.PASSWORD_CONFIG, "import_workers", 1)
+
+
+@pytest.fixture
+def service():
+    # Banco SQLite em memória: cada teste começa com o esquema vazio e o admin padrão.
+    service = InventoryService({'backend': 'sqlite', 'path': ':memory:'})
+    service.init_db()
+    yield service
+    service.close()
+
+
+@pytest.fixture
+def file_service(tmp_path):
+    # Arquivo em disco: o pool abre várias conexões, como os terminais de uma loja.
+    service = InventoryService({'backend': 'sqlite', 'path': str(tmp_path / "estoque.db")})
+    service.init_db()
+    yield service
+    service.close()
@@ -0,0 +1,103 @@
+import threading
+
+import pytest
+
+from inventory_service import ConnectionPool, PoolExhaustedError
+from storage import Error, create_backend
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = create_backend({'backend': 'sqlite', 'path': str(tmp_path / "estoque.db")})
+    yield backend
+    backend.close()
+
+
+def test_released_connection_is_reused(backend):
+    pool = ConnectionPool(backend, pool_size=2)
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    assert pool.stats()['in_use'] == 1 and pool.stats()['checkouts'] == 2
+
+
+def test_release_rolls_back_open_transaction(backend):
+    pool = ConnectionPool(backend, pool_size=1)
+    conn = pool.acquire()
+    cursor = conn.cursor()
+    cursor.execute("CREATE TABLE t (x INT)")
+    conn.commit()
+    cursor.execute("INSERT INTO t (x) VALUES (1)")
+    cursor.close()
+    pool.release(conn)
+
+    conn = pool.acquire()
+    assert not conn.in_transaction
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM t")
+    assert cursor.fetchall() == [(0,)]
+
+
+def test_exhausted_pool_times_out(backend):
+    pool = ConnectionPool(backend, pool_size=1, checkout_timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(PoolExhaustedError):
+        pool.acquire()
+    assert pool.stats()['timeouts'] == 1
+
+    # Quem espera recebe a conexão assim que ela é devolvida.
+    acquired = []
+    pool.checkout_timeout = 5
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    waiter.start()
+    pool.release(conn)
+    waiter.join()
+    assert acquired == [conn]
+
+
+def test_discarded_connection_is_replaced(backend):
+    pool = ConnectionPool(backend, pool_size=1)
+    conn = pool.acquire()
+    pool.release(conn, discard=True)
+    assert pool.stats()['idle'] == 0 and pool.stats()['in_use'] == 0
+    assert pool.acquire() is not conn
+
+
+class _DroppedConnection:
+    # Conexão que o servidor derrubou enquanto estava ociosa no pool.
+    in_transaction = False
+
+    def ping(self):
+        raise Error("Lost connection to MySQL server")
+
+    def close(self):
+        pass
+
+
+class _Backend:
+    max_connections = None
+
+    def __init__(self):
+        self.connections = []
+
+    def connect(self):
+        conn = _DroppedConnection() if not self.connections else object()
+        self.connections.append(conn)
+        return conn
+
+
+def test_dead_idle_connection_is_reconnected():
+    backend = _Backend()
+    pool = ConnectionPool(backend, pool_size=1, health_check_interval=0)
+    pool.release(pool.acquire())
+
+    assert pool.acquire() is backend.connections[1]
+    assert pool.stats()['reconnects'] == 1
+
+
+def test_idle_connections_expire(backend):
+    pool = ConnectionPool(backend, pool_size=2, idle_timeout=0)
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.stats()['idle'] == 0
+    assert pool.acquire() is not conn
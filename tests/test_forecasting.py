@@ -0,0 +1,70 @@
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from forecasting import FORECAST_CONFIG, StockForecaster
+
+
+def _seed(service, product_id, opening, daily_saidas):
+    # Saldo de abertura antes da janela e a mesma saída em cada dia completo dela.
+    today = date.today()
+    entries = [(f"{product_id}-open", product_id, 'entrada', opening, datetime.combine(today - timedelta(days=120), time(9)))]
+    entries += [
+        (f"{product_id}-{days_ago}", product_id, 'saida', daily_saidas, datetime.combine(today - timedelta(days=days_ago), time(12)))
+        for days_ago in range(1, FORECAST_CONFIG['history_days'] + 1)
+    ]
+    assert service.apply_journal_batch(entries) == []
+
+
+def test_forecast_rates_and_reorder_suggestion(service):
+    service.add_product("Gaze", "", 0)
+    service.add_product("Luva", "", 0)
+    service.add_product("Touca", "", 0)
+    _seed(service, 1, 1000, 2)
+    _seed(service, 2, 190, 2)
+
+    forecast = {row['product_id']: row for row in service.get_stock_forecast(product_ids=[1, 2, 3])}
+    assert forecast[1]['daily_rate'] == 2.0
+    assert forecast[1]['current_quantity'] == 820
+    assert forecast[1]['days_to_stockout'] == 410.0
+    assert forecast[1]['suggested_quantity'] == 0
+    # Ponto de pedido: 7 dias de prazo + 3 de segurança; a compra cobre mais 30 dias.
+    assert forecast[2]['days_to_stockout'] == 5.0
+    assert forecast[2]['reorder_point'] == 20
+    assert forecast[2]['suggested_quantity'] == 70
+    assert forecast[2]['name'] == "Luva"
+    assert forecast[3]['daily_rate'] == 0.0 and forecast[3]['days_to_stockout'] is None
+
+    assert [row['product_id'] for row in service.get_stock_forecast(limit=10)] == [2, 1]
+
+
+def test_forecast_follows_the_change_feed(service):
+    service.add_product("Gaze", "", 0)
+    _seed(service, 1, 1000, 2)
+    assert service.get_stock_forecast(product_ids=[1])[0]['current_quantity'] == 820
+
+    # Saídas de hoje mudam o estoque na hora; a taxa só conta dias completos.
+    service.record_movement(1, 'saida', 20)
+    service.add_product("Luva", "", 5)
+    forecast = {row['product_id']: row for row in service.get_stock_forecast(product_ids=[1, 2])}
+    assert forecast[1]['current_quantity'] == 800
+    assert forecast[1]['daily_rate'] == 2.0
+    assert forecast[2]['reorder_point'] == 5
+    assert forecast[2]['suggested_quantity'] == 5
+
+
+def test_forecaster_window_slides_at_day_change():
+    forecaster = StockForecaster()
+    today = date(2026, 3, 10)
+    first_day = forecaster.start(today)
+    forecaster.load_products([(1, 100, 0)])
+    forecaster.load_saidas([(1, (today - timedelta(days=1) - first_day).days, 90)])
+    forecaster.finish_load(marks=None)
+    rate = forecaster.forecast_for([1])[0]['daily_rate']
+    assert rate > 0
+
+    forecaster.advance_to(today + timedelta(days=FORECAST_CONFIG['history_days'] + 1))
+    assert forecaster.forecast_for([1])[0]['daily_rate'] == 0.0
+    assert forecaster.forecast_for([7]) == []
@@ -0,0 +1,127 @@
+from datetime import date
+
+import pytest
+
+from inventory_api import InventoryApi
+
+
+@pytest.fixture
+def api(service):
+    return InventoryApi(service)
+
+
+@pytest.fixture
+def token(api):
+    status, body = api.dispatch('POST', '/auth/login', {'username': 'admin', 'password': 'adminpass'}, None)
+    assert status == 200
+    return body['token']
+
+
+def test_batch_rejects_malformed_items(api, token):
+    # Um item inválido recebe 400 no próprio lugar; os demais itens do lote seguem.
+    status, body = api.dispatch('POST', '/batch', {'requests': [1, {'path': 5}, {'path': '/products?limit=1'}]}, token)
+    assert status == 200
+    assert [response['status'] for response in body['responses']] == [400, 400, 200]
+
+
+def test_batch_requires_list(api, token):
+    status, _ = api.dispatch('POST', '/batch', {'requests': "abc"}, token)
+    assert status == 400
+
+
+def test_batch_runs_valid_items(api, token):
+    api.service.add_product("Gaze", "", 0)
+    status, body = api.dispatch('POST', '/batch', {'requests': [{'path': '/products?limit=1'}]}, token)
+    assert status == 200
+    assert [p['name'] for p in body['responses'][0]['body']['products']] == ["Gaze"]
+
+
+def test_invalid_body_and_query_are_bad_requests(api, token):
+    assert api.dispatch('POST', '/movements', {'product_id': 1, 'type': 'entrada'}, token)[0] == 400
+    assert api.dispatch('POST', '/movements', {'product_id': [1], 'type': 'entrada', 'quantity': 1}, token)[0] == 400
+    assert api.dispatch('POST', '/products', ["Gaze"], token)[0] == 400
+    assert api.dispatch('GET', '/products', None, token, {'limit': ['abc']})[0] == 400
+    assert api.dispatch('GET', '/products', None, token, {'sort': ['preco']})[0] == 400
+    assert api.dispatch('GET', '/reports/consumption', None, token, {'start': ['ontem']})[0] == 400
+    assert api.dispatch('GET', '/changes', None, token, {'movement_id': ['1']})[0] == 400
+
+
+def test_service_fault_is_logged_server_error(api, token, monkeypatch, caplog):
+    def broken(*args, **kwargs):
+        raise KeyError('current_quantity')
+    monkeypatch.setattr(api.service, 'get_low_stock_products', broken)
+
+    status, _ = api.dispatch('GET', '/low-stock', None, token)
+    assert status == 500
+    assert "GET /low-stock" in caplog.text
+
+
+def test_login_purges_expired_sessions(api, token):
+    api._sessions[token]['expires_at'] = 0
+    api.dispatch('POST', '/auth/login', {'username': 'admin', 'password': 'adminpass'}, None)
+    assert token not in api._sessions
+    assert len(api._sessions) == 1
+
+
+def test_movements_batch_endpoint(api, token):
+    api.service.add_product("Gaze", "", 0)
+    status, body = api.dispatch('POST', '/movements/batch', {'movements': [
+        {'product_id': 1, 'type': 'entrada', 'quantity': 5},
+        [1, 'saida', 2],
+        {'product_id': 1, 'type': 'saida', 'quantity': 9}
+    ]}, token)
+
+    assert status == 200
+    assert body['applied'] == 2
+    assert body['failures'] == [{'index': 2, 'movement': (1, 'saida', 9), 'error': "Quantidade insuficiente em estoque."}]
+    assert api.dispatch('POST', '/movements/batch', {'movements': [{'product_id': 1}]}, token)[0] == 400
+    assert api.dispatch('POST', '/movements/batch', {'movements': "1,entrada,5"}, token)[0] == 400
+
+
+def test_products_endpoint_pages_with_next_cursor(api, token):
+    for i in range(5):
+        api.service.add_product(f"Produto {i}", "", 0)
+
+    ids, query = [], {'limit': ['2']}
+    while True:
+        status, body = api.dispatch('GET', '/products', None, token, query)
+        assert status == 200
+        ids.extend(p['id'] for p in body['products'])
+        if body['next'] is None:
+            break
+        query = {'limit': ['2'], 'after': [str(body['next'])]}
+    assert ids == [1, 2, 3, 4, 5]
+
+    status, body = api.dispatch('GET', '/products', None, token, {'sort': ['name'], 'desc': ['true'], 'limit': ['2']})
+    assert [p['name'] for p in body['products']] == ["Produto 4", "Produto 3"]
+    assert body['next'] == "Produto 3"
+
+
+def test_changes_endpoint_round_trips_marks(api, token):
+    api.service.add_product("Gaze", "", 0)
+    status, body = api.dispatch('GET', '/changes', None, token, {})
+    assert status == 200 and body['movements'] == []
+
+    api.service.record_movement(1, 'entrada', 2)
+    marks = body['marks']
+    query = {
+        'movement_id': [str(marks['movement_id'])],
+        'product_version': [marks['product_version'].isoformat()],
+        'recent': [",".join(str(i) for i in sorted(marks['recent_movement_ids']))]
+    }
+    status, body = api.dispatch('GET', '/changes', None, token, query)
+    assert status == 200
+    assert [m['quantity'] for m in body['movements']] == [2]
+    assert [p['current_quantity'] for p in body['products']] == [2]
+
+
+def test_history_endpoint(api, token):
+    api.service.add_product("Gaze", "", 0)
+    api.service.record_movement(1, 'entrada', 3)
+    today = date.today().isoformat()
+
+    status, body = api.dispatch('GET', '/products/1/history', None, token, {'start': [today], 'granularity': ['day']})
+    assert status == 200
+    assert [(t['entradas'], t['movements']) for t in body['trend']] == [(3, 1)]
+    assert [m['quantity'] for m in body['movements']] == [3]
+    assert api.dispatch('GET', '/products/1/history', None, token, {'granularity': ['year']})[0] == 400
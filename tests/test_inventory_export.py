@@ -0,0 +1,86 @@
+import csv
+import json
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+import inventory_service
+from inventory_export import export_format, export_to_file
+
+
+def _backdated(service, movements):
+    today = date.today()
+    assert service.apply_journal_batch([
+        (client_id, product_id, movement_type, quantity, datetime.combine(today - timedelta(days=days_ago), time(12)))
+        for client_id, product_id, movement_type, quantity, days_ago in movements
+    ]) == []
+
+
+def test_stream_export_yields_bounded_batches(service, monkeypatch):
+    monkeypatch.setattr(inventory_service, "EXPORT_FETCH_SIZE", 2)
+    for i in range(5):
+        service.add_product(f"Produto {i}", "", 3)
+
+    batches = list(service.stream_export('products'))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert [row[0] for batch in batches for row in batch] == [1, 2, 3, 4, 5]
+    low_stock = [row for batch in service.stream_export('low_stock') for row in batch]
+    assert [row[0] for row in low_stock] == [1, 2, 3, 4, 5]
+
+
+def test_stream_export_filters_movements_across_archives(service):
+    service.add_product("Gaze", "", 0)
+    service.add_product("Luva", "", 0)
+    _backdated(service, [('a', 1, 'entrada', 10, 400), ('b', 2, 'entrada', 4, 400), ('c', 1, 'saida', 3, 5), ('d', 2, 'saida', 1, 2)])
+    assert service.archive_movements(horizon_days=30) == 2
+    today = date.today()
+
+    rows = [row for batch in service.stream_export('movements') for row in batch]
+    assert [(row[1], row[2], row[3]) for row in rows] == [(1, 'entrada', 10), (2, 'entrada', 4), (1, 'saida', 3), (2, 'saida', 1)]
+    rows = [row for batch in service.stream_export('movements', start=today - timedelta(days=10), end=today, product_ids=[1]) for row in batch]
+    assert [(row[1], row[3]) for row in rows] == [(1, 3)]
+    with pytest.raises(ValueError):
+        list(service.stream_export('products', start=today))
+    with pytest.raises(ValueError):
+        list(service.stream_export('fornecedores'))
+
+
+def test_stream_export_can_be_abandoned(service):
+    for i in range(3):
+        service.add_product(f"Produto {i}", "", 0)
+    batches = service.stream_export('products')
+    next(batches)
+    batches.close()
+    # A conexão interrompida não volta ao pool com resultado pendente.
+    assert service.get_product(1)['name'] == "Produto 0"
+    assert service.pool.stats()['in_use'] == 0
+
+
+def test_export_to_file_writes_csv_and_jsonl(service, tmp_path):
+    service.add_product("Gaze", "estéril, 10cm", 0)
+    service.record_movement(1, 'entrada', 4)
+
+    path = tmp_path / "produtos.csv"
+    assert export_to_file(service, 'products', str(path)) == 1
+    with open(path, newline='', encoding='utf-8') as exported:
+        assert list(csv.reader(exported)) == [
+            ['id', 'name', 'description', 'current_quantity', 'min_quantity'], ['1', 'Gaze', 'estéril, 10cm', '4', '0']
+        ]
+
+    path = tmp_path / "movimentacoes.jsonl"
+    assert export_to_file(service, 'movements', str(path)) == 1
+    row = json.loads(path.read_text(encoding='utf-8'))
+    assert (row['product_id'], row['type'], row['quantity']) == (1, 'entrada', 4)
+    assert datetime.fromisoformat(row['movement_date']).date() == date.today()
+    assert not (tmp_path / "movimentacoes.jsonl.part").exists()
+
+
+def test_export_to_file_leaves_no_partial_file(service, tmp_path):
+    path = tmp_path / "relatorio.csv"
+    with pytest.raises(ValueError):
+        export_to_file(service, 'products', str(path), fmt='xlsx')
+    with pytest.raises(ValueError):
+        export_to_file(service, 'fornecedores', str(path))
+    assert list(tmp_path.iterdir()) == []
+    assert export_format("dados.ndjson") == 'jsonl'
+    assert export_format("dados.CSV") == 'csv'
@@ -0,0 +1,640 @@
+import os
+import subprocess
+import sys
+import threading
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+import inventory_service
+from inventory_service import MAX_MOVEMENT_QUANTITY, QUANTITY_LIMIT_MESSAGE, InventoryService
+
+
+def run_sql(service, query, params=()):
+    conn = service.pool.acquire()
+    cursor = conn.cursor()
+    try:
+        service._execute_on_cursor(cursor, query, params)
+        conn.commit()
+    finally:
+        cursor.close()
+        service.pool.release(conn)
+
+
+def test_init_db_is_idempotent(service):
+    assert service.init_db() == []
+    assert service.authenticate_user('admin', 'adminpass')[0]
+
+
+def test_embedded_schema_upgrades_through_migrations(tmp_path, monkeypatch):
+    # Um banco criado por uma versão antiga recebe só as migrações que faltam.
+    path = str(tmp_path / "estoque.db")
+    migrations = InventoryService.SCHEMA_MIGRATIONS
+    monkeypatch.setattr(InventoryService, "SCHEMA_MIGRATIONS", migrations[:4])
+    old = InventoryService({'backend': 'sqlite', 'path': path})
+    old.init_db()
+    old.add_product("Luva", "nitrílica", 2)
+    old.close()
+
+    monkeypatch.setattr(InventoryService, "SCHEMA_MIGRATIONS", migrations)
+    service = InventoryService({'backend': 'sqlite', 'path': path})
+    try:
+        assert service.init_db() == list(range(5, len(migrations) + 1))
+        assert service.record_movement(1, 'entrada', 5)[0]
+        assert service.apply_journal_batch([('c1', 1, 'entrada', 2, datetime.now())]) == []
+        assert service.get_product(1)['current_quantity'] == 7
+    finally:
+        service.close()
+
+
+def test_sqlite_converts_declared_dates_only(service):
+    service.add_product("Gaze", "", 0)
+    assert service._execute_query("SELECT version FROM schema_version", fetch_one=True)['version'] == len(InventoryService.SCHEMA_MIGRATIONS)
+    # Um apelido não ganha conversão de data só pelo nome.
+    assert service._execute_query("SELECT 'v2' AS version", fetch_one=True)['version'] == 'v2'
+    assert isinstance(service.get_sync_marks()['product_version'], datetime)
+    assert isinstance(service._execute_query("SELECT updated_at FROM products", fetch_one=True)['updated_at'], datetime)
+
+
+def test_newer_schema_is_left_alone(service, caplog):
+    run_sql(service, "UPDATE schema_version SET version = %s", (len(InventoryService.SCHEMA_MIGRATIONS) + 1,))
+    assert service.init_db() == []
+    assert "mais nova que a do app" in caplog.text
+
+
+def test_service_import_defers_heavy_modules():
+    # A partida do app não paga pelo werkzeug nem pelo NumPy.
+    code = "import sys, inventory_service; print(sorted(m for m in ('werkzeug', 'numpy') if m in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=os.path.dirname(inventory_service.__file__), capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "[]"
+
+
+def test_first_poll_after_marks_skips_existing_movements(service):
+    service.add_product("Álcool", "", 0)
+    for _ in range(5):
+        service.record_movement(1, 'entrada', 1)
+    marks = service.get_sync_marks()
+    assert service.fetch_changes(marks)['movements'] == []
+
+    service.record_movement(1, 'entrada', 1)
+    assert [m['id'] for m in service.fetch_changes(marks)['movements']] == [6]
+
+
+def test_record_movement_updates_stock_and_ledger(service):
+    service.add_product("Gaze", "", 0)
+    ok, message, product = service.record_movement(1, 'entrada', 5)
+    assert ok and message == "Entrada de estoque registrada com sucesso."
+    assert product['current_quantity'] == 5
+
+    assert service.record_movement(1, 'saida', 6) == (False, "Quantidade insuficiente em estoque.", None)
+    assert service.record_movement(9, 'saida', 1) == (False, "Produto não encontrado.", None)
+    assert service.record_movement(9, 'entrada', 1) == (False, "Produto não encontrado.", None)
+    assert not service.record_movement(1, 'saida', 0)[0]
+    assert not service.record_movement(1, 'entrada', "cinco")[0]
+    assert service.record_movement(1, 'saida', 5)[2]['current_quantity'] == 0
+
+    history = service._execute_query("SELECT type, quantity FROM stock_movements ORDER BY id")
+    assert [(m['type'], m['quantity']) for m in history] == [('entrada', 5), ('saida', 5)]
+    assert service.reconcile_stock(full=True)['drift'] == []
+
+
+def test_concurrent_saidas_never_oversell(file_service):
+    file_service.add_product("Gaze", "", 0)
+    file_service.record_movement(1, 'entrada', 40)
+    results = []
+
+    def clerk():
+        for _ in range(20):
+            results.append(file_service.record_movement(1, 'saida', 1)[0])
+
+    threads = [threading.Thread(target=clerk) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(True) == 40
+    assert file_service.get_product(1)['current_quantity'] == 0
+    assert file_service.reconcile_stock(full=True)['drift'] == []
+
+
+def test_low_stock_set_follows_quantities(service):
+    service.add_product("Gaze", "", 5)
+    service.add_product("Luva", "", 0)
+    service.add_product("Touca", "", 2)
+    assert [p['id'] for p in service.get_low_stock_products()] == [1, 3]
+
+    service.record_movement(1, 'entrada', 6)
+    service.apply_movements_batch([(3, 'entrada', 2)])
+    assert [p['id'] for p in service.get_low_stock_products()] == [3]
+
+    service.record_movement(1, 'saida', 1)
+    service.update_product(3, "Touca", "", 1)
+    service.update_product(2, "Luva", "", 3)
+    assert service.get_low_stock_products() == [
+        {'id': 1, 'name': "Gaze", 'current_quantity': 5, 'min_quantity': 5},
+        {'id': 2, 'name': "Luva", 'current_quantity': 0, 'min_quantity': 3}
+    ]
+
+
+def test_record_movement_rejects_quantity_above_column_limit(service):
+    service.add_product("Seringa", "", 0)
+    assert service.record_movement(1, 'entrada', MAX_MOVEMENT_QUANTITY + 1) == (False, QUANTITY_LIMIT_MESSAGE, None)
+    assert service.get_product(1)['current_quantity'] == 0
+
+
+def test_journal_refused_entry_becomes_conflict(service):
+    # Um erro do banco que não é transitório recusa só a entrada culpada.
+    service.add_product("Gaze", "", 0)
+    run_sql(service, '''
+        CREATE TRIGGER reject_thirteen BEFORE INSERT ON stock_movements
+        WHEN NEW.quantity = 13 BEGIN SELECT RAISE(ABORT, 'quantidade proibida'); END
+    ''')
+    now = datetime.now()
+    conflicts = service.apply_journal_batch([
+        ('c1', 1, 'entrada', 5, now),
+        ('c2', 1, 'entrada', 13, now),
+        ('c3', 1, 'entrada', 7, now),
+        ('c4', 1, 'entrada', MAX_MOVEMENT_QUANTITY + 1, now)
+    ])
+    conflicts = dict(conflicts)
+    assert sorted(conflicts) == ['c2', 'c4']
+    assert conflicts['c2'].startswith("Recusada pelo banco")
+    assert conflicts['c4'] == QUANTITY_LIMIT_MESSAGE
+    assert service.get_product(1)['current_quantity'] == 12
+
+
+def test_movement_batch_applies_valid_rows_and_reports_failures(service):
+    service.add_product("Gaze", "", 0)
+    service.add_product("Luva", "", 0)
+    applied, failures = service.apply_movements_batch([
+        (1, 'entrada', 10),
+        (2, 'Entrada', 4),
+        (1, 'saída', 3),
+        (2, 'saida', 5),
+        (9, 'entrada', 1),
+        (1, 'devolução', 1),
+        ("um", 'entrada', 1),
+        (1, 'entrada', 0)
+    ], chunk_size=3)
+
+    assert applied == 3
+    assert sorted((ref, reason) for ref, _, reason in failures) == [
+        (3, "Quantidade insuficiente em estoque."),
+        (4, "Produto não encontrado."),
+        (5, "Tipo de movimentação inválido: devolução."),
+        (6, "Linha inválida: esperado produto, tipo e quantidade inteiros."),
+        (7, "Quantidade deve ser um número inteiro positivo.")
+    ]
+    assert service.get_product(1)['current_quantity'] == 7
+    assert service.get_product(2)['current_quantity'] == 4
+    history = service._execute_query("SELECT product_id, type, quantity FROM stock_movements ORDER BY id")
+    assert [(m['product_id'], m['type'], m['quantity']) for m in history] == [(1, 'entrada', 10), (2, 'entrada', 4), (1, 'saida', 3)]
+    assert service.reconcile_stock(full=True)['drift'] == []
+
+
+def test_movement_batch_checks_balance_in_order(service):
+    # A saída só passa se as entradas anteriores do mesmo lote já cobrem o saldo.
+    service.add_product("Gaze", "", 0)
+    applied, failures = service.apply_movements_batch([(1, 'saida', 2), (1, 'entrada', 5), (1, 'saida', 2), (1, 'saida', 4)])
+
+    assert applied == 2
+    assert [ref for ref, _, _ in failures] == [0, 3]
+    assert service.get_product(1)['current_quantity'] == 3
+
+
+def test_movement_csv_reports_failures_by_line(service, tmp_path):
+    service.add_product("Gaze", "", 0)
+    path = tmp_path / "movimentacoes.csv"
+    path.write_text("produto,tipo,quantidade\n1,entrada,5\n1,saida,x\n2,entrada,1\n1,saida,2\n", encoding='utf-8')
+
+    applied, failures = service.import_movements_csv(str(path), chunk_size=2)
+    assert applied == 2
+    assert [(line, reason) for line, _, reason in failures] == [
+        (3, "Linha inválida: esperado produto, tipo e quantidade inteiros."),
+        (4, "Produto não encontrado.")
+    ]
+    assert service.get_product(1)['current_quantity'] == 3
+
+
+def test_movement_csv_missing_file_is_reported(service, tmp_path):
+    applied, failures = service.import_movements_csv(str(tmp_path / "nada.csv"))
+    assert applied == 0
+    assert failures[0][2].startswith("Erro ao ler o arquivo")
+
+
+def test_movement_batch_refused_row_fails_alone(service):
+    # Uma linha recusada pelo banco não desfaz as outras do lote.
+    service.add_product("Gaze", "", 0)
+    service.add_product("Luva", "", 0)
+    run_sql(service, '''
+        CREATE TRIGGER reject_thirteen BEFORE INSERT ON stock_movements
+        WHEN NEW.quantity = 13 BEGIN SELECT RAISE(ABORT, 'quantidade proibida'); END
+    ''')
+    applied, failures = service.apply_movements_batch([(1, 'entrada', 5), (2, 'entrada', 13), (2, 'entrada', 1)])
+
+    assert applied == 2
+    assert [(ref, movement) for ref, movement, _ in failures] == [(1, (2, 'entrada', 13))]
+    assert failures[0][2].startswith("Recusada pelo banco")
+    assert service.get_product(1)['current_quantity'] == 5
+    assert service.get_product(2)['current_quantity'] == 1
+
+
+def test_journal_replay_is_idempotent(service):
+    service.add_product("Máscara", "", 0)
+    entries = [('c1', 1, 'entrada', 4, datetime.now())]
+    assert service.apply_journal_batch(entries) == []
+    assert service.apply_journal_batch(entries) == []
+    assert service.get_product(1)['current_quantity'] == 4
+
+
+def test_journal_replay_after_archival(service):
+    service.add_product("Luva", "", 0)
+    old = datetime.now() - timedelta(days=400)
+    entries = [('c1', 1, 'entrada', 7, old)]
+    assert service.apply_journal_batch(entries) == []
+    run_sql(service, "UPDATE stock_movements SET movement_date = %s", (old,))
+    assert service.archive_movements(horizon_days=30) == 1
+
+    assert service.apply_journal_batch(entries) == []
+    assert service.get_product(1)['current_quantity'] == 7
+    assert service.reconcile_stock(full=True)['drift'] == []
+
+
+def _checkpoints(service):
+    rows = service._execute_query("SELECT product_id, balance, movements FROM stock_movement_checkpoints ORDER BY product_id")
+    return [(row['product_id'], row['balance'], row['movements']) for row in rows]
+
+
+def test_archive_moves_old_movements_in_batches(service):
+    service.add_product("Gaze", "", 0)
+    service.add_product("Luva", "", 0)
+    _backdated(service, [
+        ('a', 1, 'entrada', 20, 400), ('b', 1, 'saida', 5, 380), ('c', 2, 'entrada', 8, 200),
+        ('d', 1, 'saida', 2, 60), ('e', 1, 'saida', 1, 2)
+    ])
+    today = date.today()
+    trend = service.get_product_trend(1, today - timedelta(days=500), today, 'month')
+
+    assert service.archive_movements(horizon_days=30, batch_size=2, pause=0) == 4
+    assert service._execute_query("SELECT id FROM stock_movements") == [{'id': 5}]
+    months = service._execute_query("SELECT table_name FROM stock_movement_archives ORDER BY month")
+    assert len(months) == len({(today - timedelta(days=d)).replace(day=1) for d in (400, 380, 200, 60)})
+    assert _checkpoints(service) == [(1, 13, 3), (2, 8, 1)]
+
+    # Rodar de novo não arquiva nada e não mexe nos pontos de controle.
+    assert service.archive_movements(horizon_days=30, batch_size=2, pause=0) == 0
+    assert _checkpoints(service) == [(1, 13, 3), (2, 8, 1)]
+
+    assert service.reconcile_stock(full=True)['drift'] == []
+    assert service.get_product_trend(1, today - timedelta(days=500), today, 'month') == trend
+    assert [p['current_quantity'] for p in service.get_all_products()] == [12, 8]
+
+
+def test_archive_then_new_movements_keep_ledger_balanced(service):
+    service.add_product("Gaze", "", 0)
+    _backdated(service, [('a', 1, 'entrada', 10, 100)])
+    assert service.archive_movements(horizon_days=30) == 1
+
+    assert service.record_movement(1, 'saida', 4)[0]
+    _backdated(service, [('b', 1, 'saida', 1, 90)])
+    assert service.archive_movements(horizon_days=30) == 1
+    assert _checkpoints(service) == [(1, 9, 2)]
+    assert service.reconcile_stock(full=True)['drift'] == []
+    assert service.get_product(1)['current_quantity'] == 5
+
+
+def test_reconcile_reports_drift_until_repaired(service):
+    service.add_product("Álcool", "", 0)
+    service.record_movement(1, 'entrada', 5)
+    run_sql(service, "UPDATE products SET current_quantity = 9 WHERE id = 1")
+
+    for _ in range(2):
+        drift = service.reconcile_stock()['drift']
+        assert [(d['product_id'], d['repaired']) for d in drift] == [(1, False)]
+    assert service.reconcile_stock(repair=True)['drift'][0]['repaired']
+    assert service.reconcile_stock()['drift'] == []
+    assert service.get_product(1)['current_quantity'] == 5
+
+
+def test_user_import_is_case_insensitive(service, tmp_path):
+    service.register_user('Ana', 'senha', 'comum')
+    path = tmp_path / "usuarios.csv"
+    path.write_text("\n\nusuario,senha,perfil\nana,x,comum\nbeto,x,comum\nBETO,y,comum\nADMIN,z,admin\ncarla,w,\n", encoding='utf-8-sig')
+
+    created, failures = service.import_users_csv(str(path))
+    assert created == 2
+    assert [(line, username) for line, username, _ in failures] == [(4, 'ana'), (6, 'BETO'), (7, 'ADMIN')]
+    assert service.authenticate_user('carla', 'w')[0]
+
+
+def test_user_import_validates_rows_and_retries_conflicts(service, tmp_path):
+    # Um usuário criado por outro terminal no meio da importação desfaz o lote; as
+    # linhas vão uma a uma e só a recusada falha.
+    run_sql(service, '''
+        CREATE TRIGGER taken_username BEFORE INSERT ON users
+        WHEN NEW.username = 'carla' BEGIN SELECT RAISE(ABORT, 'UNIQUE constraint failed: users.username'); END
+    ''')
+    path = tmp_path / "usuarios.csv"
+    path.write_text("ana,1,admin\nbeto,2\ncarla,3\ndora,\neva,5,gerente\nfabio,6,comum\n", encoding='utf-8')
+
+    created, failures = service.import_users_csv(str(path), batch_size=10)
+    assert created == 3
+    assert [(line, username, reason) for line, username, reason in failures] == [
+        (3, 'carla', "Usuário já existe."),
+        (4, 'dora', "Nome de usuário e senha são obrigatórios."),
+        (5, 'eva', "Perfil inválido: gerente.")
+    ]
+    assert [u['username'] for u in service.get_users()] == ['admin', 'ana', 'beto', 'fabio']
+    assert service.authenticate_user('ana', '1') == (2, 'admin')
+
+
+def test_login_rehashes_passwords_made_with_an_old_method(service, monkeypatch):
+    monkeypatch.setattr(inventory_service, "_hash_password", lambda password, method=None, salt_length=None: f"{method or inventory_service.PASSWORD_CONFIG['method']}$" + password)
+    monkeypatch.setattr(inventory_service, "_check_password", lambda password_hash, password: password_hash.split('$', 1)[1] == password)
+    monkeypatch.setattr(inventory_service, "_password_needs_rehash", lambda password_hash: password_hash.split('$', 1)[0] != inventory_service.PASSWORD_CONFIG['method'])
+    monkeypatch.setitem(inventory_service.PASSWORD_CONFIG, 'method', 'antigo')
+    service.register_user('ana', 'segredo', 'comum')
+
+    monkeypatch.setitem(inventory_service.PASSWORD_CONFIG, 'method', 'novo')
+    assert service.authenticate_user('ana', 'errada') == (None, None)
+    assert service._execute_query("SELECT password FROM users WHERE username = 'ana'", fetch_one=True)['password'] == "antigo$segredo"
+    assert service.authenticate_user('ana', 'segredo')[1] == 'comum'
+    assert service._execute_query("SELECT password FROM users WHERE username = 'ana'", fetch_one=True)['password'] == "novo$segredo"
+
+
+def test_parallel_password_hashing_matches_serial(service, monkeypatch):
+    pytest.importorskip("werkzeug")
+    monkeypatch.undo()
+    monkeypatch.setitem(inventory_service.PASSWORD_CONFIG, 'method', 'pbkdf2:sha256:1000')
+    monkeypatch.setitem(inventory_service.PASSWORD_CONFIG, 'import_workers', 2)
+    hashes = service._hash_passwords(["a", "b", "c"])
+    assert [inventory_service._check_password(h, p) for h, p in zip(hashes, "abc")] == [True, True, True]
+    assert all(h.startswith("pbkdf2:sha256:1000$") for h in hashes)
+
+
+def test_movement_csv_header_after_blank_lines(service, tmp_path):
+    service.add_product("Gaze", "", 0)
+    path = tmp_path / "movimentacoes.csv"
+    path.write_text("\n,\nproduto,tipo,quantidade\n1,entrada,10\n1,saída,3\n", encoding='utf-8-sig')
+
+    assert service.import_movements_csv(str(path)) == (2, [])
+    assert service.get_product(1)['current_quantity'] == 7
+
+
+def test_search_on_empty_catalog_does_not_reload(service, monkeypatch):
+    assert service.search_products("gaze") == []
+
+    def reload():
+        raise AssertionError("índice recarregado")
+    monkeypatch.setattr(service, "_load_search_index", reload)
+    # Uma recarga em andamento (lendo o banco) não segura a digitação.
+    with service._search_refresh_lock:
+        assert service.search_products("gaze") == []
+
+
+def test_search_refresh_with_concurrent_movements(tmp_path, monkeypatch):
+    # Com o pool pequeno, a recarga do índice não pode segurar a trava de busca
+    # enquanto espera uma conexão.
+    monkeypatch.setitem(inventory_service.POOL_CONFIG, 'pool_size', 2)
+    monkeypatch.setitem(inventory_service.POOL_CONFIG, 'checkout_timeout', 2)
+    service = InventoryService({'backend': 'sqlite', 'path': str(tmp_path / "estoque.db")})
+    service.init_db()
+    try:
+        for i in range(5):
+            service.add_product(f"Produto {i}", "descrição", 1)
+        errors = []
+
+        def record():
+            for _ in range(30):
+                ok, message, _ = service.record_movement(1, 'entrada', 1)
+                if not ok:
+                    errors.append(message)
+
+        def refresh():
+            for _ in range(30):
+                try:
+                    service.refresh_search_index()
+                    service.search_products("produto 1")
+                except Exception as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=target) for target in (record, record, refresh)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert [p['name'] for p in service.search_products("produto 1")] == ["Produto 1"]
+        assert service.get_product(1)['current_quantity'] == 60
+    finally:
+        service.close()
+
+
+def test_products_page_walks_catalog_by_key(service):
+    # Nomes sem acento: a ordem de letras acentuadas depende da collation do banco.
+    for name in ["Gaze", "Alcool", "Luva", "Seringa", "Mascara", "Touca", "Avental"]:
+        service.add_product(name, "", 0)
+
+    pages, boundary = [], None
+    while True:
+        page = service.get_products_page('id', boundary=boundary, limit=3)
+        if not page:
+            break
+        pages.append([p['id'] for p in page])
+        boundary = page[-1]['id']
+    assert pages == [[1, 2, 3], [4, 5, 6], [7]]
+
+    assert [p['id'] for p in service.get_products_page('id', descending=True, boundary=5, limit=2)] == [4, 3]
+    assert [p['name'] for p in service.get_products_page('name', limit=3)] == ["Alcool", "Avental", "Gaze"]
+    assert [p['name'] for p in service.get_products_page('name', boundary="Gaze", limit=2)] == ["Luva", "Mascara"]
+
+
+def test_products_page_backward_and_inclusive(service):
+    for i in range(1, 8):
+        service.add_product(f"Produto {i}", "", 0)
+
+    # Página anterior: os itens antes da fronteira, devolvidos na ordem da lista.
+    assert [p['id'] for p in service.get_products_page('id', boundary=5, backward=True, limit=2)] == [3, 4]
+    assert [p['id'] for p in service.get_products_page('id', descending=True, boundary=3, backward=True, limit=2)] == [5, 4]
+    # Recarregar a página atual a partir do primeiro item dela.
+    assert [p['id'] for p in service.get_products_page('id', boundary=4, inclusive=True, limit=2)] == [4, 5]
+
+
+def test_products_page_rejects_unknown_sort(service):
+    with pytest.raises(ValueError):
+        service.get_products_page('current_quantity')
+
+
+def test_product_cache_serves_reads_and_tracks_local_writes(service):
+    service.add_product("Gaze", "", 0)
+    service.get_product(1)
+    hits = service.product_cache.stats()['hits']
+    assert service.get_product(1)['name'] == "Gaze"
+    assert service.product_cache.stats()['hits'] == hits + 1
+
+    service.record_movement(1, 'entrada', 4)
+    service.update_product(1, "Gaze estéril", "", 2)
+    assert service.get_product(1) == {'id': 1, 'name': "Gaze estéril", 'description': "", 'current_quantity': 4, 'min_quantity': 2}
+    service.apply_movements_batch([(1, 'saida', 1)])
+    assert service.get_product(1)['current_quantity'] == 3
+    assert service.get_products([1, 9]) == {1: service.get_product(1)}
+
+
+def test_product_cache_sees_writes_from_other_terminals(tmp_path, monkeypatch):
+    monkeypatch.setitem(inventory_service.CACHE_CONFIG, 'version_check_interval', 0)
+    path = str(tmp_path / "estoque.db")
+    first = InventoryService({'backend': 'sqlite', 'path': path})
+    first.init_db()
+    second = InventoryService({'backend': 'sqlite', 'path': path})
+    try:
+        first.add_product("Gaze", "", 0)
+        first.add_product("Luva", "", 0)
+        assert first.get_product(1)['current_quantity'] == 0
+        assert first.get_product(2)['name'] == "Luva"
+
+        second.record_movement(1, 'entrada', 6)
+        second.update_product(2, "Luva nitrílica", "", 0)
+        assert first.get_product(1)['current_quantity'] == 6
+        assert first.get_product(2)['name'] == "Luva nitrílica"
+    finally:
+        second.close()
+        first.close()
+
+
+def test_product_cache_evicts_least_recently_used():
+    cache = inventory_service.ProductCache(max_size=2)
+    for product_id in (1, 2):
+        cache.put({'id': product_id, 'name': str(product_id)})
+    cache.get(1)
+    cache.put({'id': 3, 'name': "3"})
+
+    assert cache.get(2) is None
+    assert cache.get(1)['name'] == "1"
+    assert cache.stats()['evictions'] == 1
+    # Quem recebe o produto não altera a cópia guardada.
+    cache.get(1)['name'] = "alterado"
+    assert cache.get(1)['name'] == "1"
+
+
+def test_change_feed_between_two_terminals(tmp_path):
+    path = str(tmp_path / "estoque.db")
+    counter = InventoryService({'backend': 'sqlite', 'path': path})
+    counter.init_db()
+    office = InventoryService({'backend': 'sqlite', 'path': path})
+    try:
+        counter.add_product("Gaze", "", 0)
+        counter.add_product("Luva", "", 0)
+        marks = counter.get_sync_marks()
+
+        office.record_movement(1, 'entrada', 8)
+        office.apply_movements_batch([(2, 'entrada', 3), (1, 'saida', 2)])
+        office.update_product(2, "Luva nitrílica", "", 1)
+        office.add_product("Touca", "", 0)
+
+        changes = counter.fetch_changes(marks)
+        assert [(m['product_id'], m['type'], m['quantity']) for m in changes['movements']] == [
+            (1, 'entrada', 8), (2, 'entrada', 3), (1, 'saida', 2)
+        ]
+        products = {p['id']: p for p in changes['products']}
+        assert sorted(products) == [1, 2, 3]
+        assert products[1]['current_quantity'] == 6
+        assert products[2]['name'] == "Luva nitrílica"
+        assert changes['marks']['movement_id'] == 3
+
+        # A marca nova já cobre tudo o que foi entregue.
+        again = counter.fetch_changes(changes['marks'])
+        assert again['movements'] == []
+        assert counter.get_product(2)['name'] == "Luva nitrílica"
+
+        office.record_movement(3, 'entrada', 1)
+        latest = counter.fetch_changes(again['marks'])
+        assert [m['id'] for m in latest['movements']] == [4]
+        assert [p['current_quantity'] for p in latest['products'] if p['id'] == 3] == [1]
+    finally:
+        office.close()
+        counter.close()
+
+
+def test_change_feed_rereads_overlap_without_repeating(service):
+    service.add_product("Gaze", "", 0)
+    for _ in range(3):
+        service.record_movement(1, 'entrada', 1)
+    marks = service.get_sync_marks()
+    assert marks['recent_movement_ids'] == frozenset({1, 2, 3})
+
+    # Uma movimentação com id abaixo da marca (transação confirmada fora de ordem)
+    # ainda chega pela janela de sobreposição.
+    run_sql(service, "DELETE FROM stock_movements WHERE id = 2")
+    marks = dict(marks, recent_movement_ids=frozenset({1, 3}))
+    run_sql(
+        service, "INSERT INTO stock_movements (id, product_id, type, quantity, movement_date) VALUES (2, 1, 'entrada', 1, %s)",
+        (datetime.now(),)
+    )
+    changes = service.fetch_changes(marks)
+    assert [m['id'] for m in changes['movements']] == [2]
+    assert service.fetch_changes(changes['marks'])['movements'] == []
+
+
+def _backdated(service, movements):
+    # (cliente, produto, tipo, quantidade, dias atrás) pelo diário, que grava a data de origem.
+    today = date.today()
+    conflicts = service.apply_journal_batch([
+        (client_id, product_id, movement_type, quantity, datetime.combine(today - timedelta(days=days_ago), time(12)))
+        for client_id, product_id, movement_type, quantity, days_ago in movements
+    ])
+    assert conflicts == []
+
+
+def test_movement_history_is_ranged_and_newest_first(service):
+    service.add_product("Gaze", "", 0)
+    service.add_product("Luva", "", 0)
+    _backdated(service, [('a', 1, 'entrada', 10, 9), ('b', 1, 'saida', 2, 5), ('c', 2, 'entrada', 4, 5), ('d', 1, 'saida', 1, 1)])
+    today = date.today()
+
+    history = service.get_movement_history(1, today - timedelta(days=6), today)
+    assert [(m['type'], m['quantity']) for m in history] == [('saida', 1), ('saida', 2)]
+    assert history[0]['movement_date'] == datetime.combine(today - timedelta(days=1), time(12))
+    assert len(service.get_movement_history(1, today - timedelta(days=30), today, limit=2)) == 2
+    assert service.get_movement_history(1, today - timedelta(days=4), today - timedelta(days=2)) == []
+
+
+def test_movement_history_includes_archived_months(service):
+    service.add_product("Gaze", "", 0)
+    _backdated(service, [('a', 1, 'entrada', 10, 400), ('b', 1, 'saida', 3, 200), ('c', 1, 'saida', 1, 2)])
+    assert service.archive_movements(horizon_days=30) == 2
+    today = date.today()
+
+    history = service.get_movement_history(1, today - timedelta(days=500), today)
+    assert [m['quantity'] for m in history] == [1, 3, 10]
+    assert [m['quantity'] for m in service.get_movement_history(1, today - timedelta(days=250), today)] == [1, 3]
+
+
+def test_product_trend_fills_empty_periods(service):
+    service.add_product("Gaze", "", 0)
+    _backdated(service, [('a', 1, 'entrada', 10, 3), ('b', 1, 'saida', 2, 3), ('c', 1, 'saida', 5, 1)])
+    today = date.today()
+    start = today - timedelta(days=4)
+
+    trend = service.get_product_trend(1, start, today, 'day')
+    assert [t['period'] for t in trend] == [start + timedelta(days=i) for i in range(5)]
+    assert [(t['entradas'], t['saidas'], t['movements']) for t in trend] == [(0, 0, 0), (10, 2, 2), (0, 0, 0), (0, 5, 1), (0, 0, 0)]
+
+    monthly = service.get_product_trend(1, start, today, 'month')
+    assert sum(t['saidas'] for t in monthly) == 7
+    assert all(t['period'].day == 1 for t in monthly)
+    weekly = service.get_product_trend(1, start, today, 'week')
+    assert all(t['period'].weekday() == 0 for t in weekly)
+    with pytest.raises(ValueError):
+        service.get_product_trend(1, start, today, 'year')
+
+
+def test_consumption_report_sums_daily_totals(service):
+    service.add_product("Gaze", "", 0)
+    service.add_product("Luva", "", 0)
+    _backdated(service, [('a', 1, 'entrada', 10, 20), ('b', 1, 'saida', 2, 3), ('c', 2, 'entrada', 9, 3), ('d', 2, 'saida', 6, 2)])
+    today = date.today()
+
+    report = service.get_consumption_report(today - timedelta(days=7), today)
+    assert [(r['name'], r['entradas'], r['saidas'], r['movements']) for r in report] == [("Luva", 9, 6, 2), ("Gaze", 0, 2, 1)]
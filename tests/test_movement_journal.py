@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from inventory_service import ServiceUnavailableError
+from movement_journal import JOURNAL_CONFIG, JournalReplayer, MovementJournal
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = MovementJournal(str(tmp_path / "diario.db"))
+    yield journal
+    journal.close()
+
+
+def test_journal_keeps_pending_movements_across_restarts(tmp_path):
+    path = str(tmp_path / "diario.db")
+    journal = MovementJournal(path)
+    first = journal.append(1, 'entrada', 5)
+    second = journal.append(2, 'saida', 1)
+    journal.close()
+
+    journal = MovementJournal(path)
+    try:
+        pending = journal.pending(10)
+        assert [(e[0], e[1], e[2], e[3]) for e in pending] == [(first, 1, 'entrada', 5), (second, 2, 'saida', 1)]
+        assert journal.pending(1)[0][0] == first
+
+        journal.mark_done([first, second], [(second, "Quantidade insuficiente em estoque.")])
+        assert journal.stats() == {'pending': 0, 'applied': 1, 'conflict': 1}
+        assert [(c['client_movement_id'], c['reason']) for c in journal.conflicts()] == [(second, "Quantidade insuficiente em estoque.")]
+        journal.purge_applied()
+        journal.dismiss_conflicts([second])
+        assert journal.stats() == {'pending': 0, 'applied': 0, 'conflict': 0}
+    finally:
+        journal.close()
+
+
+def test_flush_applies_journal_and_reports_conflicts(service, journal):
+    service.add_product("Gaze", "", 0)
+    service.add_product("Luva", "", 0)
+    journal.append(1, 'entrada', 5)
+    refused = journal.append(2, 'saida', 3)
+    journal.append(1, 'saida', 2)
+    flushed, conflicts = [], []
+    replayer = JournalReplayer(
+        journal, service, on_flushed=lambda count, product_ids: flushed.append((count, product_ids)),
+        on_conflicts=conflicts.extend, config=dict(JOURNAL_CONFIG, batch_size=2)
+    )
+
+    assert replayer.flush() == 3
+    assert flushed == [(3, {1})]
+    assert [(c['client_movement_id'], c['reason']) for c in conflicts] == [(refused, "Quantidade insuficiente em estoque.")]
+    assert service.get_product(1)['current_quantity'] == 3
+    assert journal.stats() == {'pending': 0, 'applied': 0, 'conflict': 1}
+    assert replayer.flush() == 0
+
+
+class _FlakyService:
+    # Serviço com o banco fora do ar nas primeiras tentativas.
+    def __init__(self, service, failures):
+        self.service = service
+        self.failures = failures
+
+    def apply_journal_batch(self, entries):
+        if self.failures:
+            self.failures -= 1
+            raise ServiceUnavailableError("Erro ao conectar ao banco")
+        return self.service.apply_journal_batch(entries)
+
+
+def test_replayer_waits_for_the_database_and_loses_nothing(service, journal):
+    service.add_product("Gaze", "", 0)
+    journal.append(1, 'entrada', 4)
+    journal.append(1, 'entrada', 1)
+    offline, done = [], threading.Event()
+    replayer = JournalReplayer(
+        journal, _FlakyService(service, 2), on_flushed=lambda count, product_ids: done.set(),
+        on_offline=offline.append, config=dict(JOURNAL_CONFIG, retry_interval=0.01, flush_delay=0)
+    )
+    replayer.start()
+    try:
+        assert done.wait(5)
+    finally:
+        replayer.stop(5)
+
+    assert len(offline) == 1
+    assert replayer.online
+    assert service.get_product(1)['current_quantity'] == 5
+    assert journal.stats()['pending'] == 0
@@ -0,0 +1,95 @@
+import pytest
+
+import inventory_service
+from inventory_service import InventoryService, ProductSearchIndex
+
+
+def _index(*products):
+    index = ProductSearchIndex()
+    for product_id, name, description in products:
+        index.put({'id': product_id, 'name': name, 'description': description, 'current_quantity': 0, 'min_quantity': 0})
+    return index
+
+
+def _names(products):
+    return [p['name'] for p in products]
+
+
+def test_index_ranks_prefix_then_name_then_description():
+    index = _index(
+        (1, "Açúcar refinado", "pacote 1kg"),
+        (2, "Adoçante", "substituto do açúcar"),
+        (3, "Açúcar cristal", ""),
+        (4, "Melado de açúcar", ""),
+        (5, "Sal", "")
+    )
+    assert _names(index.search("acucar", 10)) == ["Açúcar cristal", "Açúcar refinado", "Melado de açúcar", "Adoçante"]
+    assert _names(index.search("AÇÚ", 10)) == ["Açúcar cristal", "Açúcar refinado", "Melado de açúcar", "Adoçante"]
+    assert _names(index.search("acucar r", 10)) == ["Açúcar refinado"]
+    assert _names(index.search("acucar", 2)) == ["Açúcar cristal", "Açúcar refinado"]
+    assert index.search("  ", 10) == []
+    assert index.search("farinha", 10) == []
+
+
+def test_index_follows_edits():
+    index = _index((1, "Luva de látex", "caixa"), (2, "Gaze", ""))
+    index.put({'id': 1, 'name': "Luva nitrílica", 'description': "caixa", 'current_quantity': 7, 'min_quantity': 0})
+
+    assert index.search("latex", 10) == []
+    assert index.search("nitril", 10) == [
+        {'id': 1, 'name': "Luva nitrílica", 'description': "caixa", 'current_quantity': 7, 'min_quantity': 0}
+    ]
+    assert _names(index.search("luva", 10)) == ["Luva nitrílica"]
+    assert len(index) == 2
+
+
+def test_index_survives_trigram_rebuild():
+    index = _index(*[(i, f"Produto {i}", "") for i in range(1, 11)])
+    for round_ in range(120):
+        index.put({'id': 1, 'name': f"Item {round_}", 'description': "", 'current_quantity': 0, 'min_quantity': 0})
+    assert _names(index.search("item 119", 10)) == ["Item 119"]
+    assert _names(index.search("produto 1", 10)) == ["Produto 10"]
+
+
+def test_service_search_uses_local_index_and_local_writes(service):
+    service.add_product("Gaze estéril", "compressa", 0)
+    service.add_product("Luva", "látex", 0)
+    assert _names(service.search_products("gaze")) == ["Gaze estéril"]
+
+    service.record_movement(2, 'entrada', 3)
+    service.save_product(None, "Gaze de algodão", "", 0)
+    service.save_product(2, "Luva nitrílica", "", 0)
+    assert _names(service.search_products("gaze")) == ["Gaze de algodão", "Gaze estéril"]
+    assert service.search_products("luva")[0]['current_quantity'] == 3
+    assert _names(service.search_products("compressa")) == ["Gaze estéril"]
+
+
+def test_service_search_falls_back_to_server_for_large_catalogs(service, monkeypatch):
+    monkeypatch.setitem(inventory_service.SEARCH_CONFIG, 'max_local_products', 1)
+    service.add_product("Gaze estéril", "compressa de algodão", 0)
+    service.add_product("Gaze 100%", "", 0)
+    service.add_product("Luva", "algodão", 0)
+
+    assert _names(service.search_products("gaze")) == ["Gaze 100%", "Gaze estéril"]
+    assert _names(service.search_products("gaze 100%")) == ["Gaze 100%"]
+    assert _names(service.search_products("algodão", 5)) == ["Gaze estéril", "Luva"]
+    assert service.search_index is None
+
+
+def test_refresh_brings_other_terminals_changes(tmp_path):
+    path = str(tmp_path / "estoque.db")
+    counter = InventoryService({'backend': 'sqlite', 'path': path})
+    counter.init_db()
+    office = InventoryService({'backend': 'sqlite', 'path': path})
+    try:
+        counter.add_product("Gaze", "", 0)
+        assert _names(counter.search_products("gaze")) == ["Gaze"]
+
+        office.add_product("Gaze de algodão", "", 0)
+        office.update_product(1, "Gaze estéril", "", 0)
+        assert _names(counter.search_products("gaze")) == ["Gaze"]
+        counter.refresh_search_index()
+        assert _names(counter.search_products("gaze")) == ["Gaze de algodão", "Gaze estéril"]
+    finally:
+        office.close()
+        counter.close()
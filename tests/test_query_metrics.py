@@ -0,0 +1,61 @@
+import logging
+import sys
+
+import pytest
+
+from inventory_service import QueryMetrics
+
+
+def test_queries_are_grouped_by_template():
+    metrics = QueryMetrics()
+    assert metrics.normalize("SELECT * FROM products WHERE id IN (%s, %s, %s)") == "SELECT * FROM products WHERE id IN (...)"
+    assert metrics.normalize("SELECT  name FROM products\n WHERE name = 'Gaze' LIMIT 10") == "SELECT name FROM products WHERE name = ? LIMIT ?"
+    assert metrics.normalize(
+        "UPDATE products SET q = CASE id WHEN %s THEN %s WHEN %s THEN %s END"
+    ) == "UPDATE products SET q = CASE id WHEN ... END"
+
+    for _ in range(3):
+        metrics.record("SELECT id FROM products WHERE id = %s", sys._getframe(), execute=0.002, rows=1)
+    metrics.record("SELECT id FROM products WHERE id = 7", sys._getframe(), execute=0.001, error=True)
+    stats = metrics.snapshot()["SELECT id FROM products WHERE id = ?"]
+    assert (stats['count'], stats['rows'], stats['errors']) == (4, 3, 1)
+    assert stats['sum']['execute'] == pytest.approx(0.007)
+
+
+def test_slow_queries_are_logged_with_caller(caplog):
+    metrics = QueryMetrics(slow_query_threshold=0.1)
+
+    def load_products():
+        metrics.record("SELECT * FROM products", sys._getframe(), connect=0.05, execute=0.2)
+
+    with caplog.at_level(logging.WARNING, logger="biosync"):
+        metrics.record("SELECT 1", sys._getframe(), execute=0.01)
+        load_products()
+    assert len(caplog.records) == 1
+    assert "load_products" in caplog.text and "SELECT * FROM products" in caplog.text
+
+
+def test_prometheus_rendering():
+    metrics = QueryMetrics()
+    metrics.record('SELECT "x" FROM t', sys._getframe(), execute=0.003, rows=2)
+    text = metrics.render_prometheus({'biosync_pool_in_use': 1})
+
+    labels = 'query="SELECT \\"x\\" FROM t",phase="execute"'
+    assert f'biosync_query_duration_seconds_bucket{{{labels},le="0.0025"}} 0' in text
+    assert f'biosync_query_duration_seconds_bucket{{{labels},le="0.005"}} 1' in text
+    assert f'biosync_query_duration_seconds_count{{{labels}}} 1' in text
+    assert 'biosync_query_rows_total{query="SELECT \\"x\\" FROM t"} 2' in text
+    assert text.endswith("biosync_pool_in_use 1\n")
+
+
+def test_service_records_its_queries(service):
+    service.add_product("Gaze", "", 0)
+    service.get_all_products()
+    with pytest.raises(Exception):
+        service._execute_query("SELECT nada FROM products")
+
+    snapshot = service.metrics.snapshot()
+    assert snapshot["SELECT id, name, description, current_quantity, min_quantity FROM products ORDER BY id"]['count'] == 1
+    assert snapshot["SELECT nada FROM products"]['errors'] == 1
+    text = service.render_metrics()
+    assert "biosync_pool_checkouts" in text and "biosync_product_cache_hits" in text